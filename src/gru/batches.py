@@ -0,0 +1,190 @@
+"""Message Batches: submit non-interactive Claude requests together."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import itertools
+import logging
+from collections.abc import AsyncIterator
+from types import SimpleNamespace
+from typing import Any
+
+import anthropic
+
+logger = logging.getLogger(__name__)
+
+# Batch results resent as ordinary requests instead of failing the turn
+RESUBMIT_RESULTS = {"expired", "canceled"}
+
+
+class BatchRequestError(Exception):
+    """A batched request ended without a message."""
+
+    def __init__(self, result_type: str, error_type: str | None = None, detail: str = "") -> None:
+        super().__init__(f"Batched request {result_type}" + (f": {detail}" if detail else ""))
+        self.result_type = result_type
+        self.error_type = error_type
+
+    @property
+    def resendable(self) -> bool:
+        """Whether sending the request again directly may succeed."""
+        if self.result_type in RESUBMIT_RESULTS:
+            return True
+        return self.result_type == "errored" and self.error_type != "invalid_request_error"
+
+
+class LocalBatches:
+    """Stand-in for the Message Batches endpoint that runs each request directly.
+
+    Implements the create/retrieve/results subset of ``messages.batches``
+    used by MessageBatcher on top of ``messages.create``, for tests and for
+    API proxies without batch support.
+    """
+
+    def __init__(self, messages: Any) -> None:
+        self._messages = messages
+        self._ids = itertools.count(1)
+        self._batches: dict[str, asyncio.Future[list[SimpleNamespace]]] = {}
+
+    async def _run(self, request: dict[str, Any]) -> SimpleNamespace:
+        try:
+            message = await self._messages.create(**request["params"])
+        except anthropic.APIError as e:
+            error_type = getattr(e, "type", None) or "api_error"  # Set from the error body on status errors
+            error = SimpleNamespace(type="error", error=SimpleNamespace(type=error_type, message=str(e)))
+            result = SimpleNamespace(type="errored", error=error)
+        else:
+            result = SimpleNamespace(type="succeeded", message=message)
+        return SimpleNamespace(custom_id=request["custom_id"], result=result)
+
+    def _status(self, batch_id: str) -> SimpleNamespace:
+        ended = self._batches[batch_id].done()
+        return SimpleNamespace(id=batch_id, processing_status="ended" if ended else "in_progress")
+
+    async def create(self, requests: list[dict[str, Any]]) -> SimpleNamespace:
+        """Start running a batch of requests."""
+        batch_id = f"local_batch_{next(self._ids)}"
+        self._batches[batch_id] = asyncio.gather(*(self._run(r) for r in requests))
+        return self._status(batch_id)
+
+    async def retrieve(self, batch_id: str) -> SimpleNamespace:
+        """Get a batch's processing status."""
+        return self._status(batch_id)
+
+    async def results(self, batch_id: str) -> AsyncIterator[SimpleNamespace]:
+        """Iterate over an ended batch's results, forgetting the batch."""
+        results = await self._batches.pop(batch_id)
+
+        async def iterate() -> AsyncIterator[SimpleNamespace]:
+            for result in results:
+                yield result
+
+        return iterate()
+
+
+class MessageBatcher:
+    """Collects requests into Message Batches and resolves each when its batch ends.
+
+    Requests are held for up to ``collect_seconds``, or until ``max_size``
+    have arrived, and submitted as one batch, which is then polled every
+    ``poll_interval`` seconds until it has ended. Batched requests cost half
+    as much and don't count against the interactive rate limits, but can
+    take minutes or hours, so this suits agents nobody is waiting on.
+    """
+
+    def __init__(
+        self,
+        batches: Any,
+        max_size: int = 100,
+        collect_seconds: float = 5.0,
+        poll_interval: float = 30.0,
+    ) -> None:
+        self.batches = batches
+        self.max_size = max_size
+        self.collect_seconds = collect_seconds
+        self.poll_interval = poll_interval
+        self._pending: dict[str, tuple[dict[str, Any], asyncio.Future[Any]]] = {}
+        self._ids = itertools.count(1)
+        self._flush_timer: asyncio.Task[None] | None = None
+        self._batch_tasks: set[asyncio.Task[None]] = set()
+
+    async def submit(self, params: dict[str, Any]) -> Any:
+        """Queue messages.create kwargs for the next batch and wait for the message."""
+        custom_id = f"req_{next(self._ids)}"
+        future: asyncio.Future[Any] = asyncio.get_running_loop().create_future()
+        self._pending[custom_id] = (params, future)
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.create_task(self._flush_later())
+        try:
+            return await future
+        finally:
+            # A cancelled caller's request is dropped if it hasn't been sent yet
+            self._pending.pop(custom_id, None)
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.collect_seconds)
+        self._flush_timer = None
+        self._flush()
+
+    def _flush(self) -> None:
+        """Submit everything collected so far as one batch."""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+        self._flush_timer = None
+        requests, self._pending = self._pending, {}
+        if requests:
+            task = asyncio.create_task(self._run_batch(requests))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, requests: dict[str, tuple[dict[str, Any], asyncio.Future[Any]]]) -> None:
+        futures = {custom_id: future for custom_id, (_, future) in requests.items()}
+        try:
+            batch = await self.batches.create(
+                requests=[{"custom_id": custom_id, "params": params} for custom_id, (params, _) in requests.items()]
+            )
+            logger.info(f"Submitted message batch {batch.id} with {len(requests)} request(s)")
+            while batch.processing_status != "ended":
+                await asyncio.sleep(self.poll_interval)
+                batch = await self.batches.retrieve(batch.id)
+            async for entry in await self.batches.results(batch.id):
+                future = futures.pop(entry.custom_id, None)
+                if future is None or future.done():
+                    continue
+                result = entry.result
+                if result.type == "succeeded":
+                    future.set_result(result.message)
+                else:
+                    error = getattr(getattr(result, "error", None), "error", None)
+                    future.set_exception(
+                        BatchRequestError(result.type, getattr(error, "type", None), getattr(error, "message", ""))
+                    )
+        except asyncio.CancelledError:
+            for future in futures.values():
+                future.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"Message batch failed: {e}")
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future in futures.values():
+            if not future.done():
+                future.set_exception(BatchRequestError("missing"))
+
+    async def close(self) -> None:
+        """Stop collecting and polling; waiting requests are cancelled."""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        for _, future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        for task in list(self._batch_tasks):
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
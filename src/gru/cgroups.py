@@ -0,0 +1,165 @@
+"""cgroup v2 resource limits for agent processes."""
+
+from __future__ import annotations
+
+import contextlib
+import re
+import shlex
+import time
+from pathlib import Path
+from typing import Any
+
+CPU_PERIOD_US = 100000  # cpu.max period; quota is a share of this per period
+CONTROLLERS = ("cpu", "memory")
+MEMORY_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+REMOVE_TIMEOUT = 1.0  # seconds to wait for killed processes to leave the cgroup
+
+
+def parse_memory_limit(value: str) -> str:
+    """Convert a limit like '512M' or '2G' into a memory.max value in bytes.
+
+    Raises:
+        ValueError: If the limit is not a number with an optional K/M/G/T suffix
+    """
+    value = value.strip()
+    if value.lower() in ("", "max"):
+        return "max"
+    match = re.fullmatch(r"(\d+)\s*([KMGT]?)B?", value.upper())
+    if not match:
+        raise ValueError(f"Invalid memory limit: {value}")
+    return str(int(match.group(1)) * MEMORY_UNITS[match.group(2)])
+
+
+def cpu_max(quota_percent: int | None) -> str:
+    """Convert a CPU quota in percent of one core into a cpu.max value."""
+    if not quota_percent or quota_percent <= 0:
+        return f"max {CPU_PERIOD_US}"
+    return f"{quota_percent * CPU_PERIOD_US // 100} {CPU_PERIOD_US}"
+
+
+def _enable_controllers(path: Path) -> None:
+    """Enable the cpu and memory controllers for children of a cgroup."""
+    available = (path / "cgroup.controllers").read_text().split()
+    wanted = " ".join(f"+{c}" for c in CONTROLLERS if c in available)
+    if wanted:
+        (path / "cgroup.subtree_control").write_text(wanted)
+
+
+def create_agent_cgroup(base: Path, agent_id: str, memory_limit: str, cpu_quota: int | None) -> Path:
+    """Create a cgroup for an agent under base and apply its limits.
+
+    base is created if needed; its parent must be a cgroup v2 directory that
+    gru is allowed to manage (the unified root, or a delegated subtree).
+
+    Returns:
+        Path of the agent's cgroup
+
+    Raises:
+        RuntimeError: If cgroup v2 is unavailable or the cgroup cannot be set up
+    """
+    if not (base.parent / "cgroup.controllers").exists():
+        raise RuntimeError(f"cgroup v2 not available at {base.parent}")
+
+    try:
+        if not base.exists():
+            # Best effort: the parent may already delegate these controllers
+            with contextlib.suppress(OSError):
+                _enable_controllers(base.parent)
+            base.mkdir()
+        missing = set(CONTROLLERS) - set((base / "cgroup.controllers").read_text().split())
+        if missing:
+            raise RuntimeError(f"cgroup controllers not delegated to {base}: {', '.join(sorted(missing))}")
+        _enable_controllers(base)
+
+        path = base / f"agent-{agent_id}"
+        path.mkdir(exist_ok=True)
+        (path / "memory.max").write_text(parse_memory_limit(memory_limit))
+        (path / "cpu.max").write_text(cpu_max(cpu_quota))
+        return path
+    except (OSError, ValueError) as e:
+        raise RuntimeError(f"Failed to create cgroup for agent {agent_id}: {e}") from e
+
+
+def wrap_command(cgroup: Path, command: str) -> str:
+    """Prefix a shell command so the shell joins the cgroup before running it.
+
+    Writing 0 to cgroup.procs moves the writing process, so the shell and
+    everything it starts are limited from the first instruction on.
+    """
+    procs = shlex.quote(str(cgroup / "cgroup.procs"))
+    return f"echo 0 > {procs} || exit 125\n{command}"
+
+
+def _read_int(path: Path) -> int | None:
+    """Read a single integer from a cgroup file, or None for 'max'/missing files."""
+    try:
+        value = path.read_text().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+
+def _read_keyed(path: Path) -> dict[str, int]:
+    """Read a flat keyed cgroup file such as cpu.stat or memory.events."""
+    try:
+        lines = path.read_text().splitlines()
+    except OSError:
+        return {}
+    stats = {}
+    for line in lines:
+        key, _, value = line.partition(" ")
+        if value.strip().isdigit():
+            stats[key] = int(value)
+    return stats
+
+
+def read_usage(cgroup: Path) -> dict[str, Any] | None:
+    """Read current memory and CPU usage of a cgroup, or None if it is gone."""
+    if not cgroup.is_dir():
+        return None
+    return {
+        "memory_current": _read_int(cgroup / "memory.current") or 0,
+        "memory_peak": _read_int(cgroup / "memory.peak"),
+        "memory_max": _read_int(cgroup / "memory.max"),
+        "cpu_usage_usec": _read_keyed(cgroup / "cpu.stat").get("usage_usec", 0),
+        "oom_kills": _read_keyed(cgroup / "memory.events").get("oom_kill", 0),
+    }
+
+
+def format_resources(usage: dict[str, Any]) -> str:
+    """Format cgroup usage for status messages."""
+
+    def mb(value: int) -> str:
+        return f"{value / 1024**2:.1f}MB"
+
+    memory = mb(usage["memory_current"])
+    if usage.get("memory_peak"):
+        memory += f" (peak {mb(usage['memory_peak'])})"
+    if usage.get("memory_max"):
+        memory += f" / {mb(usage['memory_max'])}"
+    text = f"mem {memory}, CPU {usage['cpu_usage_usec'] / 1_000_000:.1f}s"
+    if usage.get("oom_kills"):
+        text += f", OOM kills: {usage['oom_kills']}"
+    return text
+
+
+def remove_agent_cgroup(cgroup: Path) -> bool:
+    """Kill any processes left in an agent's cgroup and remove it.
+
+    Returns:
+        True if the cgroup was removed (or already gone), False otherwise
+    """
+    if not cgroup.exists():
+        return True
+    try:
+        if (cgroup / "cgroup.kill").exists():
+            (cgroup / "cgroup.kill").write_text("1")
+        deadline = time.monotonic() + REMOVE_TIMEOUT
+        while (cgroup / "cgroup.procs").exists() and (cgroup / "cgroup.procs").read_text().strip():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        cgroup.rmdir()
+        return True
+    except OSError:
+        return False
@@ -5,14 +5,21 @@ from __future__ import annotations
 import asyncio
 import logging
 import random
-from collections.abc import AsyncIterator
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable, Iterator
 from dataclasses import dataclass
 from typing import TYPE_CHECKING, Any
 
 import anthropic
 
+from gru.batches import BatchRequestError, LocalBatches, MessageBatcher
+from gru.context import estimate_tokens
+from gru.ratelimit import RateGovernor, retry_after
+
 if TYPE_CHECKING:
+    import httpx
+
     from gru.config import Config
+    from gru.mcp import MCPClient
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +27,11 @@ logger = logging.getLogger(__name__)
 MAX_RETRIES = 3
 BASE_DELAY = 1.0  # seconds
 MAX_DELAY = 60.0  # seconds
+RATE_LIMIT_MAX_WAITS = 10  # 429s a request waits out before the error is raised
+OUTPUT_TOKEN_ESTIMATE = 1024  # output tokens reserved per request until the real count is known
+
+# Prompt caching breakpoint (5-minute ephemeral cache)
+CACHE_CONTROL = {"type": "ephemeral"}
 
 # Retryable exceptions
 RETRYABLE_EXCEPTIONS = (
@@ -29,6 +41,29 @@ RETRYABLE_EXCEPTIONS = (
 )
 
 
+class StreamInterruptedError(Exception):
+    """A streamed turn failed after some of its tool_use blocks were dispatched.
+
+    Carries what the stream delivered before it failed: the dispatched tool
+    uses, the text streamed so far and the usage reported so far (zero for
+    anything the stream never reported).
+    """
+
+    def __init__(
+        self, dispatched: list[ToolUse], cause: Exception, text: str = "", usage: dict[str, int] | None = None
+    ) -> None:
+        super().__init__(f"Stream interrupted after tool dispatch: {cause}")
+        self.dispatched = dispatched
+        self.text = text
+        self.usage = {
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cache_read_input_tokens": 0,
+            "cache_creation_input_tokens": 0,
+            **(usage or {}),
+        }
+
+
 @dataclass
 class ToolDefinition:
     """Definition of a tool available to Claude."""
@@ -38,6 +73,64 @@ class ToolDefinition:
     input_schema: dict[str, Any]
 
 
+class ToolSet:
+    """A fixed list of tools whose request payload is built once.
+
+    The payload is shared by every request that uses the set, so it must
+    not be mutated.
+    """
+
+    def __init__(self, tools: Iterable[ToolDefinition]) -> None:
+        self.tools = tuple(tools)
+        self.names = frozenset(t.name for t in self.tools)
+        self._payloads: dict[bool, list[dict[str, Any]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.tools)
+
+    def __iter__(self) -> Iterator[ToolDefinition]:
+        return iter(self.tools)
+
+    def payload(self, cache_breakpoint: bool) -> list[dict[str, Any]]:
+        """Tool dicts for messages.create, optionally with a cache breakpoint on the last one."""
+        payload = self._payloads.get(cache_breakpoint)
+        if payload is None:
+            payload = [
+                {"name": t.name, "description": t.description, "input_schema": t.input_schema} for t in self.tools
+            ]
+            if cache_breakpoint and payload:
+                payload[-1] = {**payload[-1], "cache_control": CACHE_CONTROL}
+            self._payloads[cache_breakpoint] = payload
+        return payload
+
+
+class ToolRegistry:
+    """Built-in and MCP tools, with a ToolSet cached per tool subset.
+
+    Cached sets are dropped when the MCP client's tools_version changes,
+    i.e. when a server starts or restarts, so every other turn reuses the
+    same serialized payload.
+    """
+
+    def __init__(self, builtin: list[ToolDefinition], mcp: MCPClient) -> None:
+        self.builtin = builtin
+        self.mcp = mcp
+        self._version: int | None = None
+        self._sets: dict[frozenset[str] | None, ToolSet] = {}
+
+    def tool_set(self, names: frozenset[str] | None = None) -> ToolSet:
+        """The tools in names, or all tools if None, in registry order."""
+        if self._version != self.mcp.tools_version:
+            self._sets.clear()
+            self._version = self.mcp.tools_version
+        tool_set = self._sets.get(names)
+        if tool_set is None:
+            tools = [*self.builtin, *self.mcp.get_all_tools()]
+            tool_set = ToolSet(t for t in tools if names is None or t.name in names)
+            self._sets[names] = tool_set
+        return tool_set
+
+
 @dataclass
 class ToolUse:
     """A tool use request from Claude."""
@@ -117,70 +210,195 @@ async def retry_with_backoff(
         raise last_exception
 
 
+def _usage_dict(usage: Any) -> dict[str, int]:
+    """Extract token counts, including prompt-cache reads and writes."""
+    return {
+        "input_tokens": usage.input_tokens,
+        "output_tokens": usage.output_tokens,
+        "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", None) or 0,
+        "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0,
+    }
+
+
+def _with_message_breakpoint(messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Return messages with a cache breakpoint on the final content block."""
+    if not messages:
+        return messages
+    last = messages[-1]
+    content = last.get("content")
+    if isinstance(content, str):
+        if not content:
+            return messages
+        blocks: list[Any] = [{"type": "text", "text": content}]
+    elif isinstance(content, list) and content and isinstance(content[-1], dict):
+        blocks = list(content)
+    else:
+        return messages
+    blocks[-1] = {**blocks[-1], "cache_control": CACHE_CONTROL}
+    return messages[:-1] + [{**last, "content": blocks}]
+
+
+def _to_response(message: Any) -> Response:
+    """Convert an API message into a Response."""
+    content = ""
+    tool_uses = []
+    for block in message.content:
+        if block.type == "text":
+            content += block.text
+        elif block.type == "tool_use":
+            tool_uses.append(ToolUse(id=block.id, name=block.name, input=block.input))
+
+    return Response(
+        content=content,
+        tool_uses=tool_uses,
+        stop_reason=message.stop_reason,
+        usage=_usage_dict(message.usage),
+    )
+
+
 class ClaudeClient:
-    """Async client for Claude API."""
+    """Async client for Claude API.
+
+    Every request goes through a RateGovernor shared by all agents, which
+    waits for per-minute request and token capacity (learned from response
+    headers) and waits out 429s, so agents queue by priority instead of
+    failing or retrying in lockstep.
+
+    Requests sent with ``batch=True`` bypass the governor and are collected
+    into Message Batches instead (see MessageBatcher).
+    """
 
     def __init__(self, config: Config) -> None:
         self.config = config
-        self._client = anthropic.AsyncAnthropic(api_key=config.anthropic_api_key)
+        self.governor = RateGovernor(
+            config.rate_limit_requests_per_minute,
+            config.rate_limit_input_tokens_per_minute,
+            config.rate_limit_output_tokens_per_minute,
+        )
+        self._client = anthropic.AsyncAnthropic(
+            api_key=config.anthropic_api_key,
+            http_client=anthropic.DefaultAsyncHttpxClient(event_hooks={"response": [self._observe_response]}),
+        )
+        self.batcher = MessageBatcher(
+            LocalBatches(self._client.messages) if config.batch_backend == "local" else self._client.messages.batches,
+            max_size=config.batch_max_size,
+            collect_seconds=config.batch_collect_seconds,
+            poll_interval=config.batch_poll_interval,
+        )
 
-    async def send_message(
-        self,
-        messages: list[dict[str, Any]],
-        system: str | None = None,
-        model: str | None = None,
-        max_tokens: int | None = None,
-        tools: list[ToolDefinition] | None = None,
+    async def _observe_response(self, response: httpx.Response) -> None:
+        """Feed every API response's rate-limit headers to the governor.
+
+        This also sees the 429s the SDK retries by itself, so other agents
+        hold off while it does.
+        """
+        self.governor.observe(response.headers)
+        if response.status_code == 429 and (wait := retry_after(response.headers)) is not None:
+            await self.governor.pause(wait)
+
+    def _estimate_tokens(self, kwargs: dict[str, Any]) -> tuple[int, int]:
+        """Estimate the input and output tokens a request will be charged for.
+
+        With prompt caching, earlier turns are read from the cache, which
+        doesn't count against the input limit, so only the newest exchange
+        is counted. settle() corrects the estimate either way.
+        """
+        messages = kwargs["messages"]
+        counted = messages[-2:] if self.config.prompt_caching else messages
+        input_tokens = sum(estimate_tokens(m) for m in counted)
+        if not self.config.prompt_caching:
+            input_tokens += estimate_tokens({"content": kwargs.get("system", "")})
+            input_tokens += estimate_tokens({"content": kwargs.get("tools", [])})
+        return input_tokens, min(kwargs["max_tokens"], OUTPUT_TOKEN_ESTIMATE)
+
+    async def _governed(
+        self, request: Callable[[], Awaitable[Response]], kwargs: dict[str, Any], priority: str
     ) -> Response:
-        """Send a message to Claude and get a response."""
-        model = model or self.config.default_model
-        max_tokens = max_tokens or self.config.max_tokens
+        """Run a request once the governor has capacity for it, waiting out 429s."""
+        input_tokens, output_tokens = self._estimate_tokens(kwargs)
+        waits = 0
+        while True:
+            reservation = await self.governor.acquire(input_tokens, output_tokens, priority)
+            try:
+                response = await request()
+            except anthropic.RateLimitError as e:
+                await self.governor.release(reservation)
+                if waits == RATE_LIMIT_MAX_WAITS:
+                    raise
+                wait = retry_after(e.response.headers)
+                await self.governor.pause(wait if wait is not None else min(BASE_DELAY * 2**waits, MAX_DELAY))
+                waits += 1
+                continue
+            except BaseException:
+                await self.governor.release(reservation)
+                raise
+            await self.governor.settle(reservation, response.usage)
+            return response
 
+    def _build_request(
+        self,
+        messages: list[dict[str, Any]],
+        system: str | None,
+        model: str | None,
+        max_tokens: int | None,
+        tools: list[ToolDefinition] | ToolSet | None,
+    ) -> dict[str, Any]:
+        """Build messages.create kwargs, adding prompt-cache breakpoints if enabled.
+
+        Breakpoints go on the last tool, the system prompt and the final block
+        of the conversation, so each turn re-reads the prefix written by the
+        previous one. The caller's message list is never mutated. Tools are
+        sent as their ToolSet's cached payload; pass a ToolSet rather than a
+        list to avoid re-serializing them on every request.
+        """
+        caching = self.config.prompt_caching
         kwargs: dict[str, Any] = {
-            "model": model,
-            "max_tokens": max_tokens,
-            "messages": messages,
+            "model": model or self.config.default_model,
+            "max_tokens": max_tokens or self.config.max_tokens,
+            "messages": _with_message_breakpoint(messages) if caching else messages,
         }
 
         if system:
-            kwargs["system"] = system
+            if caching:
+                kwargs["system"] = [{"type": "text", "text": system, "cache_control": CACHE_CONTROL}]
+            else:
+                kwargs["system"] = system
 
         if tools:
-            kwargs["tools"] = [
-                {
-                    "name": t.name,
-                    "description": t.description,
-                    "input_schema": t.input_schema,
-                }
-                for t in tools
-            ]
+            tool_set = tools if isinstance(tools, ToolSet) else ToolSet(tools)
+            kwargs["tools"] = tool_set.payload(caching)
 
-        response = await retry_with_backoff(self._client.messages.create, **kwargs)
-
-        content = ""
-        tool_uses = []
-
-        for block in response.content:
-            if block.type == "text":
-                content += block.text
-            elif block.type == "tool_use":
-                tool_uses.append(
-                    ToolUse(
-                        id=block.id,
-                        name=block.name,
-                        input=block.input,
-                    )
-                )
+        return kwargs
 
-        return Response(
-            content=content,
-            tool_uses=tool_uses,
-            stop_reason=response.stop_reason,
-            usage={
-                "input_tokens": response.usage.input_tokens,
-                "output_tokens": response.usage.output_tokens,
-            },
-        )
+    async def send_message(
+        self,
+        messages: list[dict[str, Any]],
+        system: str | None = None,
+        model: str | None = None,
+        max_tokens: int | None = None,
+        tools: list[ToolDefinition] | ToolSet | None = None,
+        priority: str = "normal",
+        batch: bool = False,
+    ) -> Response:
+        """Send a message to Claude and get a response.
+
+        With batch, the request goes into the next Message Batch and this
+        waits until the batch has ended. A request that expires or fails
+        for a reason other than being invalid is resent directly.
+        """
+        kwargs = self._build_request(messages, system, model, max_tokens, tools)
+        if batch:
+            try:
+                return _to_response(await self.batcher.submit(kwargs))
+            except BatchRequestError as e:
+                if not e.resendable:
+                    raise
+                logger.warning(f"{e}; sending it directly")
+
+        async def request() -> Response:
+            return _to_response(await self._client.messages.create(**kwargs))
+
+        return await retry_with_backoff(self._governed, request, kwargs, priority)
 
     async def stream_message(
         self,
@@ -188,34 +406,97 @@ class ClaudeClient:
         system: str | None = None,
         model: str | None = None,
         max_tokens: int | None = None,
-        tools: list[ToolDefinition] | None = None,
+        tools: list[ToolDefinition] | ToolSet | None = None,
+        priority: str = "normal",
     ) -> AsyncIterator[str]:
         """Stream a message response from Claude."""
-        model = model or self.config.default_model
-        max_tokens = max_tokens or self.config.max_tokens
-
-        kwargs: dict[str, Any] = {
-            "model": model,
-            "max_tokens": max_tokens,
-            "messages": messages,
-        }
+        kwargs = self._build_request(messages, system, model, max_tokens, tools)
+        reservation = await self.governor.acquire(*self._estimate_tokens(kwargs), priority)
+        usage: dict[str, int] | None = None
+        try:
+            async with self._client.messages.stream(**kwargs) as stream:
+                async for text in stream.text_stream:
+                    yield text
+                usage = _usage_dict((await stream.get_final_message()).usage)
+        finally:
+            if usage is not None:
+                await self.governor.settle(reservation, usage)
+            else:
+                await self.governor.release(reservation)
+
+    async def stream_turn(
+        self,
+        messages: list[dict[str, Any]],
+        system: str | None = None,
+        model: str | None = None,
+        max_tokens: int | None = None,
+        tools: list[ToolDefinition] | ToolSet | None = None,
+        on_text: Callable[[str], Awaitable[None]] | None = None,
+        on_tool_use: Callable[[ToolUse], Awaitable[None]] | None = None,
+        on_retry: Callable[[], Awaitable[None]] | None = None,
+        priority: str = "normal",
+    ) -> Response:
+        """Stream a turn, reporting text deltas and each tool_use block as it completes.
+
+        Returns the same Response as send_message once the stream ends. A
+        failed stream is only retried if no tool_use has been handed to
+        on_tool_use yet, so tools are never dispatched twice; otherwise
+        StreamInterruptedError is raised. on_retry is awaited before each
+        retry so callers can discard text from the failed attempt.
+        """
+        kwargs = self._build_request(messages, system, model, max_tokens, tools)
+        dispatched: list[ToolUse] = []
+        partial: dict[str, Any] = {}
+        attempts = 0
+
+        async def handle_tool_use(tool_use: ToolUse) -> None:
+            dispatched.append(tool_use)
+            if on_tool_use:
+                await on_tool_use(tool_use)
+
+        async def attempt() -> Response:
+            nonlocal attempts
+            if attempts and on_retry:
+                await on_retry()
+            attempts += 1
+            partial.clear()
+            try:
+                return await self._governed(
+                    lambda: self._stream_once(kwargs, on_text, handle_tool_use, partial), kwargs, priority
+                )
+            except RETRYABLE_EXCEPTIONS as e:
+                if dispatched:
+                    raise StreamInterruptedError(dispatched, e, partial.get("text", ""), partial.get("usage")) from e
+                raise
 
-        if system:
-            kwargs["system"] = system
+        return await retry_with_backoff(attempt)
 
-        if tools:
-            kwargs["tools"] = [
-                {
-                    "name": t.name,
-                    "description": t.description,
-                    "input_schema": t.input_schema,
-                }
-                for t in tools
-            ]
+    async def _stream_once(
+        self,
+        kwargs: dict[str, Any],
+        on_text: Callable[[str], Awaitable[None]] | None,
+        on_tool_use: Callable[[ToolUse], Awaitable[None]],
+        partial: dict[str, Any],
+    ) -> Response:
+        """Run one streaming request and assemble the final Response.
 
+        The text and usage seen so far are kept in ``partial``, for the
+        caller to use if the stream fails part way.
+        """
         async with self._client.messages.stream(**kwargs) as stream:
-            async for text in stream.text_stream:
-                yield text
+            async for event in stream:
+                if event.type == "message_start":
+                    partial["usage"] = _usage_dict(event.message.usage)
+                elif event.type == "message_delta" and "usage" in partial:
+                    partial["usage"]["output_tokens"] = event.usage.output_tokens
+                elif event.type == "text":
+                    partial["text"] = partial.get("text", "") + event.text
+                    if on_text:
+                        await on_text(event.text)
+                elif event.type == "content_block_stop" and event.content_block.type == "tool_use":
+                    block = event.content_block
+                    await on_tool_use(ToolUse(id=block.id, name=block.name, input=block.input))
+            return _to_response(await stream.get_final_message())
 
     async def send_with_tool_results(
         self,
@@ -224,7 +505,8 @@ class ClaudeClient:
         system: str | None = None,
         model: str | None = None,
         max_tokens: int | None = None,
-        tools: list[ToolDefinition] | None = None,
+        tools: list[ToolDefinition] | ToolSet | None = None,
+        priority: str = "normal",
     ) -> Response:
         """Send tool results back to Claude."""
         # Add tool results to messages
@@ -247,6 +529,7 @@ class ClaudeClient:
             model=model,
             max_tokens=max_tokens,
             tools=tools,
+            priority=priority,
         )
 
 
@@ -360,9 +643,26 @@ DEFAULT_TOOLS = [
             "required": ["to_agent", "message"],
         },
     ),
+    ToolDefinition(
+        name="wait_for_messages",
+        description=(
+            "Wait for messages from other agents, e.g. the reply to a request or handoff. "
+            "Returns as soon as a message arrives."
+        ),
+        input_schema={
+            "type": "object",
+            "properties": {
+                "timeout_seconds": {
+                    "type": "integer",
+                    "description": "Maximum seconds to wait",
+                    "default": 60,
+                },
+            },
+        },
+    ),
     ToolDefinition(
         name="get_shared_context",
-        description="Get shared context values for the current task.",
+        description="Get shared context values for the current task. A single key is returned with its version.",
         input_schema={
             "type": "object",
             "properties": {
@@ -387,8 +687,39 @@ DEFAULT_TOOLS = [
                     "type": "string",
                     "description": "Value to store (will be JSON encoded)",
                 },
+                "expected_version": {
+                    "type": "integer",
+                    "description": (
+                        "Only set if the key is still at this version (from get_shared_context; 0 = key must not "
+                        "exist yet). Use to update shared values without overwriting another agent's change."
+                    ),
+                },
             },
             "required": ["key", "value"],
         },
     ),
+    ToolDefinition(
+        name="wait_for_shared_context",
+        description="Wait until another agent sets a shared context key. Returns as soon as it changes.",
+        input_schema={
+            "type": "object",
+            "properties": {
+                "key": {
+                    "type": "string",
+                    "description": "Key to wait for",
+                },
+                "after_version": {
+                    "type": "integer",
+                    "description": "Return once the key is past this version (0 = as soon as it exists)",
+                    "default": 0,
+                },
+                "timeout_seconds": {
+                    "type": "integer",
+                    "description": "Maximum seconds to wait",
+                    "default": 60,
+                },
+            },
+            "required": ["key"],
+        },
+    ),
 ]
@@ -10,6 +10,7 @@ from pathlib import Path
 
 import click
 
+from gru.cgroups import format_resources
 from gru.config import Config
 from gru.crypto import CryptoManager, SecretStore
 from gru.db import Database
@@ -73,6 +74,8 @@ def cli(ctx: click.Context, data_dir: str | None) -> None:
 @click.option("--priority", type=click.Choice(["high", "normal", "low"]), default="normal")
 @click.option("--model", "-m", help="Model to use")
 @click.option("--deadline", help="Deadline (e.g., '2h', '30m')")
+@click.option("--bash-timeout", type=int, help="Seconds before a bash command is killed")
+@click.option("--tools", help="Comma-separated tools the agent may use (default: all)")
 @click.pass_context
 def spawn(
     ctx: click.Context,
@@ -82,6 +85,8 @@ def spawn(
     priority: str,
     model: str | None,
     deadline: str | None,
+    bash_timeout: int | None,
+    tools: str | None,
 ) -> None:
     """Start a new agent with the given task."""
     orchestrator = get_orchestrator(ctx)
@@ -94,6 +99,8 @@ def spawn(
             supervised=supervised,
             priority=priority,
             deadline=deadline,
+            bash_timeout=bash_timeout,
+            tools=[t.strip() for t in tools.split(",") if t.strip()] if tools else None,
         )
     )
 
@@ -126,6 +133,8 @@ def status(ctx: click.Context, agent_id: str | None) -> None:
             click.echo(f"Started: {agent['started_at']}")
         if agent.get("completed_at"):
             click.echo(f"Completed: {agent['completed_at']}")
+        if agent.get("resources"):
+            click.echo(f"Resources: {format_resources(agent['resources'])}")
         if agent.get("error"):
             click.echo(f"Error: {agent['error']}")
     else:
@@ -227,13 +236,13 @@ def nudge(ctx: click.Context, agent_id: str, message: str) -> None:
 def logs(ctx: click.Context, agent_id: str, tail: int) -> None:
     """Show agent conversation logs."""
     db = ctx.obj["db"]
-    conversation = run_async(db.get_conversation(agent_id))
+    conversation = run_async(db.get_conversation(agent_id, limit=tail))
 
     if not conversation:
         click.echo(f"No logs found for agent {agent_id}")
         return
 
-    for msg in conversation[-tail:]:
+    for msg in conversation:
         content = msg["content"]
         if isinstance(content, list):
             content = json.dumps(content, indent=2)
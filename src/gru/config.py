@@ -35,6 +35,20 @@ class Config:
     anthropic_api_key: str = ""
     default_model: str = "claude-sonnet-4-20250514"
     max_tokens: int = 8192
+    prompt_caching: bool = True  # Add cache_control breakpoints to system, tools and history
+    stream_turns: bool = True  # Stream agent turns and start tools as soon as their blocks complete
+    fast_model: str = ""  # Model for routine tool follow-up turns (empty = every turn uses the agent's model)
+    # Client-side rate limits shared by all agents (0 = learn from API response headers)
+    rate_limit_requests_per_minute: int = 0
+    rate_limit_input_tokens_per_minute: int = 0
+    rate_limit_output_tokens_per_minute: int = 0
+    # Message Batches for low-priority and oneshot agents
+    batch_mode: bool = False
+    batch_backend: str = "api"  # "api" or "local" (runs each batched request directly, for testing)
+    batch_max_agents: int = 50  # batched agents running alongside max_concurrent_agents
+    batch_max_size: int = 100  # requests per batch
+    batch_collect_seconds: float = 5.0  # how long requests are collected before a batch is submitted
+    batch_poll_interval: float = 30.0  # seconds between batch status checks
 
     # Agent defaults
     default_timeout: int = 300  # seconds per approval
@@ -47,16 +61,32 @@ class Config:
     max_agent_runtime: int = 3600  # seconds (1 hour)
     max_agent_turns: int = 100  # max Claude API calls per agent
     max_conversation_messages: int = 50  # max messages before truncation
+    context_token_budget: int = 100000  # estimated input tokens of history sent per turn
+    context_summary: bool = False  # Replace truncated turns with a short summary of what they did
     max_tool_output: int = 50000  # max chars per tool output (~12k tokens)
+    bash_timeout: int = 60  # default seconds before a bash command's process group is killed
+
+    # Database group commit (batch hot-path writes into fewer transactions)
+    db_group_commit: bool = False
+    db_commit_interval_ms: int = 50  # max delay before a batched write is committed
+    db_commit_max_statements: int = 100  # commit early once this many writes are pending
+    db_read_connections: int = 2  # read-only connections serving SELECTs alongside the writer
+    index_conversations: bool = False  # Full-text index conversation history for search
+
+    # Retention (0 days = keep everything)
+    retention_days: int = 0  # archive transcripts and prune coordination rows of agents finished this long ago
+    retention_interval: int = 3600  # seconds between retention passes
 
     # Scheduler
-    scheduler_interval: float = 0.1  # seconds
-    starvation_threshold: int = 10  # promotions before boost
+    scheduler_interval: float = 0.1  # seconds per starvation cycle
+    starvation_threshold: int = 10  # cycles waited before a task is promoted
+    recover_tasks: bool = False  # Re-queue unfinished tasks from the database on startup
 
     # Resource limits (cgroups)
     enable_cgroups: bool = False
     default_memory_limit: str = "512M"
     default_cpu_quota: int = 50  # percent
+    cgroup_root: Path = field(default_factory=lambda: Path("/sys/fs/cgroup/gru"))  # Parent of per-agent cgroups
 
     # Git worktrees (agent isolation)
     enable_worktrees: bool = True  # Auto-create worktrees when workdir is a git repo
@@ -122,12 +152,28 @@ class Config:
             anthropic_api_key=os.getenv("ANTHROPIC_API_KEY", ""),
             default_model=os.getenv("GRU_DEFAULT_MODEL", "claude-sonnet-4-20250514"),
             max_tokens=int(os.getenv("GRU_MAX_TOKENS", "8192")),
+            prompt_caching=os.getenv("GRU_PROMPT_CACHING", "true").lower() == "true",
+            stream_turns=os.getenv("GRU_STREAM_TURNS", "true").lower() == "true",
+            fast_model=os.getenv("GRU_FAST_MODEL", ""),
+            rate_limit_requests_per_minute=int(os.getenv("GRU_RATE_LIMIT_RPM", "0")),
+            rate_limit_input_tokens_per_minute=int(os.getenv("GRU_RATE_LIMIT_INPUT_TPM", "0")),
+            rate_limit_output_tokens_per_minute=int(os.getenv("GRU_RATE_LIMIT_OUTPUT_TPM", "0")),
+            batch_mode=os.getenv("GRU_BATCH_MODE", "false").lower() == "true",
+            batch_backend=os.getenv("GRU_BATCH_BACKEND", "api"),
+            batch_max_agents=int(os.getenv("GRU_BATCH_MAX_AGENTS", "50")),
+            batch_max_size=int(os.getenv("GRU_BATCH_MAX_SIZE", "100")),
+            batch_collect_seconds=float(os.getenv("GRU_BATCH_COLLECT_SECONDS", "5")),
+            batch_poll_interval=float(os.getenv("GRU_BATCH_POLL_INTERVAL", "30")),
             default_timeout=int(os.getenv("GRU_DEFAULT_TIMEOUT", "300")),
+            bash_timeout=int(os.getenv("GRU_BASH_TIMEOUT", "60")),
+            context_token_budget=int(os.getenv("GRU_CONTEXT_TOKEN_BUDGET", "100000")),
+            context_summary=os.getenv("GRU_CONTEXT_SUMMARY", "false").lower() == "true",
             max_concurrent_agents=int(os.getenv("GRU_MAX_AGENTS", "10")),
             default_workdir=workdir,
             enable_cgroups=os.getenv("GRU_ENABLE_CGROUPS", "false").lower() == "true",
             default_memory_limit=os.getenv("GRU_MEMORY_LIMIT", "512M"),
             default_cpu_quota=int(os.getenv("GRU_CPU_QUOTA", "50")),
+            cgroup_root=Path(os.getenv("GRU_CGROUP_ROOT", "/sys/fs/cgroup/gru")),
             enable_worktrees=os.getenv("GRU_ENABLE_WORKTREES", "true").lower() == "true",
             worktree_base_dir=Path(wt_dir) if (wt_dir := os.getenv("GRU_WORKTREE_DIR")) else None,
             delete_worktree_branch=os.getenv("GRU_DELETE_WORKTREE_BRANCH", "false").lower() == "true",
@@ -136,6 +182,14 @@ class Config:
             webhook_port=int(os.getenv("GRU_WEBHOOK_PORT", "8080")),
             webhook_secret=os.getenv("GRU_WEBHOOK_SECRET", ""),
             progress_report_interval=int(os.getenv("GRU_PROGRESS_REPORT_INTERVAL", "0")),
+            recover_tasks=os.getenv("GRU_RECOVER_TASKS", "false").lower() == "true",
+            db_group_commit=os.getenv("GRU_DB_GROUP_COMMIT", "false").lower() == "true",
+            db_commit_interval_ms=int(os.getenv("GRU_DB_COMMIT_INTERVAL_MS", "50")),
+            db_commit_max_statements=int(os.getenv("GRU_DB_COMMIT_MAX_STATEMENTS", "100")),
+            db_read_connections=int(os.getenv("GRU_DB_READ_CONNECTIONS", "2")),
+            index_conversations=os.getenv("GRU_INDEX_CONVERSATIONS", "false").lower() == "true",
+            retention_days=int(os.getenv("GRU_RETENTION_DAYS", "0")),
+            retention_interval=int(os.getenv("GRU_RETENTION_INTERVAL", "3600")),
         )
 
     def validate(self) -> list[str]:
@@ -180,4 +234,7 @@ class Config:
         if not self.anthropic_api_key:
             errors.append("ANTHROPIC_API_KEY is required")
 
+        if self.batch_backend not in ("api", "local"):
+            errors.append("GRU_BATCH_BACKEND must be 'api' or 'local'")
+
         return errors
@@ -0,0 +1,181 @@
+"""Token-budget context window for agent conversations."""
+
+from __future__ import annotations
+
+import bisect
+import json
+from typing import Any
+
+CHARS_PER_TOKEN = 4  # Rough estimate; good enough to stay clear of the context limit
+MESSAGE_OVERHEAD_TOKENS = 4  # Role and framing per message
+SUMMARY_MAX_LINES = 40
+SUMMARY_LINE_CHARS = 160
+
+
+def estimate_tokens(message: dict[str, Any]) -> int:
+    """Estimate the input tokens a message costs."""
+    content = message.get("content", "")
+    if isinstance(content, str):
+        return len(content) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+    chars = 0
+    for block in content:
+        if not isinstance(block, dict):
+            chars += len(str(block))
+        elif block.get("type") == "text":
+            chars += len(block.get("text", ""))
+        elif block.get("type") == "tool_use":
+            chars += len(block.get("name", "")) + len(json.dumps(block.get("input", {})))
+        elif block.get("type") == "tool_result":
+            result = block.get("content", "")
+            if isinstance(result, list):
+                chars += sum(len(part.get("text", "")) for part in result if isinstance(part, dict))
+            else:
+                chars += len(str(result))
+        else:
+            chars += len(json.dumps(block))
+    return chars // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def _blocks(message: dict[str, Any], block_type: str) -> list[dict[str, Any]]:
+    """Return the content blocks of a given type in a message."""
+    content = message.get("content")
+    if not isinstance(content, list):
+        return []
+    return [b for b in content if isinstance(b, dict) and b.get("type") == block_type]
+
+
+def _clip(text: str) -> str:
+    """Shorten text to a single summary line."""
+    line = " ".join(text.split())
+    if len(line) > SUMMARY_LINE_CHARS:
+        line = line[: SUMMARY_LINE_CHARS - 3] + "..."
+    return line
+
+
+def summarize_message(message: dict[str, Any]) -> list[str]:
+    """Describe a message in a few short lines for a compacted history."""
+    content = message.get("content", "")
+    role = message.get("role", "user")
+    if isinstance(content, str):
+        return [_clip(f"{role}: {content}")] if content.strip() else []
+
+    lines = [_clip(f"{role}: {b.get('text', '')}") for b in _blocks(message, "text") if b.get("text", "").strip()]
+    for block in _blocks(message, "tool_use"):
+        lines.append(_clip(f"called {block.get('name', '')} {json.dumps(block.get('input', {}))}"))
+    errors = sum(1 for b in _blocks(message, "tool_result") if b.get("is_error"))
+    if errors:
+        lines.append(f"{errors} tool call(s) failed")
+    return lines
+
+
+class ContextWindow:
+    """Keeps an agent's conversation within a token budget.
+
+    The first message (the task) is always kept; older turns after it are
+    dropped once the estimated size exceeds token_budget or the count exceeds
+    max_messages. Per-message estimates, their prefix sums and a tool_use
+    index are maintained as messages are appended, so each turn only costs
+    work proportional to the new messages.
+
+    When trimming, the cut drops to half the budget at once and then stays
+    put until the budget is exceeded again, so the kept prefix (and its
+    prompt-cache entry) is identical for many turns. The cut never separates
+    a tool_result from its tool_use.
+    """
+
+    def __init__(self, token_budget: int, max_messages: int, summarize: bool = False) -> None:
+        self.token_budget = token_budget
+        self.max_messages = max_messages
+        self.summarize = summarize
+        self._reset(None)
+
+    def _reset(self, messages: list[dict] | None) -> None:
+        self._messages = messages
+        self._tokens: list[int] = []
+        self._prefix: list[int] = [0]  # _prefix[i] = estimated tokens of messages[:i]
+        self._tool_index: dict[str, int] = {}  # tool_use id -> index of its assistant message
+        # Lowest index of a tool_use referenced by a tool_result at or after each index;
+        # cutting at i is safe when _pair_floor[i] >= i
+        self._pair_floor: list[int] = []
+        self._cut = 1
+        self._summary: list[str] = []
+
+    def _append(self, message: dict[str, Any]) -> None:
+        index = len(self._tokens)
+        tokens = estimate_tokens(message)
+        self._tokens.append(tokens)
+        self._prefix.append(self._prefix[-1] + tokens)
+
+        for block in _blocks(message, "tool_use"):
+            self._tool_index[block.get("id", "")] = index
+        floor = index
+        for block in _blocks(message, "tool_result"):
+            floor = min(floor, self._tool_index.get(block.get("tool_use_id", ""), index))
+        self._pair_floor.append(floor)
+        # Results normally follow their tool_use directly, so this touches at most a message or two
+        for i in range(floor + 1, index):
+            self._pair_floor[i] = min(self._pair_floor[i], floor)
+
+    def _sync(self, messages: list[dict]) -> None:
+        """Index messages appended since the last call, or start over for a new list."""
+        if messages is not self._messages or len(messages) < len(self._tokens):
+            self._reset(messages)
+        for message in messages[len(self._tokens) :]:
+            self._append(message)
+
+    @property
+    def estimated_tokens(self) -> int:
+        """Estimated tokens of the messages indexed so far."""
+        return self._prefix[-1]
+
+    def _fits(self, cut: int, count: int) -> bool:
+        kept = count - cut + (2 if cut > 1 else 1)
+        tokens = self._tokens[0] + self._prefix[count] - self._prefix[cut]
+        return kept <= self.max_messages and tokens <= self.token_budget
+
+    def _next_cut(self, count: int) -> int:
+        """Pick a new cut leaving headroom under both limits."""
+        # Message limit: keep between half and all of the recent slots
+        keep_recent = max(1, self.max_messages - 2)
+        step = max(1, keep_recent // 2)
+        overflow = count - 1 - keep_recent
+        by_count = 1 + -(-overflow // step) * step if overflow > 0 else 1
+
+        # Token limit: drop the oldest turns until the rest fits in half the budget
+        excess = self._tokens[0] + self._prefix[count] - self.token_budget // 2
+        by_tokens = bisect.bisect_left(self._prefix, excess, lo=1) if excess > 0 else 1
+
+        cut = min(max(self._cut, by_count, by_tokens), count - 1)
+        while cut < count - 1 and self._pair_floor[cut] < cut:
+            cut += 1
+        # The newest turn alone is over budget: keep its tool_use rather than orphan the results
+        while cut > 1 and self._pair_floor[cut] < cut:
+            cut = max(1, self._pair_floor[cut])
+        return cut
+
+    def build(self, messages: list[dict]) -> list[dict]:
+        """Return the messages to send this turn.
+
+        Messages must only be appended to between calls; any other change to
+        the list requires passing a new list object.
+        """
+        self._sync(messages)
+        count = len(messages)
+        if count <= 1:
+            return messages
+        if not self._fits(self._cut, count):
+            cut = self._next_cut(count)
+            if self.summarize:
+                for message in messages[self._cut : cut]:
+                    self._summary.extend(summarize_message(message))
+                del self._summary[:-SUMMARY_MAX_LINES]
+            self._cut = cut
+        if self._cut == 1:
+            return messages
+
+        removed = self._cut - 1
+        notice = f"[Earlier conversation truncated. {removed} messages removed.]"
+        if self._summary:
+            notice += "\nSummary of removed turns:\n" + "\n".join(f"- {line}" for line in self._summary)
+        return [messages[0], {"role": "user", "content": notice}, *messages[self._cut :]]
@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import asyncio
 import uuid
 from typing import TYPE_CHECKING, Any
 
@@ -9,11 +10,66 @@ if TYPE_CHECKING:
     from gru.db import Database
 
 
+class Mailbox:
+    """In-process inbox for a running agent.
+
+    Messages are persisted before they are delivered here, so the queue is
+    only a wake-up path; anything left unread survives in agent_messages.
+    """
+
+    def __init__(self) -> None:
+        self._queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+
+    def put(self, message: dict[str, Any]) -> None:
+        """Deliver a message."""
+        self._queue.put_nowait(message)
+
+    def drain(self) -> list[dict[str, Any]]:
+        """Take every delivered message without waiting."""
+        messages = []
+        while not self._queue.empty():
+            messages.append(self._queue.get_nowait())
+        return messages
+
+    async def wait(self, timeout: float | None = None) -> list[dict[str, Any]]:
+        """Block until at least one message arrives, then take them all.
+
+        Returns an empty list if the timeout passes first.
+        """
+        try:
+            first = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return []
+        return [first, *self.drain()]
+
+
 class Coordinator:
     """Coordinates communication between agents."""
 
     def __init__(self, db: Database) -> None:
         self.db = db
+        self._mailboxes: dict[str, Mailbox] = {}
+        # Write-through cache of shared context: task -> key -> (value, version), None for a known-missing key
+        self._context: dict[str, dict[str, tuple[Any, int] | None]] = {}
+        self._context_loaded: set[str] = set()  # Tasks whose every key is cached
+        self._context_changed = asyncio.Condition()
+
+    async def open_mailbox(self, agent_id: str) -> Mailbox:
+        """Start push delivery for an agent, seeded with its unread messages."""
+        mailbox = self._mailboxes.get(agent_id)
+        if mailbox is None:
+            mailbox = self._mailboxes[agent_id] = Mailbox()
+            stored = await self.db.get_agent_messages(agent_id, unread_only=True)
+            # Messages sent while loading were pushed already and may also be in stored
+            pushed = mailbox.drain()
+            pushed_ids = {m["id"] for m in pushed}
+            for message in [m for m in stored if m["id"] not in pushed_ids] + pushed:
+                mailbox.put(message)
+        return mailbox
+
+    def close_mailbox(self, agent_id: str) -> None:
+        """Stop push delivery; later messages stay unread in the database."""
+        self._mailboxes.pop(agent_id, None)
 
     async def send_message(
         self,
@@ -35,8 +91,35 @@ class Coordinator:
             content=content,
             metadata=metadata,
         )
+        self._deliver(message_id, from_agent, to_agent, content, message_type, task_id, metadata)
         return message_id
 
+    def _deliver(
+        self,
+        message_id: str,
+        from_agent: str | None,
+        to_agent: str | None,
+        content: str,
+        message_type: str,
+        task_id: str | None,
+        metadata: dict | None,
+    ) -> None:
+        """Push a stored message to the recipient's mailbox, if it is running here."""
+        mailbox = self._mailboxes.get(to_agent) if to_agent else None
+        if mailbox:
+            mailbox.put(
+                {
+                    "id": message_id,
+                    "from_agent": from_agent,
+                    "to_agent": to_agent,
+                    "task_id": task_id,
+                    "message_type": message_type,
+                    "content": content,
+                    "metadata": metadata,
+                    "read": 0,
+                }
+            )
+
     async def get_messages(
         self,
         agent_id: str,
@@ -45,9 +128,21 @@ class Coordinator:
         """Get messages for an agent."""
         return await self.db.get_agent_messages(agent_id, unread_only)
 
-    async def mark_read(self, message_id: str) -> None:
-        """Mark a message as read."""
-        await self.db.mark_message_read(message_id)
+    async def receive(self, agent_id: str) -> list[dict[str, Any]]:
+        """Take an agent's new messages, from its mailbox if it has one."""
+        mailbox = self._mailboxes.get(agent_id)
+        if mailbox is None:
+            return await self.get_messages(agent_id, unread_only=True)
+        return mailbox.drain()
+
+    async def wait_for_messages(self, agent_id: str, timeout: float | None = None) -> list[dict[str, Any]]:
+        """Block until a message arrives for an agent or the timeout passes."""
+        mailbox = await self.open_mailbox(agent_id)
+        return await mailbox.wait(timeout)
+
+    async def mark_read(self, *message_ids: str) -> None:
+        """Mark messages as read."""
+        await self.db.mark_messages_read(list(message_ids))
 
     async def broadcast(
         self,
@@ -55,27 +150,40 @@ class Coordinator:
         content: str,
         task_id: str,
         exclude: list[str] | None = None,
+        recursive: bool = False,
     ) -> list[str]:
-        """Broadcast a message to all agents on a task."""
+        """Broadcast a message to all agents on a task.
+
+        By default this reaches the task and its direct subtasks; with
+        recursive=True it reaches the whole subtask tree. All messages are
+        stored in one transaction.
+        """
         exclude = exclude or []
-        # Get all agents for the task
-        tasks = await self.db.fetchall(
-            "SELECT DISTINCT agent_id FROM tasks WHERE id = ? OR parent_task_id = ?",
-            (task_id, task_id),
-        )
-        message_ids = []
-        for task in tasks:
-            agent_id = task["agent_id"]
-            if agent_id != from_agent and agent_id not in exclude:
-                msg_id = await self.send_message(
-                    from_agent=from_agent,
-                    to_agent=agent_id,
-                    content=content,
-                    message_type="info",
-                    task_id=task_id,
-                )
-                message_ids.append(msg_id)
-        return message_ids
+        if recursive:
+            agent_ids = await self.db.get_task_tree_agents(task_id)
+        else:
+            tasks = await self.db.fetchall(
+                "SELECT DISTINCT agent_id FROM tasks WHERE id = ? OR parent_task_id = ?",
+                (task_id, task_id),
+            )
+            agent_ids = [task["agent_id"] for task in tasks]
+
+        messages = [
+            {
+                "message_id": str(uuid.uuid4())[:8],
+                "from_agent": from_agent,
+                "to_agent": agent_id,
+                "task_id": task_id,
+                "message_type": "info",
+                "content": content,
+            }
+            for agent_id in agent_ids
+            if agent_id and agent_id != from_agent and agent_id not in exclude
+        ]
+        await self.db.send_agent_messages(messages)
+        for m in messages:
+            self._deliver(m["message_id"], from_agent, m["to_agent"], content, "info", task_id, None)
+        return [m["message_id"] for m in messages]
 
     async def request_handoff(
         self,
@@ -100,16 +208,97 @@ class Coordinator:
         key: str,
         value: Any,
         agent_id: str,
-    ) -> None:
-        """Set a shared context value."""
-        await self.db.set_shared_context(task_id, key, value, agent_id)
+    ) -> int:
+        """Set a shared context value, returning its new version."""
+        version = await self.db.set_shared_context(task_id, key, value, agent_id)
+        await self._context_updated(task_id, key, (value, version))
+        return version
+
+    async def compare_and_set_context(
+        self,
+        task_id: str,
+        key: str,
+        value: Any,
+        agent_id: str,
+        expected_version: int,
+    ) -> tuple[bool, int]:
+        """Set a shared context value only if nobody changed it since expected_version.
+
+        Use version 0 to create a key that must not exist yet.
+
+        Returns:
+            Whether the value was set, and the key's current version
+        """
+        version = await self.db.compare_and_set_shared_context(task_id, key, value, agent_id, expected_version)
+        if version is not None:
+            await self._context_updated(task_id, key, (value, version))
+            return True, version
+        entry = await self.db.get_shared_context_entry(task_id, key)
+        current = (entry["value"], entry["version"]) if entry else None
+        await self._context_updated(task_id, key, current)
+        return False, current[1] if current else 0
+
+    def forget_task(self, task_id: str) -> None:
+        """Drop a finished task's cached shared context; it stays in the database."""
+        self._context.pop(task_id, None)
+        self._context_loaded.discard(task_id)
+
+    async def _context_updated(self, task_id: str, key: str, entry: tuple[Any, int] | None) -> None:
+        """Update the cache and wake agents waiting on the key."""
+        self._context.setdefault(task_id, {})[key] = entry
+        async with self._context_changed:
+            self._context_changed.notify_all()
+
+    async def get_context_entry(self, task_id: str, key: str) -> tuple[Any, int] | None:
+        """Get a shared context value and its version, or None if unset."""
+        cache = self._context.setdefault(task_id, {})
+        if key not in cache and task_id not in self._context_loaded:
+            entry = await self.db.get_shared_context_entry(task_id, key)
+            # Don't clobber a write that finished during the read
+            cache.setdefault(key, (entry["value"], entry["version"]) if entry else None)
+        return cache.get(key)
 
     async def get_context(self, task_id: str, key: str | None = None) -> Any:
         """Get shared context value(s)."""
-        context = await self.db.get_shared_context(task_id)
         if key:
-            return context.get(key)
-        return context
+            entry = await self.get_context_entry(task_id, key)
+            return entry[0] if entry else None
+        if task_id not in self._context_loaded:
+            entries = await self.db.get_shared_context_entries(task_id)
+            cache = self._context.setdefault(task_id, {})
+            for stored_key, entry in entries.items():
+                cached = cache.get(stored_key)
+                # A write that finished during the read is newer than what it returned
+                if cached is None or cached[1] < entry["version"]:
+                    cache[stored_key] = (entry["value"], entry["version"])
+            self._context_loaded.add(task_id)
+        return {k: entry[0] for k, entry in self._context[task_id].items() if entry is not None}
+
+    async def wait_for_context(
+        self,
+        task_id: str,
+        key: str,
+        after_version: int = 0,
+        timeout: float | None = None,
+    ) -> tuple[Any, int] | None:
+        """Block until a shared context key is set past after_version.
+
+        Returns:
+            The new value and version, or None if the timeout passed first
+        """
+
+        def changed() -> bool:
+            entry = self._context.get(task_id, {}).get(key)
+            return entry is not None and entry[1] > after_version
+
+        await self.get_context_entry(task_id, key)
+        if not changed():
+            async with self._context_changed:
+                try:
+                    await asyncio.wait_for(self._context_changed.wait_for(changed), timeout=timeout)
+                except asyncio.TimeoutError:
+                    return None
+        return self._context.get(task_id, {}).get(key)
 
     async def resolve_agent(self, identifier: str) -> str | None:
         """Resolve an agent name or ID to an agent ID."""
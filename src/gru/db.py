@@ -2,22 +2,331 @@
 
 from __future__ import annotations
 
-import contextlib
+import asyncio
 import json
-from collections.abc import AsyncIterator
+import logging
+import re
+from collections.abc import AsyncIterator, Awaitable, Callable
 from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Any
 
 import aiosqlite
 
+from gru.pricing import usage_cost
+from gru.retention import ConversationArchive
+
+logger = logging.getLogger(__name__)
+
+_LIST_AGENTS = "SELECT * FROM agents ORDER BY created_at DESC LIMIT ?"
+_LIST_AGENTS_BY_STATUS = "SELECT * FROM agents WHERE status = ? ORDER BY created_at DESC LIMIT ?"
+_AGENT_STATUS_COUNTS = "SELECT status, COUNT(*) AS count FROM agents GROUP BY status"
+_QUEUED_TASKS = """
+    SELECT t.*, a.supervised, a.model
+    FROM tasks t
+    JOIN agents a ON t.agent_id = a.id
+    WHERE t.status = 'queued'
+    ORDER BY t.priority_score DESC, t.queued_at ASC
+    LIMIT ?
+"""
+_PENDING_APPROVALS = "SELECT * FROM approvals WHERE status = 'pending' ORDER BY created_at ASC"
+_PENDING_APPROVALS_FOR_AGENT = (
+    "SELECT * FROM approvals WHERE status = 'pending' AND agent_id = ? ORDER BY created_at ASC"
+)
+_UNREAD_AGENT_MESSAGES = "SELECT * FROM agent_messages WHERE to_agent = ? AND read = 0 ORDER BY created_at ASC"
+_ARCHIVABLE_AGENTS = """
+    SELECT a.id FROM agents a
+    WHERE a.status IN ('completed', 'failed', 'terminated')
+      AND datetime(COALESCE(a.completed_at, a.created_at)) < datetime('now', ?)
+      AND EXISTS (SELECT 1 FROM conversations c WHERE c.agent_id = a.id)
+    LIMIT ?
+"""
+JOURNAL_SIZE_LIMIT = 64 * 1024**2  # bytes the WAL file is truncated to after a checkpoint
+
+# Queries on hot paths with sample parameters. Tests check that each one is
+# answered from an index, without a full table scan or a temporary sort.
+HOT_QUERIES: dict[str, tuple[str, tuple[Any, ...]]] = {
+    "list_agents": (_LIST_AGENTS, (100,)),
+    "list_agents_by_status": (_LIST_AGENTS_BY_STATUS, ("running", 100)),
+    "agent_status_counts": (_AGENT_STATUS_COUNTS, ()),
+    "queued_tasks": (_QUEUED_TASKS, (10,)),
+    "pending_approvals": (_PENDING_APPROVALS, ()),
+    "pending_approvals_for_agent": (_PENDING_APPROVALS_FOR_AGENT, ("agent",)),
+    "unread_agent_messages": (_UNREAD_AGENT_MESSAGES, ("agent",)),
+    "conversation_tail": ("SELECT * FROM conversations WHERE agent_id = ? ORDER BY id DESC LIMIT ?", ("agent", 20)),
+    "conversation_page": (
+        "SELECT * FROM conversations WHERE agent_id = ? AND id > ? ORDER BY id ASC LIMIT ?",
+        ("agent", 0, 200),
+    ),
+}
+
+_WRITE_KEYWORDS = re.compile(r"\b(INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+
+def _is_read_only(sql: str) -> bool:
+    """Check whether a statement only reads, so it can run on a reader connection."""
+    head = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+    return head == "SELECT" or (head == "WITH" and not _WRITE_KEYWORDS.search(sql))
+
+
+# Agent columns added after the first release, (table, column, definition)
+_ADDED_COLUMNS = [
+    ("agents", "worktree_path", "TEXT"),
+    ("agents", "worktree_branch", "TEXT"),
+    ("agents", "base_repo", "TEXT"),
+    ("agents", "input_tokens", "INTEGER DEFAULT 0"),
+    ("agents", "output_tokens", "INTEGER DEFAULT 0"),
+    ("agents", "live_output", "INTEGER DEFAULT 0"),
+    ("agents", "cache_read_tokens", "INTEGER DEFAULT 0"),
+    ("agents", "cache_creation_tokens", "INTEGER DEFAULT 0"),
+    ("agents", "bash_timeout", "INTEGER"),
+    ("shared_context", "version", "INTEGER NOT NULL DEFAULT 1"),
+]
+
+_AGENTS_FTS = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS agents_fts USING fts5(
+        id, name, task,
+        content='agents',
+        content_rowid='rowid'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS agents_ai AFTER INSERT ON agents BEGIN
+        INSERT INTO agents_fts(rowid, id, name, task)
+        VALUES (NEW.rowid, NEW.id, NEW.name, NEW.task);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS agents_ad AFTER DELETE ON agents BEGIN
+        INSERT INTO agents_fts(agents_fts, rowid, id, name, task)
+        VALUES('delete', OLD.rowid, OLD.id, OLD.name, OLD.task);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS agents_au AFTER UPDATE ON agents BEGIN
+        INSERT INTO agents_fts(agents_fts, rowid, id, name, task)
+        VALUES('delete', OLD.rowid, OLD.id, OLD.name, OLD.task);
+        INSERT INTO agents_fts(rowid, id, name, task)
+        VALUES (NEW.rowid, NEW.id, NEW.name, NEW.task);
+    END
+    """,
+    # Index agents that existed before the FTS table did
+    "INSERT INTO agents_fts(agents_fts) VALUES('rebuild')",
+]
+
+
+async def _add_columns(conn: aiosqlite.Connection, added: list[tuple[str, str, str]]) -> None:
+    """Add (table, column, definition) columns that a table doesn't have yet."""
+    columns: dict[str, set[str]] = {}
+    for table, column, definition in added:
+        if table not in columns:
+            async with conn.execute(f"PRAGMA table_info({table})") as cursor:
+                columns[table] = {row[1] for row in await cursor.fetchall()}
+        if column not in columns[table]:
+            await conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+async def _migrate_baseline(conn: aiosqlite.Connection) -> None:
+    """Create the schema, bringing databases from before versioned migrations up to date."""
+    schema = (Path(__file__).parent / "schema.sql").read_text()
+    # PRAGMA lines are set on connect, outside the migration transaction
+    for statement in schema.split(";"):
+        statement = statement.strip()
+        if statement and not statement.startswith("PRAGMA"):
+            await conn.execute(statement)
+
+    # CREATE TABLE IF NOT EXISTS leaves older tables as they were
+    await _add_columns(conn, _ADDED_COLUMNS)
+
+    for statement in _AGENTS_FTS:
+        await conn.execute(statement)
+
+
+_SEARCH_INDEX = [
+    "DROP TRIGGER IF EXISTS agents_ai",
+    "DROP TRIGGER IF EXISTS agents_ad",
+    "DROP TRIGGER IF EXISTS agents_au",
+    "DROP TABLE IF EXISTS agents_fts",
+    # Prefix indexes make 'term*' queries index lookups instead of term-list scans
+    """
+    CREATE VIRTUAL TABLE agents_fts USING fts5(
+        id, name, task,
+        content='agents',
+        content_rowid='rowid',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER agents_ai AFTER INSERT ON agents BEGIN
+        INSERT INTO agents_fts(rowid, id, name, task)
+        VALUES (NEW.rowid, NEW.id, NEW.name, NEW.task);
+    END
+    """,
+    """
+    CREATE TRIGGER agents_ad AFTER DELETE ON agents BEGIN
+        INSERT INTO agents_fts(agents_fts, rowid, id, name, task)
+        VALUES('delete', OLD.rowid, OLD.id, OLD.name, OLD.task);
+    END
+    """,
+    # Only re-index when indexed columns change, not on every status or token update
+    """
+    CREATE TRIGGER agents_au AFTER UPDATE OF id, name, task ON agents BEGIN
+        INSERT INTO agents_fts(agents_fts, rowid, id, name, task)
+        VALUES('delete', OLD.rowid, OLD.id, OLD.name, OLD.task);
+        INSERT INTO agents_fts(rowid, id, name, task)
+        VALUES (NEW.rowid, NEW.id, NEW.name, NEW.task);
+    END
+    """,
+    "INSERT INTO agents_fts(agents_fts) VALUES('rebuild')",
+    # Filled only while conversation indexing is enabled, see Database._sync_conversation_index
+    """
+    CREATE VIRTUAL TABLE conversations_fts USING fts5(
+        content, tool_use, tool_result,
+        content='conversations',
+        content_rowid='id',
+        prefix='2 3'
+    )
+    """,
+]
+
+_CONVERSATIONS_FTS_TRIGGERS = {
+    "conversations_ai": """
+    CREATE TRIGGER conversations_ai AFTER INSERT ON conversations BEGIN
+        INSERT INTO conversations_fts(rowid, content, tool_use, tool_result)
+        VALUES (NEW.id, NEW.content, NEW.tool_use, NEW.tool_result);
+    END
+    """,
+    "conversations_ad": """
+    CREATE TRIGGER conversations_ad AFTER DELETE ON conversations BEGIN
+        INSERT INTO conversations_fts(conversations_fts, rowid, content, tool_use, tool_result)
+        VALUES('delete', OLD.id, OLD.content, OLD.tool_use, OLD.tool_result);
+    END
+    """,
+    "conversations_au": """
+    CREATE TRIGGER conversations_au AFTER UPDATE OF content, tool_use, tool_result ON conversations BEGIN
+        INSERT INTO conversations_fts(conversations_fts, rowid, content, tool_use, tool_result)
+        VALUES('delete', OLD.id, OLD.content, OLD.tool_use, OLD.tool_result);
+        INSERT INTO conversations_fts(rowid, content, tool_use, tool_result)
+        VALUES (NEW.id, NEW.content, NEW.tool_use, NEW.tool_result);
+    END
+    """,
+}
+
+
+async def _migrate_search_index(conn: aiosqlite.Connection) -> None:
+    """Key agent search by rowid with prefix indexes and add the conversation search table."""
+    for statement in _SEARCH_INDEX:
+        await conn.execute(statement)
+
+
+async def _migrate_agent_tools(conn: aiosqlite.Connection) -> None:
+    """Add the per-agent tool allow-list (a JSON list of names, NULL for all tools)."""
+    await _add_columns(conn, [("agents", "tools", "TEXT")])
+
+
+async def _migrate_agent_costs(conn: aiosqlite.Connection) -> None:
+    """Track cost and model routing per agent, pricing earlier usage at the agent's model."""
+    await _add_columns(
+        conn,
+        [
+            ("agents", "cost", "REAL DEFAULT 0"),
+            ("agents", "routed_turns", "INTEGER DEFAULT 0"),
+            ("agents", "routing_savings", "REAL DEFAULT 0"),
+        ],
+    )
+    async with conn.execute(
+        """
+        SELECT id, model, input_tokens, output_tokens, cache_read_tokens, cache_creation_tokens
+        FROM agents WHERE input_tokens > 0 OR output_tokens > 0
+        """
+    ) as cursor:
+        rows = await cursor.fetchall()
+    await conn.executemany(
+        "UPDATE agents SET cost = ? WHERE id = ?",
+        [(usage_cost(row[1], *(tokens or 0 for tokens in row[2:])), row[0]) for row in rows],
+    )
+
+
+# Schema migrations in order; migration N brings a database from user_version
+# N - 1 to N. Append new ones, never edit or reorder applied ones.
+MIGRATIONS: list[Callable[[aiosqlite.Connection], Awaitable[None]]] = [
+    _migrate_baseline,
+    _migrate_search_index,
+    _migrate_agent_tools,
+    _migrate_agent_costs,
+]
+
+SNIPPET_MARKERS = ("**", "**")  # Wrapped around matched terms in search snippets
+SNIPPET_TOKENS = 16
+_SEARCH_TERM = re.compile(r'"([^"]*)"(\*?)|(\S+)')
+
+
+def _fts_query(text: str) -> str:
+    """Turn free text into a safe FTS5 query.
+
+    Words and "quoted phrases" must all match; a trailing * makes a prefix
+    query. Each term is quoted, so FTS5 operators and punctuation in the
+    input (paths, error messages) are searched as plain text.
+    """
+    terms = []
+    for phrase, star, word in _SEARCH_TERM.findall(text):
+        if word:
+            star = "*" if word.rstrip('"').endswith("*") else ""
+            phrase = word.strip('"*')
+        if re.search(r"\w", phrase):
+            terms.append('"' + phrase.replace('"', '""') + '"' + star)
+    return " ".join(terms)
+
 
 class Database:
-    """Async SQLite database wrapper."""
+    """Async SQLite database wrapper.
+
+    With ``group_commit`` enabled, hot-path writes (token counts, messages,
+    status updates) are executed immediately but committed together: a
+    commit is issued every ``commit_interval`` seconds or once
+    ``commit_max_statements`` writes are pending, whichever comes first.
+    Uncommitted writes are visible to reads on this connection, but up to
+    one interval of them can be lost if the process crashes.
+
+    Writes go through a single writer connection. ``fetchone``/``fetchall``
+    of read-only statements run on a pool of ``read_connections`` read-only
+    connections, so reads (bot commands, status, search) don't queue behind
+    agent writes on the writer's thread. While the writer has uncommitted
+    writes, reads stay on the writer so they see them.
 
-    def __init__(self, db_path: Path) -> None:
+    Conversations of long-finished agents can be moved into compressed
+    per-agent files under ``archive_dir`` (see ``archive_conversations``);
+    ``get_conversation`` reads them back transparently.
+
+    ``index_conversations`` turns the full-text index over conversation
+    content and tool calls on (True) or off (False) when connecting; None
+    keeps whatever the database has. The index makes each stored message a
+    little more expensive to write.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        group_commit: bool = False,
+        commit_interval: float = 0.05,
+        commit_max_statements: int = 100,
+        read_connections: int = 2,
+        index_conversations: bool | None = None,
+        archive_dir: Path | None = None,
+    ) -> None:
         self.db_path = db_path
+        self.group_commit = group_commit
+        self.commit_interval = commit_interval
+        self.commit_max_statements = commit_max_statements
+        self.read_connections = read_connections
+        self.index_conversations = index_conversations
+        self.archive = ConversationArchive(archive_dir or Path(db_path).parent / "archive")
         self._conn: aiosqlite.Connection | None = None
+        self._readers: list[aiosqlite.Connection] = []
+        self._idle_readers: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        self._pending_writes = 0
+        self._flush_task: asyncio.Task | None = None
 
     async def connect(self) -> None:
         """Open database connection and initialize schema."""
@@ -27,93 +336,104 @@ class Database:
         # Enable WAL mode and foreign keys
         await self._conn.execute("PRAGMA journal_mode = WAL")
         await self._conn.execute("PRAGMA foreign_keys = ON")
+        # Only takes effect on a new database; reclaim_space converts older ones
+        await self._conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        await self._conn.execute(f"PRAGMA journal_size_limit = {JOURNAL_SIZE_LIMIT}")
 
-        # Initialize schema
-        schema_path = Path(__file__).parent / "schema.sql"
-        schema = schema_path.read_text()
-
-        # Execute schema statements (skip PRAGMA lines, already set)
-        for statement in schema.split(";"):
-            statement = statement.strip()
-            if statement and not statement.startswith("PRAGMA"):
-                await self._conn.execute(statement)
+        try:
+            await self._migrate()
+            if self.index_conversations is not None:
+                await self._sync_conversation_index(self.index_conversations)
+        except BaseException:
+            await self._conn.close()
+            self._conn = None
+            raise
 
-        # Migrate existing databases: add worktree columns if missing
-        await self._migrate_worktree_columns()
+        await self._open_readers()
 
-        # Set up FTS table and triggers
-        await self._migrate_fts()
+    async def _open_readers(self) -> None:
+        """Open the read-only connection pool (after the schema exists)."""
+        if str(self.db_path) == ":memory:":
+            return
+        uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+        for _ in range(self.read_connections):
+            conn = await aiosqlite.connect(uri, uri=True)
+            conn.row_factory = aiosqlite.Row
+            self._readers.append(conn)
+            self._idle_readers.put_nowait(conn)
 
-        await self._conn.commit()
+    async def _migrate(self) -> None:
+        """Apply pending schema migrations.
 
-    async def _migrate_worktree_columns(self) -> None:
-        """Add worktree columns to existing databases."""
+        The schema version is kept in ``PRAGMA user_version``; an up-to-date
+        database costs a single pragma read. Pending migrations run in one
+        transaction, so a failure leaves the database at its previous version
+        and is raised rather than ignored.
+        """
         if not self._conn:
             return
 
-        # Check if columns exist by querying table info
-        cursor = await self._conn.execute("PRAGMA table_info(agents)")
-        columns = {row[1] for row in await cursor.fetchall()}
-
-        migrations = [
-            ("worktree_path", "ALTER TABLE agents ADD COLUMN worktree_path TEXT"),
-            ("worktree_branch", "ALTER TABLE agents ADD COLUMN worktree_branch TEXT"),
-            ("base_repo", "ALTER TABLE agents ADD COLUMN base_repo TEXT"),
-            ("input_tokens", "ALTER TABLE agents ADD COLUMN input_tokens INTEGER DEFAULT 0"),
-            ("output_tokens", "ALTER TABLE agents ADD COLUMN output_tokens INTEGER DEFAULT 0"),
-            ("live_output", "ALTER TABLE agents ADD COLUMN live_output INTEGER DEFAULT 0"),
-        ]
-
-        for col_name, sql in migrations:
-            if col_name not in columns:
-                with contextlib.suppress(Exception):
-                    await self._conn.execute(sql)
-
-    async def _migrate_fts(self) -> None:
-        """Set up full-text search for agents table."""
-        if not self._conn:
+        latest = len(MIGRATIONS)
+        version = await self._user_version()
+        if version >= latest:
+            if version > latest:
+                logger.warning("Database schema version %d is newer than this gru (%d)", version, latest)
             return
 
-        # Create FTS table if not exists
-        with contextlib.suppress(Exception):
-            await self._conn.execute("""
-                CREATE VIRTUAL TABLE IF NOT EXISTS agents_fts USING fts5(
-                    id, name, task,
-                    content='agents',
-                    content_rowid='rowid'
-                )
-            """)
-
-        # Create triggers to keep FTS in sync (wrapped in try/except for idempotency)
-        triggers = [
-            """
-            CREATE TRIGGER IF NOT EXISTS agents_ai AFTER INSERT ON agents BEGIN
-                INSERT INTO agents_fts(rowid, id, name, task)
-                VALUES (NEW.rowid, NEW.id, NEW.name, NEW.task);
-            END
-            """,
-            """
-            CREATE TRIGGER IF NOT EXISTS agents_ad AFTER DELETE ON agents BEGIN
-                INSERT INTO agents_fts(agents_fts, rowid, id, name, task)
-                VALUES('delete', OLD.rowid, OLD.id, OLD.name, OLD.task);
-            END
-            """,
-            """
-            CREATE TRIGGER IF NOT EXISTS agents_au AFTER UPDATE ON agents BEGIN
-                INSERT INTO agents_fts(agents_fts, rowid, id, name, task)
-                VALUES('delete', OLD.rowid, OLD.id, OLD.name, OLD.task);
-                INSERT INTO agents_fts(rowid, id, name, task)
-                VALUES (NEW.rowid, NEW.id, NEW.name, NEW.task);
-            END
-            """,
-        ]
-        for trigger_sql in triggers:
-            with contextlib.suppress(Exception):
-                await self._conn.execute(trigger_sql)
+        await self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the write lock
+            version = await self._user_version()
+            for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                logger.info("Applying schema migration %d: %s", number, migration.__doc__)
+                await migration(self._conn)
+            await self._conn.execute(f"PRAGMA user_version = {max(version, latest)}")
+            await self._conn.commit()
+        except BaseException:
+            await self._conn.rollback()
+            raise
+
+    async def _sync_conversation_index(self, enabled: bool) -> None:
+        """Add or remove the triggers that keep conversations_fts up to date."""
+        if not self._conn:
+            raise RuntimeError("Database not connected")
+        async with self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'conversations_ai'"
+        ) as cursor:
+            if (await cursor.fetchone() is not None) == enabled:
+                return
+
+        await self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            for name, sql in _CONVERSATIONS_FTS_TRIGGERS.items():
+                await self._conn.execute(sql if enabled else f"DROP TRIGGER IF EXISTS {name}")
+            # Index existing history, or empty an index that would go stale
+            command = "rebuild" if enabled else "delete-all"
+            await self._conn.execute(f"INSERT INTO conversations_fts(conversations_fts) VALUES('{command}')")
+            await self._conn.commit()
+        except BaseException:
+            await self._conn.rollback()
+            raise
+
+    async def _user_version(self) -> int:
+        """Read the schema version recorded in the database."""
+        if not self._conn:
+            raise RuntimeError("Database not connected")
+        async with self._conn.execute("PRAGMA user_version") as cursor:
+            row = await cursor.fetchone()
+        return row[0]
 
     async def close(self) -> None:
         """Close database connection."""
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        for reader in self._readers:
+            await reader.close()
+        self._readers = []
+        self._idle_readers = asyncio.Queue()
         if self._conn:
+            await self.flush()
             await self._conn.close()
             self._conn = None
 
@@ -122,6 +442,8 @@ class Database:
         """Context manager for database transactions."""
         if not self._conn:
             raise RuntimeError("Database not connected")
+        # Don't let a rollback discard unrelated batched writes
+        await self.flush()
         try:
             yield
             await self._conn.commit()
@@ -141,23 +463,67 @@ class Database:
             raise RuntimeError("Database not connected")
         return await self._conn.executemany(sql, params_seq)
 
+    @asynccontextmanager
+    async def _connection_for(self, sql: str) -> AsyncIterator[aiosqlite.Connection]:
+        """Pick a reader for read-only statements, otherwise the writer."""
+        if not self._conn:
+            raise RuntimeError("Database not connected")
+        if not self._readers or self._conn.in_transaction or not _is_read_only(sql):
+            yield self._conn
+            return
+        reader = await self._idle_readers.get()
+        try:
+            yield reader
+        finally:
+            self._idle_readers.put_nowait(reader)
+
     async def fetchone(self, sql: str, params: tuple[Any, ...] | dict[str, Any] = ()) -> dict[str, Any] | None:
         """Execute and fetch one row as dict."""
-        cursor = await self.execute(sql, params)
-        row = await cursor.fetchone()
+        async with self._connection_for(sql) as conn, conn.execute(sql, params) as cursor:
+            row = await cursor.fetchone()
         return dict(row) if row else None
 
     async def fetchall(self, sql: str, params: tuple[Any, ...] | dict[str, Any] = ()) -> list[dict[str, Any]]:
         """Execute and fetch all rows as dicts."""
-        cursor = await self.execute(sql, params)
-        rows = await cursor.fetchall()
+        async with self._connection_for(sql) as conn, conn.execute(sql, params) as cursor:
+            rows = await cursor.fetchall()
         return [dict(row) for row in rows]
 
+    async def query_plan(self, sql: str, params: tuple[Any, ...] | dict[str, Any] = ()) -> list[str]:
+        """Return the steps of EXPLAIN QUERY PLAN for a statement."""
+        rows = await self.fetchall(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [row["detail"] for row in rows]
+
     async def commit(self) -> None:
         """Commit current transaction."""
         if self._conn:
+            self._pending_writes = 0
             await self._conn.commit()
 
+    async def flush(self) -> None:
+        """Commit any writes deferred by group commit."""
+        if self._pending_writes:
+            await self.commit()
+
+    async def _commit_write(self) -> None:
+        """Commit a hot-path write now, or defer it when group commit is on."""
+        if not self.group_commit:
+            await self.commit()
+            return
+        self._pending_writes += 1
+        if self._pending_writes >= self.commit_max_statements:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_after_interval())
+
+    async def _flush_after_interval(self) -> None:
+        """Background flusher scheduled by the first deferred write."""
+        await asyncio.sleep(self.commit_interval)
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Group commit flush failed: {e}")
+
     # Agent operations
     async def create_agent(
         self,
@@ -175,14 +541,16 @@ class Database:
         worktree_path: str | None = None,
         worktree_branch: str | None = None,
         base_repo: str | None = None,
+        bash_timeout: int | None = None,
+        tools: list[str] | None = None,
     ) -> dict[str, Any]:
         """Create a new agent."""
         await self.execute(
             """
             INSERT INTO agents (id, name, task, model, system_prompt, supervised,
                               timeout_mode, priority, memory_limit, cpu_quota, workdir,
-                              worktree_path, worktree_branch, base_repo)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                              worktree_path, worktree_branch, base_repo, bash_timeout, tools)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 agent_id,
@@ -199,6 +567,8 @@ class Database:
                 worktree_path,
                 worktree_branch,
                 base_repo,
+                bash_timeout,
+                json.dumps(tools) if tools is not None else None,
             ),
         )
         await self.commit()
@@ -211,11 +581,13 @@ class Database:
     async def get_agents(self, status: str | None = None, limit: int = 100) -> list[dict[str, Any]]:
         """Get agents, optionally filtered by status."""
         if status:
-            return await self.fetchall(
-                "SELECT * FROM agents WHERE status = ? ORDER BY created_at DESC LIMIT ?",
-                (status, limit),
-            )
-        return await self.fetchall("SELECT * FROM agents ORDER BY created_at DESC LIMIT ?", (limit,))
+            return await self.fetchall(_LIST_AGENTS_BY_STATUS, (status, limit))
+        return await self.fetchall(_LIST_AGENTS, (limit,))
+
+    async def count_agents_by_status(self) -> dict[str, int]:
+        """Count all agents per status."""
+        rows = await self.fetchall(_AGENT_STATUS_COUNTS)
+        return {row["status"]: row["count"] for row in rows}
 
     async def update_agent(self, agent_id: str, **fields: Any) -> None:
         """Update agent fields."""
@@ -224,47 +596,112 @@ class Database:
         set_clause = ", ".join(f"{k} = ?" for k in fields)
         values = list(fields.values()) + [agent_id]
         await self.execute(f"UPDATE agents SET {set_clause} WHERE id = ?", tuple(values))
-        await self.commit()
+        await self._commit_write()
 
-    async def add_tokens(self, agent_id: str, input_tokens: int, output_tokens: int) -> None:
-        """Add token usage to agent."""
+    async def add_tokens(
+        self,
+        agent_id: str,
+        input_tokens: int,
+        output_tokens: int,
+        cache_read_tokens: int = 0,
+        cache_creation_tokens: int = 0,
+        cost: float = 0.0,
+        routed_turns: int = 0,
+        routing_savings: float = 0.0,
+    ) -> None:
+        """Add token usage, its cost and any model routing savings to agent."""
         await self.execute(
             """
             UPDATE agents SET
                 input_tokens = input_tokens + ?,
-                output_tokens = output_tokens + ?
+                output_tokens = output_tokens + ?,
+                cache_read_tokens = COALESCE(cache_read_tokens, 0) + ?,
+                cache_creation_tokens = COALESCE(cache_creation_tokens, 0) + ?,
+                cost = COALESCE(cost, 0) + ?,
+                routed_turns = COALESCE(routed_turns, 0) + ?,
+                routing_savings = COALESCE(routing_savings, 0) + ?
             WHERE id = ?
             """,
-            (input_tokens, output_tokens, agent_id),
+            (
+                input_tokens,
+                output_tokens,
+                cache_read_tokens,
+                cache_creation_tokens,
+                cost,
+                routed_turns,
+                routing_savings,
+                agent_id,
+            ),
         )
-        await self.commit()
+        await self._commit_write()
 
     async def search_agents(self, query: str, limit: int = 20) -> list[dict[str, Any]]:
-        """Search agents by task, name, or id."""
-        # Try FTS first, fall back to LIKE if FTS table doesn't exist
-        try:
-            return await self.fetchall(
-                """
-                SELECT a.* FROM agents a
-                JOIN agents_fts fts ON a.id = fts.id
-                WHERE agents_fts MATCH ?
-                ORDER BY a.created_at DESC
-                LIMIT ?
-                """,
-                (query, limit),
-            )
-        except Exception:
-            # Fall back to LIKE search
-            like_query = f"%{query}%"
-            return await self.fetchall(
-                """
-                SELECT * FROM agents
-                WHERE id LIKE ? OR name LIKE ? OR task LIKE ?
-                ORDER BY created_at DESC
-                LIMIT ?
-                """,
-                (like_query, like_query, like_query, limit),
-            )
+        """Search agents by task, name, or id, best matches first.
+
+        Each result has a ``snippet`` of its task with the matched terms
+        highlighted. With the conversation index enabled, agents whose
+        history matches follow, with the snippet taken from that history.
+        """
+        match = _fts_query(query)
+        if not match:
+            return []
+        start, end = SNIPPET_MARKERS
+        results = await self.fetchall(
+            f"""
+            SELECT a.*, snippet(agents_fts, 2, ?, ?, '...', {SNIPPET_TOKENS}) AS snippet
+            FROM agents_fts
+            JOIN agents a ON a.rowid = agents_fts.rowid
+            WHERE agents_fts MATCH ?
+            ORDER BY bm25(agents_fts, 10.0, 5.0, 1.0)
+            LIMIT ?
+            """,
+            (start, end, match, limit),
+        )
+        if len(results) < limit and await self.has_conversation_index():
+            found = {agent["id"] for agent in results}
+            for hit in await self.search_conversations(query, limit=limit * 5):
+                if hit["agent_id"] not in found and len(results) < limit:
+                    agent = await self.get_agent(hit["agent_id"])
+                    if agent:
+                        found.add(agent["id"])
+                        results.append({**agent, "snippet": hit["snippet"]})
+        return results
+
+    async def search_conversations(
+        self, query: str, agent_id: str | None = None, limit: int = 20
+    ) -> list[dict[str, Any]]:
+        """Search conversation content and tool calls, best matches first.
+
+        Returns an empty list unless the conversation index is enabled.
+
+        Returns:
+            Matching messages as dicts with ``id``, ``agent_id``, ``role``,
+            ``created_at`` and a highlighted ``snippet``
+        """
+        match = _fts_query(query)
+        if not match or not await self.has_conversation_index():
+            return []
+        start, end = SNIPPET_MARKERS
+        agent_filter = "AND c.agent_id = ?" if agent_id else ""
+        return await self.fetchall(
+            f"""
+            SELECT c.id, c.agent_id, c.role, c.created_at,
+                   snippet(conversations_fts, -1, ?, ?, '...', {SNIPPET_TOKENS}) AS snippet
+            FROM conversations_fts
+            JOIN conversations c ON c.id = conversations_fts.rowid
+            WHERE conversations_fts MATCH ? {agent_filter}
+            ORDER BY bm25(conversations_fts)
+            LIMIT ?
+            """,
+            (start, end, match, *((agent_id,) if agent_id else ()), limit),
+        )
+
+    async def has_conversation_index(self) -> bool:
+        """Check whether conversations are being indexed for search."""
+        row = await self.fetchone(
+            "SELECT 1 AS found FROM sqlite_master WHERE type = 'trigger' AND name = 'conversations_ai'"
+        )
+        return row is not None
 
     async def delete_agent(self, agent_id: str) -> bool:
         """Delete an agent."""
@@ -299,17 +736,38 @@ class Database:
 
     async def get_queued_tasks(self, limit: int = 10) -> list[dict[str, Any]]:
         """Get queued tasks ordered by priority."""
+        return await self.fetchall(_QUEUED_TASKS, (limit,))
+
+    async def get_recoverable_tasks(self) -> list[dict[str, Any]]:
+        """Get unfinished tasks with the agent fields needed to resume them."""
         return await self.fetchall(
             """
-            SELECT t.*, a.supervised, a.model
+            SELECT t.*, a.status AS agent_status, a.task AS agent_task, a.model,
+                   a.supervised, a.timeout_mode, a.workdir, a.worktree_path,
+                   a.worktree_branch, a.base_repo, a.live_output, a.bash_timeout,
+                   a.tools, a.input_tokens, a.output_tokens, a.cache_read_tokens, a.cache_creation_tokens,
+                   a.cost, a.routed_turns, a.routing_savings
             FROM tasks t
             JOIN agents a ON t.agent_id = a.id
-            WHERE t.status = 'queued'
+            WHERE t.status IN ('queued', 'running', 'waiting_approval')
             ORDER BY t.priority_score DESC, t.queued_at ASC
-            LIMIT ?
+            """
+        )
+
+    async def get_task_tree_agents(self, task_id: str) -> list[str]:
+        """Get the agents of a task and all its descendant tasks, at any depth."""
+        rows = await self.fetchall(
+            """
+            WITH RECURSIVE tree(id) AS (
+                SELECT id FROM tasks WHERE id = ?
+                UNION
+                SELECT t.id FROM tasks t JOIN tree ON t.parent_task_id = tree.id
+            )
+            SELECT DISTINCT agent_id FROM tasks WHERE id IN (SELECT id FROM tree) AND agent_id IS NOT NULL
             """,
-            (limit,),
+            (task_id,),
         )
+        return [row["agent_id"] for row in rows]
 
     async def update_task(self, task_id: str, **fields: Any) -> None:
         """Update task fields."""
@@ -318,7 +776,7 @@ class Database:
         set_clause = ", ".join(f"{k} = ?" for k in fields)
         values = list(fields.values()) + [task_id]
         await self.execute(f"UPDATE tasks SET {set_clause} WHERE id = ?", tuple(values))
-        await self.commit()
+        await self._commit_write()
 
     # Conversation operations
     async def add_message(
@@ -343,22 +801,158 @@ class Database:
                 json.dumps(tool_result) if tool_result else None,
             ),
         )
-        await self.commit()
+        await self._commit_write()
         return cursor.lastrowid or 0
 
-    async def get_conversation(self, agent_id: str) -> list[dict[str, Any]]:
-        """Get conversation history for an agent."""
-        rows = await self.fetchall(
-            "SELECT * FROM conversations WHERE agent_id = ? ORDER BY id ASC",
-            (agent_id,),
-        )
-        for row in rows:
-            if row.get("tool_use"):
-                row["tool_use"] = json.loads(row["tool_use"])
-            if row.get("tool_result"):
-                row["tool_result"] = json.loads(row["tool_result"])
+    @staticmethod
+    def _decode_conversation_row(row: dict[str, Any]) -> dict[str, Any]:
+        """Decode the JSON columns of a conversation row."""
+        if row.get("tool_use"):
+            row["tool_use"] = json.loads(row["tool_use"])
+        if row.get("tool_result"):
+            row["tool_result"] = json.loads(row["tool_result"])
+        return row
+
+    async def get_conversation(
+        self,
+        agent_id: str,
+        after_id: int | None = None,
+        before_id: int | None = None,
+        limit: int | None = None,
+    ) -> list[dict[str, Any]]:
+        """Get conversation history for an agent, oldest first.
+
+        Without a limit this returns every message (between the cursors, if
+        given). With a limit it returns one page: the first ``limit``
+        messages after ``after_id`` if that is set, otherwise the last
+        ``limit`` messages (before ``before_id``, if set). Page through with
+        the ``id`` of the last or first row returned. Only rows on the page
+        are JSON-decoded.
+        """
+        rows = await self._conversation_rows(agent_id, after_id, before_id, limit)
+        newest_first = limit is not None and after_id is None
+        # Archived messages are older than any still in the table; a full tail page doesn't need them
+        if self.archive.exists(agent_id) and not (newest_first and len(rows) == limit):
+            archived = await asyncio.to_thread(self.archive.read, agent_id)
+            rows = [
+                row
+                for row in archived
+                if (after_id is None or row["id"] > after_id) and (before_id is None or row["id"] < before_id)
+            ] + rows
+            if limit is not None:
+                rows = rows[-limit:] if newest_first else rows[:limit]
+        return [self._decode_conversation_row(row) for row in rows]
+
+    async def _conversation_rows(
+        self, agent_id: str, after_id: int | None, before_id: int | None, limit: int | None
+    ) -> list[dict[str, Any]]:
+        """Get undecoded conversation rows still in the table, oldest first; see get_conversation."""
+        conditions = ["agent_id = ?"]
+        params: list[Any] = [agent_id]
+        if after_id is not None:
+            conditions.append("id > ?")
+            params.append(after_id)
+        if before_id is not None:
+            conditions.append("id < ?")
+            params.append(before_id)
+        # Tail pages walk idx_conversations_agent backwards and stop after limit rows
+        newest_first = limit is not None and after_id is None
+        order = "DESC" if newest_first else "ASC"
+        sql = f"SELECT * FROM conversations WHERE {' AND '.join(conditions)} ORDER BY id {order}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        rows = await self.fetchall(sql, tuple(params))
+        if newest_first:
+            rows.reverse()
         return rows
 
+    async def iter_conversation(
+        self, agent_id: str, after_id: int | None = None, batch_size: int = 200
+    ) -> AsyncIterator[dict[str, Any]]:
+        """Stream an agent's conversation oldest first, one page in memory at a time.
+
+        An archived part of the conversation is read once up front, then the
+        messages still in the table are paged after it.
+        """
+        cursor = after_id if after_id is not None else 0
+        if self.archive.exists(agent_id):
+            archived = await asyncio.to_thread(self.archive.read, agent_id)
+            for row in archived:
+                if row["id"] > cursor:
+                    yield self._decode_conversation_row(row)
+            if archived:
+                cursor = max(cursor, archived[-1]["id"])
+        while True:
+            page = await self._conversation_rows(agent_id, cursor, None, batch_size)
+            for row in page:
+                yield self._decode_conversation_row(row)
+            if len(page) < batch_size:
+                return
+            cursor = page[-1]["id"]
+
+    # Retention
+    async def archive_conversations(self, older_than_days: int, limit: int = 50) -> int:
+        """Move the conversations of agents finished more than older_than_days ago into the archive.
+
+        Returns:
+            Number of agents whose conversation was archived
+        """
+        agents = await self.fetchall(_ARCHIVABLE_AGENTS, (f"-{older_than_days} days", limit))
+        archived: list[tuple[str, int]] = []
+        for agent in agents:
+            rows = await self.fetchall("SELECT * FROM conversations WHERE agent_id = ? ORDER BY id", (agent["id"],))
+            if rows:
+                await asyncio.to_thread(self.archive.append, agent["id"], rows)
+                archived.append((agent["id"], rows[-1]["id"]))
+        if archived:
+            async with self.transaction():
+                await self.executemany("DELETE FROM conversations WHERE agent_id = ? AND id <= ?", archived)
+        return len(archived)
+
+    async def purge_agent_messages(self, older_than_days: int) -> int:
+        """Delete read agent messages older than older_than_days."""
+        async with self.transaction():
+            cursor = await self.execute(
+                "DELETE FROM agent_messages WHERE read = 1 AND created_at < datetime('now', ?)",
+                (f"-{older_than_days} days",),
+            )
+        return cursor.rowcount
+
+    async def purge_approvals(self, older_than_days: int) -> int:
+        """Delete resolved approvals older than older_than_days."""
+        async with self.transaction():
+            cursor = await self.execute(
+                """
+                DELETE FROM approvals
+                WHERE status != 'pending' AND COALESCE(resolved_at, created_at) < datetime('now', ?)
+                """,
+                (f"-{older_than_days} days",),
+            )
+        return cursor.rowcount
+
+    async def reclaim_space(self, max_pages: int) -> None:
+        """Return up to max_pages free pages to the filesystem and truncate the WAL.
+
+        A database created before incremental auto-vacuum was enabled is
+        converted first, which rewrites the whole file once.
+        """
+        if not self._conn:
+            raise RuntimeError("Database not connected")
+        await self.flush()
+        async with self._conn.execute("PRAGMA auto_vacuum") as cursor:
+            mode = (await cursor.fetchone())[0]
+        if mode != 2:  # INCREMENTAL
+            logger.info("Enabling incremental vacuum; rewriting %s once", self.db_path)
+            await self._conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            await self._conn.execute("VACUUM")
+        # Pages are freed as the pragma is stepped, so read it to the end
+        async with self._conn.execute(f"PRAGMA incremental_vacuum({max_pages})") as cursor:
+            await cursor.fetchall()
+        await self._conn.commit()
+        await self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
     # Approval operations
     async def create_approval(
         self,
@@ -390,17 +984,26 @@ class Database:
     async def get_pending_approvals(self, agent_id: str | None = None) -> list[dict[str, Any]]:
         """Get pending approvals."""
         if agent_id:
-            rows = await self.fetchall(
-                "SELECT * FROM approvals WHERE status = 'pending' AND agent_id = ? ORDER BY created_at ASC",
-                (agent_id,),
-            )
+            rows = await self.fetchall(_PENDING_APPROVALS_FOR_AGENT, (agent_id,))
         else:
-            rows = await self.fetchall("SELECT * FROM approvals WHERE status = 'pending' ORDER BY created_at ASC")
+            rows = await self.fetchall(_PENDING_APPROVALS)
         for row in rows:
             if row.get("action_details"):
                 row["action_details"] = json.loads(row["action_details"])
         return rows
 
+    async def expire_pending_approvals(self) -> int:
+        """Time out every pending approval, returning how many were expired."""
+        cursor = await self.execute(
+            """
+            UPDATE approvals
+            SET status = 'timeout', resolved_at = datetime('now'), resolved_by = 'system'
+            WHERE status = 'pending'
+            """
+        )
+        await self.commit()
+        return cursor.rowcount
+
     async def resolve_approval(self, approval_id: str, status: str, resolved_by: str) -> None:
         """Resolve an approval request."""
         await self.execute(
@@ -476,13 +1079,37 @@ class Database:
         )
         await self.commit()
 
+    async def send_agent_messages(self, messages: list[dict[str, Any]]) -> None:
+        """Insert several agent messages in one transaction.
+
+        Each message has the keyword arguments of send_agent_message.
+        """
+        if not messages:
+            return
+        async with self.transaction():
+            await self.executemany(
+                """
+                INSERT INTO agent_messages (id, from_agent, to_agent, task_id, message_type, content, metadata)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        m["message_id"],
+                        m.get("from_agent"),
+                        m.get("to_agent"),
+                        m.get("task_id"),
+                        m["message_type"],
+                        m["content"],
+                        json.dumps(m["metadata"]) if m.get("metadata") else None,
+                    )
+                    for m in messages
+                ],
+            )
+
     async def get_agent_messages(self, agent_id: str, unread_only: bool = False) -> list[dict[str, Any]]:
         """Get messages for an agent."""
         if unread_only:
-            rows = await self.fetchall(
-                "SELECT * FROM agent_messages WHERE to_agent = ? AND read = 0 ORDER BY created_at ASC",
-                (agent_id,),
-            )
+            rows = await self.fetchall(_UNREAD_AGENT_MESSAGES, (agent_id,))
         else:
             rows = await self.fetchall(
                 "SELECT * FROM agent_messages WHERE to_agent = ? ORDER BY created_at ASC",
@@ -495,30 +1122,90 @@ class Database:
 
     async def mark_message_read(self, message_id: str) -> None:
         """Mark a message as read."""
-        await self.execute("UPDATE agent_messages SET read = 1 WHERE id = ?", (message_id,))
-        await self.commit()
+        await self.mark_messages_read([message_id])
+
+    async def mark_messages_read(self, message_ids: list[str]) -> None:
+        """Mark several messages as read in one statement."""
+        if not message_ids:
+            return
+        placeholders = ", ".join("?" * len(message_ids))
+        await self.execute(f"UPDATE agent_messages SET read = 1 WHERE id IN ({placeholders})", tuple(message_ids))
+        await self._commit_write()
 
     # Shared context operations
-    async def set_shared_context(self, task_id: str, key: str, value: Any, updated_by: str) -> None:
-        """Set a shared context value."""
-        await self.execute(
+    async def set_shared_context(self, task_id: str, key: str, value: Any, updated_by: str) -> int:
+        """Set a shared context value.
+
+        Returns:
+            The key's new version (1 for a new key)
+        """
+        row = await self.fetchone(
             """
             INSERT INTO shared_context (task_id, key, value, updated_by)
             VALUES (?, ?, ?, ?)
             ON CONFLICT(task_id, key) DO UPDATE SET
                 value = excluded.value,
+                version = shared_context.version + 1,
                 updated_by = excluded.updated_by,
                 updated_at = datetime('now')
+            RETURNING version
             """,
             (task_id, key, json.dumps(value), updated_by),
         )
         await self.commit()
+        return row["version"] if row else 1
+
+    async def compare_and_set_shared_context(
+        self, task_id: str, key: str, value: Any, updated_by: str, expected_version: int
+    ) -> int | None:
+        """Set a shared context value only if the key is still at expected_version.
+
+        A missing key is at version 0, so expected_version=0 creates the key
+        only if nobody else has.
+
+        Returns:
+            The key's new version, or None if the version did not match
+        """
+        if expected_version == 0:
+            sql = """
+                INSERT INTO shared_context (task_id, key, value, updated_by)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(task_id, key) DO NOTHING
+                RETURNING version
+            """
+            params: tuple[Any, ...] = (task_id, key, json.dumps(value), updated_by)
+        else:
+            sql = """
+                UPDATE shared_context
+                SET value = ?, version = version + 1, updated_by = ?, updated_at = datetime('now')
+                WHERE task_id = ? AND key = ? AND version = ?
+                RETURNING version
+            """
+            params = (json.dumps(value), updated_by, task_id, key, expected_version)
+        row = await self.fetchone(sql, params)
+        await self.commit()
+        return row["version"] if row else None
 
     async def get_shared_context(self, task_id: str) -> dict[str, Any]:
         """Get all shared context for a task."""
         rows = await self.fetchall("SELECT key, value FROM shared_context WHERE task_id = ?", (task_id,))
         return {row["key"]: json.loads(row["value"]) for row in rows}
 
+    async def get_shared_context_entries(self, task_id: str) -> dict[str, dict[str, Any]]:
+        """Get all shared context for a task with each key's version."""
+        rows = await self.fetchall("SELECT key, value, version FROM shared_context WHERE task_id = ?", (task_id,))
+        return {row["key"]: {"value": json.loads(row["value"]), "version": row["version"]} for row in rows}
+
+    async def get_shared_context_entry(self, task_id: str, key: str) -> dict[str, Any] | None:
+        """Get one shared context value and its version."""
+        row = await self.fetchone(
+            "SELECT value, version FROM shared_context WHERE task_id = ? AND key = ?",
+            (task_id, key),
+        )
+        if not row:
+            return None
+        return {"value": json.loads(row["value"]), "version": row["version"]}
+
     # Template operations
     async def save_template(
         self,
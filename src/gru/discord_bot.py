@@ -13,6 +13,8 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
+from gru.cgroups import format_resources
+
 if TYPE_CHECKING:
     from gru.config import Config
     from gru.orchestrator import Orchestrator
@@ -465,6 +467,8 @@ Default workdir: {self.config.default_workdir}"""
                     f"Workdir: {agent.get('workdir', 'N/A')}\n"
                     f"Created: {agent['created_at']}"
                 )
+                if agent.get("resources"):
+                    msg += f"\nResources: {format_resources(agent['resources'])}"
                 if agent.get("error"):
                     msg += f"\nError: {agent['error']}"
                 await interaction.response.send_message(msg)
@@ -633,13 +637,13 @@ Default workdir: {self.config.default_workdir}"""
                 return
 
             resolved_id = self._resolve_agent_ref(agent_id) or agent_id
-            conversation = await self.orchestrator.db.get_conversation(resolved_id)
+            conversation = await self.orchestrator.db.get_conversation(resolved_id, limit=20)
 
             if not conversation:
                 await interaction.response.send_message(f"No logs found for agent {resolved_id}", ephemeral=True)
                 return
 
-            lines = [self._format_log_entry(msg) for msg in conversation[-20:]]
+            lines = [self._format_log_entry(msg) for msg in conversation]
             output = "\n\n".join(lines)
             await interaction.response.defer()
             if interaction.channel:
@@ -661,8 +665,9 @@ Default workdir: {self.config.default_workdir}"""
             for a in results[:10]:
                 display = self._get_agent_display(a["id"])
                 status = a["status"]
-                task = a["task"][:200] + "..." if len(a["task"]) > 200 else a["task"]
-                lines.append(f"{display} [{status}] {task}")
+                text = a.get("snippet") or a["task"]
+                text = text[:200] + "..." if len(text) > 200 else text
+                lines.append(f"{display} [{status}] {text}")
 
             await interaction.response.send_message("\n".join(lines))
 
@@ -1028,6 +1033,8 @@ Default workdir: {self.config.default_workdir}"""
                     f"Workdir: {agent_info.get('workdir', 'N/A')}\n"
                     f"Created: {agent_info['created_at']}"
                 )
+                if agent_info.get("resources"):
+                    msg += f"\nResources: {format_resources(agent_info['resources'])}"
                 if agent_info.get("error"):
                     msg += f"\nError: {agent_info['error']}"
                 return msg
@@ -1133,6 +1140,7 @@ Default workdir: {self.config.default_workdir}"""
                 system=system_prompt,
                 max_tokens=1000,
                 tools=tools,
+                priority="high",  # Someone is waiting on the reply
             )
 
             if response.tool_uses:
@@ -1149,7 +1157,7 @@ Default workdir: {self.config.default_workdir}"""
         """Build system prompt and context for natural language chat."""
         status = await self.orchestrator.get_status()
         pending = await self.orchestrator.get_pending_approvals()
-        recent_agents = await self.orchestrator.list_agents()
+        recent_agents = await self.orchestrator.list_agents(limit=5)
 
         lines = [
             "Current Gru State:",
@@ -1162,7 +1170,7 @@ Default workdir: {self.config.default_workdir}"""
             "Recent agents:",
         ]
 
-        for a in recent_agents[:5]:
+        for a in recent_agents:
             lines.append(f"  - {a['id']} [{a['status']}]: {a['task'][:200]}...")
             if a.get("workdir"):
                 lines.append(f"    workdir: {a['workdir']}")
@@ -17,6 +17,7 @@ from gru.crypto import CryptoManager, SecretStore
 from gru.db import Database
 from gru.discord_bot import DiscordBot
 from gru.orchestrator import Orchestrator
+from gru.retention import RetentionWorker
 from gru.slack_bot import SlackBot
 from gru.telegram_bot import TelegramBot
 from gru.webhook import WebhookServer
@@ -85,7 +86,14 @@ def setup_git_credentials() -> None:
 async def run_server(config: Config) -> None:
     """Run the Gru server."""
     # Initialize database
-    db = Database(config.db_path)
+    db = Database(
+        config.db_path,
+        group_commit=config.db_group_commit,
+        commit_interval=config.db_commit_interval_ms / 1000,
+        commit_max_statements=config.db_commit_max_statements,
+        read_connections=config.db_read_connections,
+        index_conversations=config.index_conversations,
+    )
     await db.connect()
 
     # Initialize crypto
@@ -123,6 +131,8 @@ async def run_server(config: Config) -> None:
     # Initialize webhook server
     webhook_server = WebhookServer(config, orchestrator)
 
+    retention = RetentionWorker(db, config.retention_days, config.retention_interval)
+
     # Set up signal handlers
     loop = asyncio.get_running_loop()
     shutdown_event = asyncio.Event()
@@ -165,14 +175,23 @@ async def run_server(config: Config) -> None:
         logger.info("Gru server started")
         logger.info("Data directory: %s", config.data_dir)
 
+        # Resume work left unfinished by a previous run
+        if config.recover_tasks:
+            await orchestrator.recover_tasks()
+
         # Start orchestrator in background
         asyncio.create_task(orchestrator.start())
 
+        if config.retention_days > 0:
+            await retention.start()
+            logger.info("Retention: archiving after %d days", config.retention_days)
+
         # Wait for shutdown signal
         await shutdown_event.wait()
 
     finally:
         logger.info("Shutting down...")
+        await retention.stop()
         await webhook_server.stop()
         await orchestrator.mcp.stop_all()
         await orchestrator.stop()
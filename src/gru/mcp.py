@@ -3,17 +3,21 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
 import json
 import logging
 import os
-import subprocess
 from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Any
 
 from gru.claude import ToolDefinition
 
 logger = logging.getLogger(__name__)
 
+REQUEST_TIMEOUT = 30  # seconds to wait for a response
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024  # longest JSON-RPC line read from a server
+
 
 @dataclass
 class MCPServer:
@@ -23,10 +27,11 @@ class MCPServer:
     command: str
     args: list[str] = field(default_factory=list)
     env: dict[str, str] = field(default_factory=dict)
-    process: subprocess.Popen | None = None
+    process: asyncio.subprocess.Process | None = None
     tools: list[ToolDefinition] = field(default_factory=list)
     _request_id: int = 0
-    _lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    _pending: dict[int, asyncio.Future[dict[str, Any]]] = field(default_factory=dict)  # Requests by id
+    _tasks: list[asyncio.Task[None]] = field(default_factory=list)  # Output readers of the process
 
     def _next_id(self) -> int:
         self._request_id += 1
@@ -34,13 +39,22 @@ class MCPServer:
 
 
 class MCPClient:
-    """Client for managing MCP server connections."""
+    """Client for managing MCP server connections.
+
+    Each server runs as an asyncio subprocess speaking JSON-RPC over stdio.
+    A reader task per server resolves requests by id as their responses
+    arrive, so any number of requests (from any number of agents) can be in
+    flight at once and answered in any order. Notifications and requests
+    from the server are handled in between; a request whose caller gives up
+    is cancelled on the server with notifications/cancelled.
+    """
 
     def __init__(self, config_path: Path | None = None) -> None:
         self.config_path = config_path
         self.servers: dict[str, MCPServer] = {}
         self._all_tools: list[ToolDefinition] = []
         self._tool_to_server: dict[str, str] = {}
+        self.tools_version = 0  # Incremented whenever the tool list changes
 
     async def load_config(self, config_path: Path | None = None) -> None:
         """Load MCP server configurations from JSON file."""
@@ -75,15 +89,19 @@ class MCPClient:
             env.update(server.env)
 
             # Start process
-            server.process = subprocess.Popen(
-                [server.command] + server.args,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+            server.process = await asyncio.create_subprocess_exec(
+                server.command,
+                *server.args,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
                 env=env,
-                text=True,
-                bufsize=1,
+                limit=MAX_MESSAGE_BYTES,
             )
+            server._tasks = [
+                asyncio.create_task(self._read_messages(server, server.process)),
+                asyncio.create_task(self._log_stderr(server, server.process)),
+            ]
 
             # Initialize connection
             init_response = await self._send_request(
@@ -97,6 +115,7 @@ class MCPClient:
             )
 
             if not init_response:
+                await self.stop_server(server)
                 return False
 
             # Send initialized notification
@@ -114,6 +133,7 @@ class MCPClient:
                     server.tools.append(tool_def)
                     self._all_tools.append(tool_def)
                     self._tool_to_server[tool_def.name] = server.name
+                self.tools_version += 1
 
             logger.info(f"MCP server '{server.name}' started with {len(server.tools)} tools")
             return True
@@ -132,62 +152,121 @@ class MCPClient:
 
     async def stop_server(self, server: MCPServer) -> None:
         """Stop an MCP server."""
-        if server.process:
+        process, server.process = server.process, None
+        if process:
             try:
-                server.process.terminate()
-                server.process.wait(timeout=5)
-            except (subprocess.TimeoutExpired, OSError):
+                process.terminate()
+                await asyncio.wait_for(process.wait(), timeout=5)
+            except asyncio.TimeoutError:
                 # Force kill if graceful shutdown fails
-                server.process.kill()
-            server.process = None
+                process.kill()
+                await process.wait()
+            except ProcessLookupError:
+                pass  # Already exited
+        for task in server._tasks:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        server._tasks = []
 
     async def stop_all(self) -> None:
         """Stop all MCP servers."""
         for server in self.servers.values():
             await self.stop_server(server)
 
-    async def _send_request(self, server: MCPServer, method: str, params: dict) -> dict | None:
-        """Send a JSON-RPC request to an MCP server."""
+    def _write(self, server: MCPServer, message: dict[str, Any]) -> None:
+        """Queue one JSON-RPC message on a server's stdin."""
+        if not server.process or not server.process.stdin:
+            raise ConnectionError(f"MCP server not running: {server.name}")
+        server.process.stdin.write(json.dumps(message).encode() + b"\n")
+
+    async def _read_messages(self, server: MCPServer, process: asyncio.subprocess.Process) -> None:
+        """Route a server's responses to their requests until its output closes."""
+        assert process.stdout
+        try:
+            while True:
+                try:
+                    line = await process.stdout.readline()
+                except ValueError:
+                    logger.error(f"MCP server '{server.name}' sent a message over {MAX_MESSAGE_BYTES} bytes")
+                    continue
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.debug(f"MCP server '{server.name}': {line.decode(errors='replace').rstrip()}")
+                    continue
+                if not isinstance(message, dict):
+                    continue
+
+                if "method" not in message:
+                    future = server._pending.get(message.get("id"))  # type: ignore[arg-type]
+                    if future and not future.done():
+                        future.set_result(message)
+                elif "id" in message:
+                    # Server requests (sampling, roots, ...) aren't supported
+                    error = {"code": -32601, "message": f"Method not found: {message['method']}"}
+                    with contextlib.suppress(ConnectionError):
+                        self._write(server, {"jsonrpc": "2.0", "id": message["id"], "error": error})
+                else:
+                    logger.debug(f"MCP server '{server.name}' notification: {message['method']}")
+        finally:
+            for future in server._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"MCP server '{server.name}' closed its output"))
+
+    async def _log_stderr(self, server: MCPServer, process: asyncio.subprocess.Process) -> None:
+        """Drain a server's stderr into the log, so a chatty server never blocks on a full pipe."""
+        assert process.stderr
+        while chunk := await process.stderr.read(65536):
+            logger.debug(f"MCP server '{server.name}' stderr: {chunk.decode(errors='replace').rstrip()}")
+
+    async def _send_request(
+        self, server: MCPServer, method: str, params: dict, timeout: float = REQUEST_TIMEOUT
+    ) -> dict | None:
+        """Send a JSON-RPC request to an MCP server and wait for its response.
+
+        Returns the result, or None if the request failed or timed out.
+        """
         if not server.process or not server.process.stdin or not server.process.stdout:
             return None
 
-        async with server._lock:
-            try:
-                request = {
-                    "jsonrpc": "2.0",
-                    "id": server._next_id(),
-                    "method": method,
-                    "params": params,
-                }
-
-                # Send request
-                request_str = json.dumps(request) + "\n"
-                server.process.stdin.write(request_str)
-                server.process.stdin.flush()
-
-                # Read response (with timeout)
-                loop = asyncio.get_running_loop()
-                response_str = await asyncio.wait_for(
-                    loop.run_in_executor(None, server.process.stdout.readline),
-                    timeout=30,
-                )
-
-                if not response_str:
-                    return None
-
-                response = json.loads(response_str)
-                if "error" in response:
-                    logger.error(f"MCP error: {response['error']}")
-                    return None
-
-                return response.get("result", {})
+        request_id = server._next_id()
+        future: asyncio.Future[dict[str, Any]] = asyncio.get_running_loop().create_future()
+        server._pending[request_id] = future
+        try:
+            self._write(server, {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params})
+            await server.process.stdin.drain()
+            response = await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"MCP request timeout: {method}")
+            self._cancel_request(server, request_id, "Request timed out")
+            return None
+        except asyncio.CancelledError:
+            self._cancel_request(server, request_id, "Request cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"MCP request error: {e}")
+            return None
+        finally:
+            server._pending.pop(request_id, None)
 
-            except asyncio.TimeoutError:
-                logger.warning(f"MCP request timeout: {method}")
-                return None
-            except Exception as e:
-                logger.error(f"MCP request error: {e}")
-                return None
+        if "error" in response:
+            logger.error(f"MCP error: {response['error']}")
+            return None
+
+        return response.get("result", {})
+
+    def _cancel_request(self, server: MCPServer, request_id: int, reason: str) -> None:
+        """Tell a server to stop working on a request nobody is waiting for."""
+        notification = {
+            "jsonrpc": "2.0",
+            "method": "notifications/cancelled",
+            "params": {"requestId": request_id, "reason": reason},
+        }
+        with contextlib.suppress(ConnectionError, RuntimeError):
+            self._write(server, notification)
 
     async def _send_notification(self, server: MCPServer, method: str, params: dict) -> None:
         """Send a JSON-RPC notification (no response expected)."""
@@ -195,16 +274,8 @@ class MCPClient:
             return
 
         try:
-            notification = {
-                "jsonrpc": "2.0",
-                "method": method,
-                "params": params,
-            }
-
-            notification_str = json.dumps(notification) + "\n"
-            server.process.stdin.write(notification_str)
-            server.process.stdin.flush()
-
+            self._write(server, {"jsonrpc": "2.0", "method": method, "params": params})
+            await server.process.stdin.drain()
         except Exception as e:
             logger.error(f"MCP notification error: {e}")
 
@@ -248,6 +319,10 @@ class MCPClient:
         """Get all tools from all connected MCP servers."""
         return self._all_tools.copy()
 
+    def get_server_name(self, tool_name: str) -> str | None:
+        """Get the name of the server that provides a tool."""
+        return self._tool_to_server.get(tool_name)
+
     def is_mcp_tool(self, tool_name: str) -> bool:
         """Check if a tool name is an MCP tool."""
         return tool_name in self._tool_to_server
@@ -256,7 +331,7 @@ class MCPClient:
         """Check if a server process is still running."""
         if not server.process:
             return False
-        return server.process.poll() is None
+        return server.process.returncode is None
 
     async def health_check(self) -> dict[str, bool]:
         """Check health of all MCP servers.
@@ -286,10 +361,11 @@ class MCPClient:
         logger.info(f"Restarting MCP server: {server_name}")
 
         # Remove old tools from registry
-        old_tools = [t.name for t in server.tools]
+        old_tools = {t.name for t in server.tools}
         for tool_name in old_tools:
             self._tool_to_server.pop(tool_name, None)
-            self._all_tools = [t for t in self._all_tools if t.name != tool_name]
+        self._all_tools = [t for t in self._all_tools if t.name not in old_tools]
+        self.tools_version += 1
 
         # Clear server tools
         server.tools = []
@@ -7,19 +7,33 @@ import contextlib
 import glob as glob_module
 import json
 import logging
-import subprocess
 import uuid
-from collections.abc import Callable
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import TYPE_CHECKING, Any
 
 import anthropic
 
-from gru.claude import DEFAULT_TOOLS, ClaudeClient, Response, ToolResult
+from gru.cgroups import create_agent_cgroup, read_usage, remove_agent_cgroup, wrap_command
+from gru.claude import (
+    DEFAULT_TOOLS,
+    ClaudeClient,
+    Response,
+    StreamInterruptedError,
+    ToolRegistry,
+    ToolResult,
+    ToolSet,
+    ToolUse,
+)
+from gru.context import ContextWindow
 from gru.coordinator import Coordinator
 from gru.mcp import MCPClient
-from gru.scheduler import Scheduler
+from gru.pricing import usage_cost
+from gru.routing import ModelRouter, RouteDecision
+from gru.scheduler import QueuedTask, Scheduler, parse_db_timestamp
+from gru.shell import run_shell
 from gru.worktree import (
     WorktreeInfo,
     cleanup_worktree,
@@ -27,6 +41,7 @@ from gru.worktree import (
     create_worktree,
     get_repo_root,
     is_git_repo,
+    restore_worktree,
 )
 
 if TYPE_CHECKING:
@@ -43,19 +58,74 @@ IMPORTANT: You must USE the available tools to complete tasks. Do not just expla
 Working directory: {workdir}
 
 Available tools:
-- write_file: Create or overwrite files
-- read_file: Read file contents
-- bash: Execute shell commands
-- search_files: Find files by pattern
+{tools}
 
 When given a task:
-1. Use write_file to create the necessary files
-2. Use bash to run commands (install dependencies, test code, etc.)
-3. Report the result with any relevant output (URLs, file paths, etc.)
+{steps}
 
 Always create files in the working directory unless specified otherwise.
 Do not ask for confirmation - just execute the task."""
 
+# Tools described in the default system prompt, and the steps that use them (None: always listed)
+PROMPT_TOOLS = {
+    "write_file": "Create or overwrite files",
+    "read_file": "Read file contents",
+    "bash": "Execute shell commands",
+    "search_files": "Find files by pattern",
+}
+PROMPT_STEPS = [
+    ("write_file", "Use write_file to create the necessary files"),
+    ("bash", "Use bash to run commands (install dependencies, test code, etc.)"),
+    (None, "Report the result with any relevant output (URLs, file paths, etc.)"),
+]
+
+
+def _agent_system_prompt(workdir: str, tools: frozenset[str] | None) -> str:
+    """Fill in the default system prompt, listing only the tools an agent may use."""
+    tool_lines = [f"- {name}: {text}" for name, text in PROMPT_TOOLS.items() if tools is None or name in tools]
+    if tools is not None:
+        tool_lines += [f"- {name}" for name in sorted(tools - PROMPT_TOOLS.keys())]
+    steps = [text for name, text in PROMPT_STEPS if name is None or tools is None or name in tools]
+    return DEFAULT_AGENT_SYSTEM.format(
+        workdir=workdir,
+        tools="\n".join(tool_lines),
+        steps="\n".join(f"{i}. {text}" for i, text in enumerate(steps, 1)),
+    )
+
+
+# Tool resources: a file path, every file in the workdir, or everything
+WORKDIR_FILES = ("files",)
+ALL_RESOURCES = ("*",)
+
+
+def _resources_overlap(a: frozenset[tuple[str, ...]], b: frozenset[tuple[str, ...]]) -> bool:
+    """Check whether two sets of tool resources share anything."""
+    for x in a:
+        for y in b:
+            if x == y or ALL_RESOURCES in (x, y):
+                return True
+            if {x[0], y[0]} == {"file", WORKDIR_FILES[0]}:
+                return True
+    return False
+
+
+@dataclass(frozen=True)
+class ToolAccess:
+    """Resources a tool call reads and writes.
+
+    Two calls conflict when one writes something the other reads or writes;
+    conflicting calls run in request order, everything else runs concurrently.
+    """
+
+    reads: frozenset[tuple[str, ...]] = frozenset()
+    writes: frozenset[tuple[str, ...]] = frozenset()
+
+    def conflicts_with(self, other: ToolAccess) -> bool:
+        """Check whether this call must not overlap with another."""
+        return _resources_overlap(self.writes, other.reads | other.writes) or _resources_overlap(
+            other.writes, self.reads
+        )
+
 
 def friendly_error(error: Exception) -> str:
     """Convert technical errors to plain English."""
@@ -117,9 +187,24 @@ class Agent:
         self._turns_since_tool: int = 0  # Track turns without tool calls for stuck detection
         self._total_input_tokens: int = 0
         self._total_output_tokens: int = 0
+        self._total_cache_read_tokens: int = 0
+        self._total_cache_creation_tokens: int = 0
+        self._total_cost: float = 0.0
+        self._routed_turns: int = 0  # Turns sent to a model other than self.model
+        self._routing_savings: float = 0.0  # USD saved by routed turns, net of escalations
         self._token_alert_sent: bool = False
         self._stuck_alert_sent: bool = False
         self.live_output: bool = False  # Stream output to chat in real-time
+        self.bash_timeout: int | None = None  # Overrides config.bash_timeout
+        self.cgroup_path: Path | None = None  # cgroup v2 limiting this agent's processes
+        self.resumed: bool = False  # Messages were restored from a previous run
+        self.context_window: ContextWindow | None = None  # Token budget for messages sent to Claude
+        self.priority: str = "normal"  # Order in the shared Claude rate limit
+        self.tools: frozenset[str] | None = None  # Tools the agent may use; None for all
+
+    def may_use(self, tool_name: str) -> bool:
+        """Check a tool is in the agent's allow-list."""
+        return self.tools is None or tool_name in self.tools
 
     def cancel(self) -> None:
         """Mark agent as cancelled."""
@@ -181,15 +266,32 @@ class Agent:
         """Check if agent appears stuck (no tool calls for threshold turns)."""
         return threshold > 0 and self._turns_since_tool >= threshold
 
-    def add_tokens(self, input_tokens: int, output_tokens: int) -> None:
-        """Add token usage."""
+    def add_tokens(
+        self,
+        input_tokens: int,
+        output_tokens: int,
+        cache_read_tokens: int = 0,
+        cache_creation_tokens: int = 0,
+        cost: float | None = None,
+    ) -> None:
+        """Add token usage and its cost (estimated at the agent's model if not given)."""
         self._total_input_tokens += input_tokens
         self._total_output_tokens += output_tokens
+        self._total_cache_read_tokens += cache_read_tokens
+        self._total_cache_creation_tokens += cache_creation_tokens
+        if cost is None:
+            cost = usage_cost(self.model, input_tokens, output_tokens, cache_read_tokens, cache_creation_tokens)
+        self._total_cost += cost
 
     @property
     def total_tokens(self) -> int:
-        """Get total tokens used."""
-        return self._total_input_tokens + self._total_output_tokens
+        """Get total tokens used, including prompt-cache reads and writes."""
+        return (
+            self._total_input_tokens
+            + self._total_output_tokens
+            + self._total_cache_read_tokens
+            + self._total_cache_creation_tokens
+        )
 
     def should_alert_token_burn(self, threshold: int) -> bool:
         """Check if token usage exceeds threshold and alert not yet sent."""
@@ -224,6 +326,8 @@ class Agent:
 
         summary = f"[{bar}] ~{estimated_progress}%\n"
         summary += f"Turn {self._turn_count} | {runtime_mins}m | {self.total_tokens:,} tokens"
+        if self._routed_turns:
+            summary += f" | {self._routed_turns} routed turns, ~${self._routing_savings:.4f} saved"
 
         if self._recent_tools:
             recent = self._recent_tools[-3:]  # Last 3 tool calls
@@ -245,15 +349,28 @@ class Orchestrator:
         self.db = db
         self.secrets = secrets
         self.claude = ClaudeClient(config)
-        self.scheduler = Scheduler(db, config.max_concurrent_agents)
+        self.scheduler = Scheduler(
+            db,
+            config.max_concurrent_agents,
+            starvation_threshold=config.starvation_threshold,
+            cycle_seconds=config.scheduler_interval,
+            max_batched=config.batch_max_agents if config.batch_mode else 0,
+        )
         self.coordinator = Coordinator(db)
         self.mcp = MCPClient(mcp_config_path)
+        self.tools = ToolRegistry(DEFAULT_TOOLS, self.mcp)
+        self.router = ModelRouter(config.fast_model)
         self._agents: dict[str, Agent] = {}
         self._running = False
+        self._suspending = False  # Set while stop() hands running agents over to the next start
         self._notify_callback: Callable[[str, str], None] | None = None
         self._approval_callback: Callable[[str, dict], asyncio.Future] | None = None
         self._cancel_approval_callback: Callable[[str], Any] | None = None
 
+    def set_model_router(self, router: ModelRouter) -> None:
+        """Replace the policy choosing each turn's model."""
+        self.router = router
+
     def set_notify_callback(self, callback: Callable[[str, str], None]) -> None:
         """Set callback for notifications."""
         self._notify_callback = callback
@@ -266,74 +383,21 @@ class Orchestrator:
         """Set callback for cancelling approval requests on timeout."""
         self._cancel_approval_callback = callback
 
-    def _truncate_conversation(self, messages: list[dict]) -> list[dict]:
-        """Truncate conversation to max length, preserving tool_use/tool_result pairs."""
-        max_messages = self.config.max_conversation_messages
-        if len(messages) <= max_messages:
-            return messages
-
-        # Find a safe truncation point that doesn't break tool pairs
-        # We need to keep messages from a point where there are no orphaned tool_results
-        keep_recent = max_messages - 2  # Reserve space for first msg + truncation notice
-
-        # Start from the candidate truncation point and scan forward
-        # to find a safe boundary (no tool_result without its tool_use)
-        candidate_start = len(messages) - keep_recent
-
-        # Collect tool_use_ids in the kept portion
-        def get_tool_use_ids(msg: dict) -> set[str]:
-            """Extract tool_use_ids from an assistant message."""
-            ids = set()
-            content = msg.get("content", [])
-            if isinstance(content, list):
-                for block in content:
-                    if isinstance(block, dict) and block.get("type") == "tool_use":
-                        ids.add(block.get("id", ""))
-            return ids
-
-        def get_tool_result_ids(msg: dict) -> set[str]:
-            """Extract tool_use_ids referenced in tool_results."""
-            ids = set()
-            content = msg.get("content", [])
-            if isinstance(content, list):
-                for block in content:
-                    if isinstance(block, dict) and block.get("type") == "tool_result":
-                        ids.add(block.get("tool_use_id", ""))
-            return ids
-
-        # Move start forward until we have a clean boundary
-        while candidate_start < len(messages) - 1:
-            kept_messages = messages[candidate_start:]
-            # Collect all tool_use_ids in kept assistant messages
-            tool_use_ids = set()
-            for msg in kept_messages:
-                if msg.get("role") == "assistant":
-                    tool_use_ids.update(get_tool_use_ids(msg))
-
-            # Check all tool_results reference a kept tool_use
-            valid = True
-            for msg in kept_messages:
-                if msg.get("role") == "user":
-                    result_ids = get_tool_result_ids(msg)
-                    if result_ids and not result_ids.issubset(tool_use_ids):
-                        valid = False
-                        break
-
-            if valid:
-                break
-            candidate_start += 1
-
-        truncated = [messages[0]]
-        removed_count = candidate_start - 1
-        if removed_count > 0:
-            truncated.append(
-                {
-                    "role": "user",
-                    "content": f"[Earlier conversation truncated. {removed_count} messages removed.]",
-                }
-            )
-        truncated.extend(messages[candidate_start:])
-        return truncated
+    def _new_context_window(self) -> ContextWindow:
+        """Create a context window sized from config."""
+        return ContextWindow(
+            self.config.context_token_budget,
+            self.config.max_conversation_messages,
+            summarize=self.config.context_summary,
+        )
+
+    def _truncate_conversation(self, messages: list[dict], window: ContextWindow | None = None) -> list[dict]:
+        """Trim a conversation to the context budget, preserving tool_use/tool_result pairs.
+
+        Pass the agent's window to reuse its token estimates and keep the cut
+        stable across turns; without one the conversation is indexed from scratch.
+        """
+        return (window or self._new_context_window()).build(messages)
 
     async def notify(self, agent_id: str, message: str) -> None:
         """Send a notification."""
@@ -343,20 +407,46 @@ class Orchestrator:
             except Exception as e:
                 logger.error(f"Notify error: {e}")
 
+    def _uses_batches(self, agent: Agent) -> bool:
+        """Whether an agent's turns go through Message Batches.
+
+        Only low-priority and oneshot (unsupervised, auto-timeout) agents
+        qualify: nobody waits on them turn by turn. Live output needs
+        streaming, so it keeps an agent interactive.
+        """
+        if not self.config.batch_mode or agent.live_output:
+            return False
+        return agent.priority == "low" or (not agent.supervised and agent.timeout_mode == "auto")
+
     def _estimate_cost(self, agent: Agent) -> str:
-        """Estimate cost for an agent based on token usage and model."""
-        # Pricing per 1M tokens (as of 2024)
-        pricing = {
-            "claude-sonnet-4-20250514": {"input": 3.0, "output": 15.0},
-            "claude-opus-4-20250514": {"input": 15.0, "output": 75.0},
-            "claude-3-5-sonnet-20241022": {"input": 3.0, "output": 15.0},
-            "claude-3-opus-20240229": {"input": 15.0, "output": 75.0},
-            "claude-3-haiku-20240307": {"input": 0.25, "output": 1.25},
-        }
-        rates = pricing.get(agent.model, {"input": 3.0, "output": 15.0})
-        input_cost = (agent._total_input_tokens / 1_000_000) * rates["input"]
-        output_cost = (agent._total_output_tokens / 1_000_000) * rates["output"]
-        return f"{input_cost + output_cost:.4f}"
+        """Estimated cost of an agent's turns so far, each priced at the model that ran it."""
+        return f"{agent._total_cost:.4f}"
+
+    async def _record_usage(
+        self, agent: Agent, decision: RouteDecision, usage: dict[str, int], discarded: bool = False
+    ) -> None:
+        """Add a turn's tokens and cost to the agent, with the savings if it was routed.
+
+        Savings compare the cost at the agent's own model for the same
+        tokens; a routed turn that was discarded and rerun saved nothing and
+        counts its whole cost against them.
+        """
+        tokens = (
+            usage["input_tokens"],
+            usage["output_tokens"],
+            usage.get("cache_read_input_tokens", 0),
+            usage.get("cache_creation_input_tokens", 0),
+        )
+        batched = self._uses_batches(agent)
+        cost = usage_cost(decision.model, *tokens, batched=batched)
+        routed = decision.model != agent.model
+        saved = 0.0
+        if routed:
+            saved = -cost if discarded else usage_cost(agent.model, *tokens, batched=batched) - cost
+            agent._routed_turns += 1
+            agent._routing_savings += saved
+        agent.add_tokens(*tokens, cost=cost)
+        await self.db.add_tokens(agent.id, *tokens, cost=cost, routed_turns=int(routed), routing_savings=saved)
 
     async def spawn_agent(
         self,
@@ -370,8 +460,16 @@ class Orchestrator:
         deadline: str | None = None,
         workdir: str | None = None,
         live_output: bool = False,
+        bash_timeout: int | None = None,
+        memory_limit: str | None = None,
+        cpu_quota: int | None = None,
+        tools: list[str] | None = None,
     ) -> dict[str, Any]:
-        """Spawn a new agent."""
+        """Spawn a new agent.
+
+        tools limits the agent to the named tools, so requests don't carry
+        schemas it will never use; by default it gets every tool.
+        """
         # Validate task length
         if len(task) > self.config.max_task_length:
             raise ValueError(f"Task too long: {len(task)} chars (max {self.config.max_task_length})")
@@ -379,6 +477,12 @@ class Orchestrator:
         if not task.strip():
             raise ValueError("Task cannot be empty")
 
+        if tools is not None:
+            # MCP tools (server__tool) may belong to servers that haven't started yet
+            unknown = {t for t in tools if "__" not in t} - {t.name for t in DEFAULT_TOOLS}
+            if unknown:
+                raise ValueError(f"Unknown tools: {', '.join(sorted(unknown))}")
+
         agent_id = str(uuid.uuid4())[:8]
         model = model or self.config.default_model
         workdir = workdir or str(self.config.default_workdir)
@@ -421,10 +525,14 @@ class Orchestrator:
             supervised=supervised,
             timeout_mode=timeout_mode,
             priority=priority,
+            memory_limit=memory_limit or self.config.default_memory_limit,
+            cpu_quota=cpu_quota if cpu_quota is not None else self.config.default_cpu_quota,
             workdir=workdir,
             worktree_path=worktree_path,
             worktree_branch=worktree_branch,
             base_repo=base_repo,
+            bash_timeout=bash_timeout,
+            tools=tools,
         )
 
         # Create task
@@ -448,6 +556,9 @@ class Orchestrator:
             worktree_info=worktree_info,
         )
         agent.live_output = live_output
+        agent.bash_timeout = bash_timeout
+        agent.priority = priority
+        agent.tools = frozenset(tools) if tools is not None else None
         self._agents[agent_id] = agent
 
         # Queue for execution
@@ -456,12 +567,17 @@ class Orchestrator:
         return agent_data
 
     async def get_agent(self, agent_id: str) -> dict[str, Any] | None:
-        """Get agent by ID."""
-        return await self.db.get_agent(agent_id)
-
-    async def list_agents(self, status: str | None = None) -> list[dict[str, Any]]:
-        """List agents."""
-        return await self.db.get_agents(status)
+        """Get agent by ID, with live cgroup usage under "resources" when limited."""
+        agent = await self.db.get_agent(agent_id)
+        if agent and agent.get("cgroup_path"):
+            usage = read_usage(Path(agent["cgroup_path"]))
+            if usage:
+                agent["resources"] = usage
+        return agent
+
+    async def list_agents(self, status: str | None = None, limit: int = 100) -> list[dict[str, Any]]:
+        """List agents, newest first."""
+        return await self.db.get_agents(status, limit)
 
     async def pause_agent(self, agent_id: str) -> bool:
         """Pause an agent."""
@@ -504,6 +620,20 @@ class Orchestrator:
             return True
         return False
 
+    async def _setup_agent_cgroup(self, agent: Agent, agent_data: dict[str, Any]) -> None:
+        """Create the agent's cgroup; the agent runs unlimited if that fails."""
+        try:
+            agent.cgroup_path = create_agent_cgroup(
+                self.config.cgroup_root,
+                agent.id,
+                agent_data.get("memory_limit") or self.config.default_memory_limit,
+                agent_data["cpu_quota"] if agent_data.get("cpu_quota") is not None else self.config.default_cpu_quota,
+            )
+        except RuntimeError as e:
+            logger.warning(f"Agent {agent.id} running without resource limits: {e}")
+            return
+        await self.db.update_agent(agent.id, cgroup_path=str(agent.cgroup_path))
+
     def _auto_push_agent(self, agent: Agent, message: str) -> tuple[bool, str]:
         """Auto commit and push agent's worktree if enabled."""
         if not self.config.auto_push:
@@ -560,10 +690,17 @@ class Orchestrator:
 
         # Use default agent system prompt if none provided
         if not system_prompt:
-            system_prompt = DEFAULT_AGENT_SYSTEM.format(workdir=agent.workdir)
+            system_prompt = _agent_system_prompt(agent.workdir, agent.tools)
 
-        agent.messages = [{"role": "user", "content": agent.task}]
-        await self.db.add_message(agent.id, "user", agent.task)
+        if not agent.resumed:
+            agent.messages = [{"role": "user", "content": agent.task}]
+            await self.db.add_message(agent.id, "user", agent.task)
+
+        agent.context_window = self._new_context_window()
+        await self.coordinator.open_mailbox(agent.id)
+
+        if self.config.enable_cgroups and agent_data:
+            await self._setup_agent_cgroup(agent, agent_data)
 
         try:
             while not agent.is_cancelled:
@@ -583,36 +720,41 @@ class Orchestrator:
                     await self.notify(agent.id, f"Progress: {summary}")
                     agent.mark_report_sent()
 
-                # Check for incoming messages from other agents
-                incoming = await self.coordinator.get_messages(agent.id, unread_only=True)
+                # Deliver messages other agents pushed to this agent's mailbox
+                incoming = await self.coordinator.receive(agent.id)
                 for msg in incoming:
-                    agent.messages.append(
-                        {
-                            "role": "user",
-                            "content": f"[Message from agent {msg['from_agent']}]: {msg['content']}",
-                        }
-                    )
-                    await self.coordinator.mark_read(msg["id"])
+                    content = self._format_agent_message(msg)
+                    agent.messages.append({"role": "user", "content": content})
+                    await self.db.add_message(agent.id, "user", content)
+                if incoming:
+                    await self.coordinator.mark_read(*(msg["id"] for msg in incoming))
 
                 # Truncate conversation if needed to prevent memory issues
-                truncated_messages = self._truncate_conversation(agent.messages)
+                truncated_messages = self._truncate_conversation(agent.messages, agent.context_window)
 
-                # Get response from Claude (include MCP tools)
-                all_tools = DEFAULT_TOOLS + self.mcp.get_all_tools()
+                # Get response from Claude (include MCP tools); tools start as their blocks arrive
+                tools = self.tools.tool_set(agent.tools)
+                decision = self.router.route(agent.model, truncated_messages)
                 try:
-                    response = await self.claude.send_message(
-                        messages=truncated_messages,
-                        system=system_prompt,
-                        model=agent.model,
-                        tools=all_tools,
+                    response, tool_results = await self._run_turn(
+                        agent, truncated_messages, system_prompt, tools, task_id, decision.model
                     )
+                    if self.router.should_escalate(decision, agent.model, response):
+                        # The routed model would stop here; let the agent's own model decide
+                        logger.info(f"Agent {agent.id}: escalating turn from {decision.model} to {agent.model}")
+                        await self._record_usage(agent, decision, response.usage, discarded=True)
+                        decision = RouteDecision(agent.model, "escalated")
+                        response, tool_results = await self._run_turn(
+                            agent, truncated_messages, system_prompt, tools, task_id, decision.model
+                        )
                 except anthropic.RateLimitError as e:
-                    await self.notify(agent.id, f"Rate limited: {e}. Retrying...")
+                    await self.notify(agent.id, f"Still rate limited after waiting: {e}")
                     raise
+                if decision.model != agent.model:
+                    logger.debug(f"Agent {agent.id}: turn sent to {decision.model} ({decision.reason})")
 
                 # Track token usage
-                agent.add_tokens(response.usage["input_tokens"], response.usage["output_tokens"])
-                await self.db.add_tokens(agent.id, response.usage["input_tokens"], response.usage["output_tokens"])
+                await self._record_usage(agent, decision, response.usage)
 
                 # Check for token burn alert
                 if agent.should_alert_token_burn(self.config.token_burn_alert):
@@ -624,7 +766,7 @@ class Orchestrator:
                 # Store assistant response
                 tool_use_data = None
                 if response.tool_uses:
-                    tool_use_data = [{"name": t.name, "input": t.input} for t in response.tool_uses]
+                    tool_use_data = [{"id": t.id, "name": t.name, "input": t.input} for t in response.tool_uses]
                 await self.db.add_message(
                     agent.id,
                     "assistant",
@@ -638,15 +780,6 @@ class Orchestrator:
                     break
 
                 if response.tool_uses:
-                    # Handle tool uses
-                    tool_results = await self._handle_tool_uses(agent, response, task_id)
-
-                    # Live output: send tool calls to chat
-                    if agent.live_output:
-                        for tu in response.tool_uses:
-                            summary = self._summarize_tool_input(tu.name, tu.input)
-                            await self.notify(agent.id, f"[{tu.name}] {summary}")
-
                     # Add assistant message and tool results to conversation
                     assistant_content: list[dict[str, Any]] = []
                     if response.content:
@@ -674,6 +807,12 @@ class Orchestrator:
                             }
                         )
                     agent.messages.append({"role": "user", "content": tool_result_content})
+                    await self.db.add_message(
+                        agent.id,
+                        "user",
+                        f"[{len(tool_result_content)} tool result(s)]",
+                        tool_result=tool_result_content,
+                    )
                 else:
                     # No tool uses - track for stuck detection
                     agent.increment_turns_since_tool()
@@ -718,59 +857,229 @@ class Orchestrator:
             await self.notify(agent.id, f"Agent {agent.id} failed: {error_msg}")
 
         finally:
-            # Auto-push changes before cleanup
-            task = agent.messages[0]["content"] if agent.messages else "Agent work"
-            self._auto_push_agent(agent, task[:100])
-            # Clean up worktree if present
-            self._cleanup_agent_worktree(agent)
+            if not self._suspending:
+                # Auto-push changes before cleanup
+                task = agent.messages[0]["content"] if agent.messages else "Agent work"
+                self._auto_push_agent(agent, task[:100])
+                # Clean up worktree if present; a suspended agent resumes in it
+                self._cleanup_agent_worktree(agent)
+            self.coordinator.close_mailbox(agent.id)
+            self.coordinator.forget_task(task_id)
+            # Removal polls until killed processes have left, so keep it off the event loop
+            if agent.cgroup_path and not await asyncio.to_thread(remove_agent_cgroup, agent.cgroup_path):
+                logger.warning(f"Could not remove cgroup {agent.cgroup_path}")
             self._agents.pop(agent.id, None)
             self.scheduler.unregister_running(task_id)
 
-    async def _handle_tool_uses(self, agent: Agent, response: Response, task_id: str) -> list[ToolResult]:
-        """Handle tool use requests from Claude."""
-        results = []
-
-        for tool_use in response.tool_uses:
-            # Check if approval needed
-            if agent.supervised and tool_use.name in ("bash", "write_file"):
-                approved = await self._request_approval(agent, tool_use.name, tool_use.input, task_id)
-                if not approved:
-                    results.append(
-                        ToolResult(
-                            tool_use_id=tool_use.id,
-                            content="Action rejected by user",
-                            is_error=True,
-                        )
+    async def _run_turn(
+        self,
+        agent: Agent,
+        messages: list[dict[str, Any]],
+        system_prompt: str,
+        tools: ToolSet,
+        task_id: str,
+        model: str,
+    ) -> tuple[Response, list[ToolResult]]:
+        """Get one response from model and run the tools it asks for.
+
+        When streaming, each tool is started as soon as its tool_use block is
+        complete, while the rest of the response is still generating. Tool
+        calls run concurrently unless they conflict (see ToolAccess), in which
+        case the later one waits for the earlier. Actions that need approval
+        are requested as soon as they arrive mid-stream; any still waiting
+        when the response is complete are sent as one batch. Results are
+        returned in the order Claude requested the tools. With live output
+        on, text is forwarded to chat a line at a time.
+
+        If the stream drops after tools were started, the turn ends there:
+        the text streamed so far and the tools already started make up the
+        response, and those tools' results are returned as usual.
+        """
+        pending: dict[str, asyncio.Task[ToolResult]] = {}
+        started: list[tuple[ToolAccess, asyncio.Task[ToolResult]]] = []
+        approvals: list[tuple[ToolUse, asyncio.Future[bool]]] = []
+        text_buffer = ""
+        batched = self._uses_batches(agent)
+        streaming = self.config.stream_turns and not batched
+
+        async def flush_text(final: bool = False) -> None:
+            nonlocal text_buffer
+            cut = len(text_buffer) if final else text_buffer.rfind("\n") + 1
+            chunk, text_buffer = text_buffer[:cut], text_buffer[cut:]
+            if chunk.strip():
+                await self.notify(agent.id, chunk.strip())
+
+        async def on_text(text: str) -> None:
+            nonlocal text_buffer
+            text_buffer += text
+            if "\n" in text:
+                await flush_text()
+
+        async def discard_text() -> None:
+            nonlocal text_buffer
+            text_buffer = ""
+
+        async def run_when_ready(
+            tool_use: ToolUse,
+            waits_on: set[asyncio.Task[ToolResult]],
+            approval: Awaitable[bool] | None,
+        ) -> ToolResult:
+            if approval is not None and not await approval:
+                return ToolResult(tool_use_id=tool_use.id, content="Action rejected by user", is_error=True)
+            if waits_on:
+                await asyncio.wait(waits_on)
+            return await self._handle_tool_use(agent, tool_use, task_id)
+
+        async def dispatch(tool_use: ToolUse) -> None:
+            if agent.live_output:
+                await flush_text(final=True)
+                summary = self._summarize_tool_input(tool_use.name, tool_use.input)
+                await self.notify(agent.id, f"[{tool_use.name}] {summary}")
+            access = self._tool_access(agent, tool_use)
+            waits_on = {task for earlier, task in started if access.conflicts_with(earlier)}
+            approval: Awaitable[bool] | None = None
+            needs_approval = tool_use.name in ("bash", "write_file") and agent.may_use(tool_use.name)
+            if agent.supervised and needs_approval and self._approval_callback:
+                if streaming:
+                    approval = asyncio.create_task(
+                        self._request_approval(agent, tool_use.name, tool_use.input, task_id)
                     )
-                    continue
+                else:
+                    future: asyncio.Future[bool] = asyncio.get_running_loop().create_future()
+                    approvals.append((tool_use, future))
+                    approval = future
+            task = asyncio.create_task(run_when_ready(tool_use, waits_on, approval))
+            started.append((access, task))
+            pending[tool_use.id] = task
 
-            # Execute tool
-            try:
-                result = await self._execute_tool(agent, tool_use.name, tool_use.input, task_id)
-                # Track tool call for progress reports
-                tool_summary = self._summarize_tool_input(tool_use.name, tool_use.input)
-                agent.add_tool_call(tool_use.name, tool_summary)
-                # Truncate large outputs to prevent context overflow
-                if len(result) > self.config.max_tool_output:
-                    result = result[: self.config.max_tool_output] + (
-                        f"\n\n[truncated - output exceeded {self.config.max_tool_output} chars]"
+        try:
+            response: Response | None = None
+            if streaming:
+                try:
+                    response = await self.claude.stream_turn(
+                        messages=messages,
+                        system=system_prompt,
+                        model=model,
+                        tools=tools,
+                        on_text=on_text if agent.live_output else None,
+                        on_tool_use=dispatch,
+                        on_retry=discard_text,
+                        priority=agent.priority,
                     )
-                results.append(
-                    ToolResult(
-                        tool_use_id=tool_use.id,
-                        content=result,
-                    )
-                )
-            except Exception as e:
-                results.append(
-                    ToolResult(
-                        tool_use_id=tool_use.id,
-                        content=str(e),
-                        is_error=True,
+                except StreamInterruptedError as e:
+                    # Keep what arrived: the tools already started finish and their results go
+                    # back to the model, rather than asking again and running them a second time
+                    logger.warning(f"Agent {agent.id}: {e}. Continuing with {len(e.dispatched)} tool call(s)")
+                    response = Response(
+                        content=e.text, tool_uses=list(e.dispatched), stop_reason="tool_use", usage=e.usage
                     )
+            if response is None:
+                response = await self.claude.send_message(
+                    messages=messages,
+                    system=system_prompt,
+                    model=model,
+                    tools=tools,
+                    priority=agent.priority,
+                    batch=batched,
                 )
+            if agent.live_output:
+                await flush_text(final=True)
+            streaming = False
+
+            # Anything not dispatched mid-stream starts now
+            for tool_use in response.tool_uses:
+                if tool_use.id not in pending:
+                    await dispatch(tool_use)
+
+            if approvals:
+                if len(approvals) == 1:
+                    tool_use = approvals[0][0]
+                    approved = await self._request_approval(agent, tool_use.name, tool_use.input, task_id)
+                else:
+                    actions = [{"action": tu.name, "details": tu.input} for tu, _ in approvals]
+                    approved = await self._request_approval(agent, "batch", {"actions": actions}, task_id)
+                for _, future in approvals:
+                    future.set_result(approved)
+
+            results = list(await asyncio.gather(*(pending[tool_use.id] for tool_use in response.tool_uses)))
+        except BaseException:
+            for task in pending.values():
+                task.cancel()
+            raise
+
+        return response, results
+
+    def _tool_access(self, agent: Agent, tool_use: ToolUse) -> ToolAccess:
+        """Describe the resources a tool call touches, for conflict detection.
+
+        Malformed input falls back to running the call on its own; the tool
+        itself reports the error.
+        """
+        try:
+            return self._resolve_tool_access(agent, tool_use.name, tool_use.input)
+        except Exception:
+            return ToolAccess(writes=frozenset({ALL_RESOURCES}))
+
+    def _resolve_tool_access(self, agent: Agent, name: str, tool_input: dict) -> ToolAccess:
+        """Map a tool call to the resources it reads and writes."""
 
-        return results
+        if self.mcp.is_mcp_tool(name):
+            # The client runs calls to a server concurrently, but their side effects may depend on the order
+            # Claude asked for them, so one turn's calls to the same server run one after another
+            return ToolAccess(writes=frozenset({("mcp", self.mcp.get_server_name(name) or name)}))
+
+        if name in ("read_file", "write_file"):
+            p = Path(tool_input.get("path", "")).expanduser()
+            if not p.is_absolute():
+                p = Path(agent.workdir) / p
+            resource = frozenset({("file", str(p.resolve()))})
+            return ToolAccess(reads=resource) if name == "read_file" else ToolAccess(writes=resource)
+
+        if name == "search_files":
+            return ToolAccess(reads=frozenset({WORKDIR_FILES}))
+        if name == "bash":
+            return ToolAccess(writes=frozenset({WORKDIR_FILES}))
+        if name == "wait_for_messages":
+            return ToolAccess(reads=frozenset({("mailbox",)}))
+        if name == "wait_for_shared_context":
+            # Only waits for writes; running it alongside them is the point
+            return ToolAccess()
+        if name == "get_shared_context":
+            return ToolAccess(reads=frozenset({("context",)}))
+        if name == "set_shared_context":
+            return ToolAccess(writes=frozenset({("context",)}))
+
+        # Human input, agent messages and unknown tools run on their own
+        return ToolAccess(writes=frozenset({ALL_RESOURCES}))
+
+    async def _handle_tool_use(self, agent: Agent, tool_use: ToolUse, task_id: str) -> ToolResult:
+        """Execute a single tool use request from Claude."""
+        if not agent.may_use(tool_use.name):
+            return ToolResult(
+                tool_use_id=tool_use.id,
+                content=f"Tool not available to this agent: {tool_use.name}",
+                is_error=True,
+            )
+        try:
+            result = await self._execute_tool(agent, tool_use.name, tool_use.input, task_id)
+            # Track tool call for progress reports
+            tool_summary = self._summarize_tool_input(tool_use.name, tool_use.input)
+            agent.add_tool_call(tool_use.name, tool_summary)
+            # Truncate large outputs to prevent context overflow
+            if len(result) > self.config.max_tool_output:
+                result = result[: self.config.max_tool_output] + (
+                    f"\n\n[truncated - output exceeded {self.config.max_tool_output} chars]"
+                )
+            return ToolResult(
+                tool_use_id=tool_use.id,
+                content=result,
+            )
+        except Exception as e:
+            return ToolResult(
+                tool_use_id=tool_use.id,
+                content=str(e),
+                is_error=True,
+            )
 
     async def _request_approval(self, agent: Agent, action: str, details: dict, task_id: str) -> bool:
         """Request approval for an action."""
@@ -825,7 +1134,9 @@ class Orchestrator:
 
         # Built-in tool dispatch
         handlers = {
-            "bash": lambda: self._execute_bash(tool_input.get("command", ""), agent.workdir),
+            "bash": lambda: self._execute_bash(
+                tool_input.get("command", ""), agent.workdir, agent.bash_timeout, agent.cgroup_path
+            ),
             "read_file": lambda: self._read_file(tool_input.get("path", ""), agent.workdir),
             "write_file": lambda: self._write_file(
                 tool_input.get("path", ""),
@@ -849,12 +1160,20 @@ class Orchestrator:
                 tool_input.get("message_type", "info"),
                 task_id,
             ),
+            "wait_for_messages": lambda: self._wait_for_messages(agent, tool_input.get("timeout_seconds", 60)),
             "get_shared_context": lambda: self._get_context(task_id, tool_input.get("key")),
             "set_shared_context": lambda: self._set_context(
                 agent,
                 task_id,
                 tool_input.get("key", ""),
                 tool_input.get("value", ""),
+                tool_input.get("expected_version"),
+            ),
+            "wait_for_shared_context": lambda: self._wait_for_context(
+                task_id,
+                tool_input.get("key", ""),
+                tool_input.get("after_version", 0),
+                tool_input.get("timeout_seconds", 60),
             ),
         }
 
@@ -878,31 +1197,27 @@ class Orchestrator:
         else:
             return tool_name
 
-    async def _execute_bash(self, command: str, workdir: str) -> str:
-        """Execute a bash command in the agent's working directory."""
+    async def _execute_bash(
+        self, command: str, workdir: str, timeout: int | None = None, cgroup: Path | None = None
+    ) -> str:
+        """Execute a bash command in the agent's working directory, inside its cgroup if any."""
+        timeout = timeout or self.config.bash_timeout
+        if cgroup:
+            command = wrap_command(cgroup, command)
         try:
-            result = await asyncio.get_running_loop().run_in_executor(
-                None,
-                lambda: subprocess.run(
-                    command,
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                    timeout=60,
-                    cwd=workdir,
-                ),
-            )
-            output = result.stdout
-            if result.stderr:
-                output += f"\nSTDERR: {result.stderr}"
-            if result.returncode != 0:
-                output += f"\nExit code: {result.returncode}"
-            return output or "Command completed with no output"
-        except subprocess.TimeoutExpired:
-            return "Command timed out after 60 seconds"
+            result = await run_shell(command, workdir, timeout, self.config.max_tool_output)
         except Exception as e:
             return f"Error executing command: {e}"
 
+        output = result.stdout
+        if result.stderr:
+            output += f"\nSTDERR: {result.stderr}"
+        if result.timed_out:
+            return f"Command timed out after {timeout} seconds" + (f"\n{output}" if output else "")
+        if result.returncode != 0:
+            output += f"\nExit code: {result.returncode}"
+        return output or "Command completed with no output"
+
     async def _read_file(self, path: str, workdir: str) -> str:
         """Read a file, relative paths resolved from workdir."""
         try:
@@ -1010,55 +1325,254 @@ class Orchestrator:
         )
         return f"Message sent (id: {msg_id})"
 
-    async def _get_context(self, task_id: str, key: str | None) -> str:
-        """Get shared context."""
-        context = await self.coordinator.get_context(task_id, key)
-        return json.dumps(context)
+    @staticmethod
+    def _format_agent_message(msg: dict[str, Any]) -> str:
+        """Render an inter-agent message for the receiving agent's conversation."""
+        kind = f" ({msg['message_type']})" if msg.get("message_type", "info") != "info" else ""
+        return f"[Message from agent {msg['from_agent']}{kind}]: {msg['content']}"
+
+    async def _wait_for_messages(self, agent: Agent, timeout_seconds: float) -> str:
+        """Block on the agent's mailbox instead of spending turns polling."""
+        timeout = min(max(float(timeout_seconds), 0), self.config.default_timeout)
+        messages = await self.coordinator.wait_for_messages(agent.id, timeout)
+        if not messages:
+            return f"No messages received within {timeout:g} seconds."
+        await self.coordinator.mark_read(*(msg["id"] for msg in messages))
+        return "\n".join(self._format_agent_message(msg) for msg in messages)
 
-    async def _set_context(self, agent: Agent, task_id: str, key: str, value: str) -> str:
-        """Set shared context."""
-        await self.coordinator.set_context(task_id, key, value, agent.id)
-        return f"Context set: {key}"
+    async def _get_context(self, task_id: str, key: str | None) -> str:
+        """Get shared context; a single key includes its version for compare-and-set."""
+        if not key:
+            return json.dumps(await self.coordinator.get_context(task_id))
+        entry = await self.coordinator.get_context_entry(task_id, key)
+        value, version = entry if entry else (None, 0)
+        return json.dumps({"key": key, "value": value, "version": version})
+
+    async def _set_context(
+        self, agent: Agent, task_id: str, key: str, value: str, expected_version: int | None = None
+    ) -> str:
+        """Set shared context, optionally only if the key is still at expected_version."""
+        if expected_version is None:
+            version = await self.coordinator.set_context(task_id, key, value, agent.id)
+            return f"Context set: {key} (version {version})"
+        ok, version = await self.coordinator.compare_and_set_context(
+            task_id, key, value, agent.id, int(expected_version)
+        )
+        if not ok:
+            current = json.dumps(await self.coordinator.get_context(task_id, key))
+            return f"Not set: {key} is at version {version}, not {expected_version}. Current value: {current}"
+        return f"Context set: {key} (version {version})"
+
+    async def _wait_for_context(self, task_id: str, key: str, after_version: int, timeout_seconds: float) -> str:
+        """Block until another agent sets a shared context key."""
+        timeout = min(max(float(timeout_seconds), 0), self.config.default_timeout)
+        entry = await self.coordinator.wait_for_context(task_id, key, int(after_version), timeout)
+        if entry is None:
+            return f"{key} did not change within {timeout:g} seconds."
+        return json.dumps({"key": key, "value": entry[0], "version": entry[1]})
+
+    async def recover_tasks(self) -> int:
+        """Re-queue tasks left unfinished by a previous run.
+
+        Queued tasks go back into the scheduler with their stored priority
+        and queue time. Tasks that were mid-run resume from their stored
+        conversation history instead of starting over. Returns the number
+        of tasks recovered.
+        """
+        # Nobody can answer approvals raised by the previous run any more
+        expired = await self.db.expire_pending_approvals()
+        if expired:
+            logger.info(f"Expired {expired} approval(s) left pending by the previous run")
+
+        recovered = 0
+        for row in await self.db.get_recoverable_tasks():
+            task_id = row["id"]
+            agent_id = row["agent_id"]
+            if agent_id in self._agents:
+                continue
+            if row["agent_status"] not in ("idle", "running", "paused"):
+                # Agent already finished; its task will never run
+                await self.db.update_task(task_id, status="cancelled")
+                continue
+
+            worktree_info: WorktreeInfo | None = None
+            workdir = row["workdir"] or str(self.config.default_workdir)
+            if row["worktree_path"]:
+                worktree_path = Path(row["worktree_path"])
+                try:
+                    if worktree_path.exists():
+                        worktree_info = WorktreeInfo(
+                            path=worktree_path,
+                            branch=row["worktree_branch"],
+                            base_repo=Path(row["base_repo"]),
+                        )
+                    elif row["base_repo"] and row["worktree_branch"]:
+                        worktree_info = restore_worktree(Path(row["base_repo"]), worktree_path, row["worktree_branch"])
+                    else:
+                        raise RuntimeError(f"Worktree {worktree_path} is gone and cannot be recreated")
+                except RuntimeError as e:
+                    # Never let a resumed agent fall back to editing the shared checkout
+                    logger.error(f"Cannot recover task {task_id}: {e}")
+                    now = datetime.now().isoformat()
+                    await self.db.update_task(task_id, status="failed", error=str(e), completed_at=now)
+                    await self.db.update_agent(agent_id, status="failed", error=str(e), completed_at=now)
+                    continue
+                workdir = row["worktree_path"]
+
+            agent = Agent(
+                agent_id=agent_id,
+                task=row["agent_task"],
+                model=row["model"],
+                supervised=bool(row["supervised"]),
+                timeout_mode=row["timeout_mode"],
+                workdir=workdir,
+                orchestrator=self,
+                worktree_info=worktree_info,
+            )
+            agent.live_output = bool(row["live_output"])
+            agent.bash_timeout = row["bash_timeout"]
+            agent.priority = row["priority"]
+            if row["tools"] is not None:
+                agent.tools = frozenset(json.loads(row["tools"]))
+            agent.add_tokens(
+                row["input_tokens"] or 0,
+                row["output_tokens"] or 0,
+                row["cache_read_tokens"] or 0,
+                row["cache_creation_tokens"] or 0,
+                cost=row["cost"] or 0.0,
+            )
+            agent._routed_turns = row["routed_turns"] or 0
+            agent._routing_savings = row["routing_savings"] or 0.0
+
+            if row["status"] != "queued":
+                history = await self.db.get_conversation(agent_id)
+                agent.messages = self._restore_messages(history)
+                agent.resumed = bool(agent.messages)
+                agent._turn_count = sum(1 for m in history if m["role"] == "assistant")
+                await self.db.update_task(task_id, status="queued")
+
+            self._agents[agent_id] = agent
+            await self.scheduler.enqueue(
+                task_id,
+                agent_id,
+                row["priority"],
+                priority_score=row["priority_score"],
+                queued_at=parse_db_timestamp(row["queued_at"]),
+            )
+            recovered += 1
+
+        if recovered:
+            logger.info(f"Recovered {recovered} unfinished task(s)")
+        return recovered
+
+    def _restore_messages(self, history: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Rebuild API messages from stored conversation rows."""
+        messages: list[dict[str, Any]] = []
+        for row in history:
+            if row["role"] == "user":
+                if row.get("tool_result"):
+                    messages.append({"role": "user", "content": row["tool_result"]})
+                else:
+                    messages.append({"role": "user", "content": row["content"]})
+            elif row["role"] == "assistant":
+                blocks: list[dict[str, Any]] = []
+                if row["content"]:
+                    blocks.append({"type": "text", "text": row["content"]})
+                for tu in row.get("tool_use") or []:
+                    if "id" in tu:
+                        blocks.append({"type": "tool_use", "id": tu["id"], "name": tu["name"], "input": tu["input"]})
+                messages.append({"role": "assistant", "content": blocks or row["content"]})
+
+        # Drop tool_use blocks whose results were never stored (crash mid-tool)
+        for i, msg in enumerate(messages):
+            if msg["role"] != "assistant" or not isinstance(msg["content"], list):
+                continue
+            next_msg = messages[i + 1] if i + 1 < len(messages) else None
+            result_ids = set()
+            if next_msg and isinstance(next_msg["content"], list):
+                result_ids = {b.get("tool_use_id") for b in next_msg["content"] if isinstance(b, dict)}
+            blocks = [b for b in msg["content"] if b["type"] != "tool_use" or b["id"] in result_ids]
+            msg["content"] = blocks or "(no output)"
+
+        # Only tool_results that follow their tool_use survive the filter above
+        for i, msg in enumerate(messages):
+            if msg["role"] == "user" and isinstance(msg["content"], list):
+                prev = messages[i - 1] if i > 0 else None
+                use_ids = set()
+                if prev and isinstance(prev["content"], list):
+                    use_ids = {b["id"] for b in prev["content"] if b["type"] == "tool_use"}
+                kept = [b for b in msg["content"] if b.get("tool_use_id") in use_ids]
+                msg["content"] = kept or "[Tool results unavailable]"
+
+        if messages and messages[-1]["role"] == "assistant":
+            messages.append({"role": "user", "content": "[Gru restarted. Continue the task from where you left off.]"})
+        return messages
 
     async def start(self) -> None:
-        """Start the orchestrator main loop."""
+        """Start the orchestrator main loop.
+
+        The dispatcher sleeps until the scheduler signals that a task was
+        enqueued or a running slot freed up. Starvation is derived from
+        enqueue times at dequeue, so no periodic aging pass is needed.
+        """
         self._running = True
 
         while self._running:
             try:
-                # Check for starvation
-                await self.scheduler.prevent_starvation()
-
-                # Process queued tasks
-                while self.scheduler.can_run_more():
-                    queued = await self.scheduler.dequeue()
-                    if not queued:
-                        break
-
-                    agent = self._agents.get(queued.agent_id)
-                    if not agent:
-                        # Agent was removed, skip
-                        continue
-
-                    # Start agent task
-                    task = asyncio.create_task(self.run_agent(agent, queued.task_id))
-                    self.scheduler.register_running(queued.task_id, task)
-
-                # Small delay
-                await asyncio.sleep(self.config.scheduler_interval)
-
+                await self._dispatch_queued()
+                await self.scheduler.wait_for_work()
             except Exception as e:
                 # Log error but keep running
                 logger.error(f"Orchestrator error: {e}")
                 await asyncio.sleep(1)
 
+    def _has_free_slot(self, queued: QueuedTask) -> bool:
+        """Check a queued task's slot class (batched or interactive) has room."""
+        agent = self._agents.get(queued.agent_id)
+        return agent is None or self.scheduler.can_run_more(self._uses_batches(agent))
+
+    async def _dispatch_queued(self) -> None:
+        """Start queued tasks until no queued task has a free slot of its class."""
+        while queued := await self.scheduler.peek(self._has_free_slot):
+            agent = self._agents.get(queued.agent_id)
+            batched = agent is not None and self._uses_batches(agent)
+            # Take exactly the task looked at, even if another became due meanwhile
+            await self.scheduler.cancel(queued.task_id)
+
+            if not agent:
+                # Agent was removed, skip
+                continue
+
+            # Start agent task
+            task = asyncio.create_task(self.run_agent(agent, queued.task_id))
+            self.scheduler.register_running(queued.task_id, task, batched)
+
     async def stop(self) -> None:
-        """Stop the orchestrator."""
+        """Stop the orchestrator.
+
+        With task recovery on, agents are suspended rather than terminated:
+        running ones are cancelled mid-turn, but every agent and task row and
+        worktree is left as-is for recover_tasks to resume on the next start.
+        """
         self._running = False
+        self.scheduler.wake()
 
-        # Cancel all running agents
-        for agent_id in list(self._agents.keys()):
-            await self.terminate_agent(agent_id)
+        if self.config.recover_tasks:
+            await self._suspend_agents()
+        else:
+            # Cancel all running agents
+            for agent_id in list(self._agents.keys()):
+                await self.terminate_agent(agent_id)
+        await self.claude.batcher.close()
+
+    async def _suspend_agents(self) -> None:
+        """Cancel running agents without marking them finished."""
+        self._suspending = True
+        tasks = self.scheduler.running_tasks()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._agents.clear()
 
     async def approve(self, approval_id: str, approved: bool = True) -> bool:
         """Approve or reject a pending action."""
@@ -1077,16 +1591,16 @@ class Orchestrator:
     async def get_status(self) -> dict[str, Any]:
         """Get orchestrator status."""
         scheduler_status = await self.scheduler.get_status()
-        agents = await self.list_agents()
+        counts = await self.db.count_agents_by_status()
 
         return {
             "running": self._running,
             "agents": {
-                "total": len(agents),
-                "running": len([a for a in agents if a["status"] == "running"]),
-                "paused": len([a for a in agents if a["status"] == "paused"]),
-                "completed": len([a for a in agents if a["status"] == "completed"]),
-                "failed": len([a for a in agents if a["status"] == "failed"]),
+                "total": sum(counts.values()),
+                "running": counts.get("running", 0),
+                "paused": counts.get("paused", 0),
+                "completed": counts.get("completed", 0),
+                "failed": counts.get("failed", 0),
             },
             "scheduler": scheduler_status,
         }
@@ -1109,18 +1623,5 @@ class Orchestrator:
         if agent_data:
             input_tokens = agent_data.get("input_tokens", 0) or 0
             output_tokens = agent_data.get("output_tokens", 0) or 0
-            # Create temporary agent for cost calculation
-            pricing = {
-                "claude-sonnet-4-20250514": {"input": 3.0, "output": 15.0},
-                "claude-opus-4-20250514": {"input": 15.0, "output": 75.0},
-                "claude-3-5-sonnet-20241022": {"input": 3.0, "output": 15.0},
-                "claude-3-opus-20240229": {"input": 15.0, "output": 75.0},
-                "claude-3-haiku-20240307": {"input": 0.25, "output": 1.25},
-            }
-            model = agent_data.get("model", "claude-sonnet-4-20250514")
-            rates = pricing.get(model, {"input": 3.0, "output": 15.0})
-            input_cost = (input_tokens / 1_000_000) * rates["input"]
-            output_cost = (output_tokens / 1_000_000) * rates["output"]
-            cost = f"{input_cost + output_cost:.4f}"
-            return input_tokens, output_tokens, cost
+            return input_tokens, output_tokens, f"{agent_data.get('cost') or 0.0:.4f}"
         return None
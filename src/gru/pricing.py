@@ -0,0 +1,36 @@
+"""Claude model pricing and cost estimates."""
+
+from __future__ import annotations
+
+# Pricing per 1M tokens, USD
+MODEL_PRICING = {
+    "claude-sonnet-4-20250514": {"input": 3.0, "output": 15.0},
+    "claude-opus-4-20250514": {"input": 15.0, "output": 75.0},
+    "claude-3-5-sonnet-20241022": {"input": 3.0, "output": 15.0},
+    "claude-3-5-haiku-20241022": {"input": 0.8, "output": 4.0},
+    "claude-3-opus-20240229": {"input": 15.0, "output": 75.0},
+    "claude-3-haiku-20240307": {"input": 0.25, "output": 1.25},
+}
+DEFAULT_PRICING = {"input": 3.0, "output": 15.0}
+CACHE_READ_MULTIPLIER = 0.1  # Cache hits bill at 10% of the input rate
+CACHE_WRITE_MULTIPLIER = 1.25  # Cache writes bill at 125% of the input rate
+BATCH_MULTIPLIER = 0.5  # Message Batches bill at half price
+
+
+def usage_cost(
+    model: str,
+    input_tokens: int,
+    output_tokens: int,
+    cache_read_tokens: int = 0,
+    cache_creation_tokens: int = 0,
+    batched: bool = False,
+) -> float:
+    """USD cost of token usage for a model."""
+    rates = MODEL_PRICING.get(model, DEFAULT_PRICING)
+    input_cost = (
+        (input_tokens + cache_read_tokens * CACHE_READ_MULTIPLIER + cache_creation_tokens * CACHE_WRITE_MULTIPLIER)
+        / 1_000_000
+        * rates["input"]
+    )
+    output_cost = (output_tokens / 1_000_000) * rates["output"]
+    return (input_cost + output_cost) * (BATCH_MULTIPLIER if batched else 1.0)
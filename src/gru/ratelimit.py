@@ -0,0 +1,182 @@
+"""Client-side rate governor shared by all agents' Claude requests."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_ORDER = {"high": 0, "normal": 1, "low": 2}
+
+# Rate-limit response headers, by bucket
+HEADER_PREFIXES = {
+    "requests": "anthropic-ratelimit-requests",
+    "input_tokens": "anthropic-ratelimit-input-tokens",
+    "output_tokens": "anthropic-ratelimit-output-tokens",
+}
+
+
+class TokenBucket:
+    """A per-minute allowance that refills continuously.
+
+    A capacity of 0 means no limit is known, and nothing waits.
+    """
+
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = per_minute
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level + (now - self._updated) * self.capacity / 60)
+        self._updated = now
+
+    def delay(self, amount: int, now: float) -> float:
+        """Seconds until amount is available (a request larger than the bucket waits for a full one)."""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        shortfall = min(amount, self.capacity) - self.level
+        return max(0.0, shortfall * 60 / self.capacity)
+
+    def take(self, amount: int, now: float) -> None:
+        """Spend amount; the level may go negative when usage exceeds the estimate."""
+        self._refill(now)
+        if self.capacity > 0:
+            self.level -= amount
+
+    def learn(self, limit: int | None, remaining: int | None, now: float) -> None:
+        """Adopt the server's view: its limit if lower, and never more than it says is left."""
+        self._refill(now)
+        if limit and self.capacity <= 0:
+            self.capacity = limit
+            self.level = float(limit)
+        elif limit and limit < self.capacity:
+            self.capacity = limit
+            self.level = min(self.level, limit)
+        if remaining is not None and self.capacity > 0:
+            self.level = min(self.level, remaining)
+
+
+@dataclass
+class Reservation:
+    """Capacity taken for one request, settled once its usage is known."""
+
+    amounts: dict[str, int] = field(default_factory=dict)
+
+
+class RateGovernor:
+    """Paces Claude requests to stay within per-minute request and token limits.
+
+    Limits start from the configured values (0 = unknown) and are tightened
+    by the rate-limit headers of every response. Callers reserve capacity
+    before a request with ``acquire``, which waits instead of letting the
+    request fail; waiters are served by priority, then arrival. A 429 pauses
+    everyone until its retry-after has passed, so agents don't retry in
+    lockstep.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = 0,
+        input_tokens_per_minute: int = 0,
+        output_tokens_per_minute: int = 0,
+    ) -> None:
+        self.buckets = {
+            "requests": TokenBucket(requests_per_minute),
+            "input_tokens": TokenBucket(input_tokens_per_minute),
+            "output_tokens": TokenBucket(output_tokens_per_minute),
+        }
+        self._paused_until = 0.0
+        self._queue: list[tuple[int, int]] = []  # (priority, arrival) of waiting callers
+        self._arrivals = itertools.count()
+        self._changed = asyncio.Condition()
+
+    def _delay(self, amounts: dict[str, int], now: float) -> float:
+        delay = max(self.buckets[name].delay(amount, now) for name, amount in amounts.items())
+        return max(delay, self._paused_until - now)
+
+    async def acquire(self, input_tokens: int, output_tokens: int, priority: str = "normal") -> Reservation:
+        """Wait until a request of this size fits the limits, then reserve it."""
+        amounts = {"requests": 1, "input_tokens": input_tokens, "output_tokens": output_tokens}
+        entry = (PRIORITY_ORDER.get(priority, PRIORITY_ORDER["normal"]), next(self._arrivals))
+        async with self._changed:
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    timeout = None
+                    if self._queue[0] == entry:
+                        timeout = self._delay(amounts, time.monotonic())
+                        if timeout <= 0:
+                            break
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(self._changed.wait(), timeout)
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._changed.notify_all()
+
+            now = time.monotonic()
+            for name, amount in amounts.items():
+                self.buckets[name].take(amount, now)
+        return Reservation(amounts)
+
+    async def _adjust(self, reservation: Reservation, actual: dict[str, int]) -> None:
+        now = time.monotonic()
+        for name, amount in actual.items():
+            self.buckets[name].take(amount - reservation.amounts.get(name, 0), now)
+        reservation.amounts.update(actual)
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def settle(self, reservation: Reservation, usage: Mapping[str, int]) -> None:
+        """Replace the estimates with the request's actual usage.
+
+        Cache reads don't count against the input token limit, so only
+        uncached input and cache writes are charged.
+        """
+        input_tokens = usage.get("input_tokens", 0) + usage.get("cache_creation_input_tokens", 0)
+        await self._adjust(reservation, {"input_tokens": input_tokens, "output_tokens": usage.get("output_tokens", 0)})
+
+    async def release(self, reservation: Reservation) -> None:
+        """Return the tokens of a request that produced no output; the request itself still counts."""
+        await self._adjust(reservation, {"input_tokens": 0, "output_tokens": 0})
+
+    async def pause(self, seconds: float) -> None:
+        """Hold every request for seconds, e.g. after a 429."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        logger.warning("Claude rate limit reached; pausing requests for %.1fs", seconds)
+        async with self._changed:
+            self._changed.notify_all()
+
+    def observe(self, headers: Mapping[str, str]) -> None:
+        """Learn limits and remaining capacity from a response's rate-limit headers."""
+        now = time.monotonic()
+        for name, prefix in HEADER_PREFIXES.items():
+            self.buckets[name].learn(
+                _header_int(headers, f"{prefix}-limit"), _header_int(headers, f"{prefix}-remaining"), now
+            )
+
+
+def _header_int(headers: Mapping[str, str], name: str) -> int | None:
+    value = headers.get(name)
+    return int(value) if isinstance(value, str) and value.isdigit() else None
+
+
+def retry_after(headers: Mapping[str, str]) -> float | None:
+    """Seconds to wait according to a retry-after header, if it has one."""
+    value = headers.get("retry-after")
+    if not isinstance(value, str):
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
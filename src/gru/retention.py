@@ -0,0 +1,126 @@
+"""Retention: archive old transcripts and prune finished coordination rows."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import gzip
+import json
+import logging
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from gru.db import Database
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_BATCH = 50  # agents archived per transaction
+VACUUM_PAGES = 2000  # free pages returned to the filesystem per pass
+
+
+class ConversationArchive:
+    """Compressed per-agent conversation archives.
+
+    Each agent's archived messages live in ``<agent_id>.jsonl.gz`` as raw
+    conversation rows, oldest first. Later archive runs append another gzip
+    member, which readers see as one continuous stream. Rows are written
+    before they are deleted from the database, so a crash in between can
+    repeat rows; reads skip any id that is not newer than the last one.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+
+    def path(self, agent_id: str) -> Path:
+        """Archive file of an agent."""
+        return self.directory / f"{agent_id}.jsonl.gz"
+
+    def exists(self, agent_id: str) -> bool:
+        """Check whether an agent has archived messages."""
+        return self.path(agent_id).exists()
+
+    def append(self, agent_id: str, rows: list[dict[str, Any]]) -> None:
+        """Durably append conversation rows to an agent's archive."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        data = gzip.compress("".join(json.dumps(row) + "\n" for row in rows).encode())
+        with open(self.path(agent_id), "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self, agent_id: str) -> list[dict[str, Any]]:
+        """Read an agent's archived rows, oldest first."""
+        try:
+            with gzip.open(self.path(agent_id), "rt") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        rows: list[dict[str, Any]] = []
+        for line in lines:
+            row = json.loads(line)
+            if not rows or row["id"] > rows[-1]["id"]:
+                rows.append(row)
+        return rows
+
+    def delete(self, agent_id: str) -> None:
+        """Remove an agent's archive."""
+        with contextlib.suppress(FileNotFoundError):
+            self.path(agent_id).unlink()
+
+
+class RetentionWorker:
+    """Periodically applies the retention policy to the database.
+
+    Each pass moves the transcripts of agents that finished more than
+    ``retention_days`` ago into the conversation archive, deletes read
+    agent messages and resolved approvals older than that, then returns
+    freed pages to the filesystem and truncates the WAL.
+    """
+
+    def __init__(self, db: Database, retention_days: int, interval: float = 3600.0) -> None:
+        self.db = db
+        self.retention_days = retention_days
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    async def run_once(self) -> dict[str, int]:
+        """Apply the policy once.
+
+        Returns:
+            Number of agents archived and rows deleted, by kind
+        """
+        archived = 0
+        while batch := await self.db.archive_conversations(self.retention_days, limit=ARCHIVE_BATCH):
+            archived += batch
+        stats = {
+            "archived_agents": archived,
+            "agent_messages": await self.db.purge_agent_messages(self.retention_days),
+            "approvals": await self.db.purge_approvals(self.retention_days),
+        }
+        await self.db.reclaim_space(VACUUM_PAGES)
+        return stats
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                stats = await self.run_once()
+                if any(stats.values()):
+                    logger.info("Retention pass: %s", stats)
+            except Exception as e:
+                logger.error(f"Retention pass failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        """Start running passes in the background."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background passes."""
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
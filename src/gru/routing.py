@@ -0,0 +1,56 @@
+"""Per-turn model routing."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from gru.claude import Response
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    """The model chosen for one turn, and why."""
+
+    model: str
+    reason: str
+
+
+class ModelRouter:
+    """Picks the model for each agent turn.
+
+    Turns that only follow up on successful tool calls (reading the next
+    file, running the next command, acting on tool output) go to
+    ``fast_model``. The agent's own model takes the first turn, where the
+    plan is made, and any turn after a failed tool call or new instructions
+    such as human input, agent messages or a nudge. With no fast model,
+    every turn uses the agent's model.
+
+    A fast turn that calls no tools, which would end the task, is
+    escalated: it is asked again of the agent's model, so the decision to
+    stop is never made by the cheaper one. Switching models also
+    switches prompt caches, so routing pays off on long runs of
+    mechanical steps. Subclass and override route() and should_escalate()
+    for other policies.
+    """
+
+    def __init__(self, fast_model: str = "") -> None:
+        self.fast_model = fast_model
+
+    def route(self, model: str, messages: list[dict[str, Any]]) -> RouteDecision:
+        """Choose the model for the next turn of an agent whose model is model."""
+        if not self.fast_model or self.fast_model == model:
+            return RouteDecision(model, "default")
+        content = messages[-1]["content"] if messages and messages[-1]["role"] == "user" else None
+        if not isinstance(content, list) or not content or any(b.get("type") != "tool_result" for b in content):
+            return RouteDecision(model, "new instructions")
+        if any(b.get("is_error") for b in content):
+            return RouteDecision(model, "tool error")
+        return RouteDecision(self.fast_model, "tool follow-up")
+
+    def should_escalate(self, decision: RouteDecision, model: str, response: Response) -> bool:
+        """Whether a routed turn's response should be discarded and the turn rerun on model."""
+        if decision.model == model:
+            return False
+        return not response.tool_uses
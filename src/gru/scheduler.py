@@ -4,8 +4,9 @@ from __future__ import annotations
 
 import asyncio
 import heapq
+from collections.abc import Callable
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
@@ -20,28 +21,57 @@ class QueuedTask:
     queued_at: datetime = field(compare=True)
     task_id: str = field(compare=False)
     agent_id: str = field(compare=False)
-    wait_cycles: int = field(default=0, compare=False)
+
+
+def parse_db_timestamp(value: str) -> datetime:
+    """Convert a SQLite datetime('now') string (UTC) to naive local time."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone().replace(tzinfo=None)
 
 
 class Scheduler:
-    """Priority queue scheduler with starvation prevention."""
+    """Priority queue scheduler with starvation prevention.
+
+    Queued tasks live in two lazily-pruned heaps: one ordered by priority and
+    one by enqueue time. ``_entries`` is the source of truth; heap items that
+    no longer match it are tombstones skipped on pop. This keeps enqueue,
+    dequeue, cancel and reprioritize at O(log n).
+
+    Starvation is derived from enqueue timestamps rather than per-tick
+    bookkeeping: a task that has waited ``starvation_threshold`` cycles of
+    ``cycle_seconds`` is promoted above every non-starved task, and starved
+    tasks are served oldest first.
+
+    Tasks whose agents send their turns through Message Batches spend most of
+    their time waiting on the batch, so they run in ``max_batched`` slots of
+    their own instead of taking one of the ``max_concurrent`` slots.
+    """
 
     PRIORITY_SCORES = {"high": 100, "normal": 50, "low": 0}
-    STARVATION_BOOST = 10  # Points added per cycle for waiting tasks
-    MAX_BOOST = 100  # Maximum boost from waiting
 
     def __init__(
         self,
         db: Database,
         max_concurrent: int = 10,
         starvation_threshold: int = 10,
+        cycle_seconds: float = 0.1,
+        max_batched: int = 0,
     ) -> None:
         self.db = db
         self.max_concurrent = max_concurrent
+        self.max_batched = max_batched
         self.starvation_threshold = starvation_threshold
+        self.cycle_seconds = cycle_seconds
         self._running: dict[str, asyncio.Task] = {}
-        self._queue: list[QueuedTask] = []
+        self._batched: set[str] = set()  # Running tasks in batch slots
+        self._entries: dict[str, QueuedTask] = {}
+        self._queue: list[QueuedTask] = []  # Priority heap (may hold tombstones)
+        self._by_age: list[tuple[datetime, str]] = []  # Enqueue-time heap (may hold tombstones)
         self._lock = asyncio.Lock()
+        # Set when a task is enqueued or a running slot frees up
+        self._work_available = asyncio.Event()
 
     @property
     def running_count(self) -> int:
@@ -51,85 +81,185 @@ class Scheduler:
     @property
     def queue_length(self) -> int:
         """Number of queued tasks."""
-        return len(self._queue)
+        return len(self._entries)
+
+    @property
+    def starvation_age(self) -> float:
+        """Seconds a task may wait before it is treated as starved."""
+        return self.starvation_threshold * self.cycle_seconds
 
     async def enqueue(
         self,
         task_id: str,
         agent_id: str,
         priority: str = "normal",
+        priority_score: int | None = None,
+        queued_at: datetime | None = None,
     ) -> None:
-        """Add a task to the queue."""
+        """Add a task to the queue.
+
+        priority_score and queued_at override the defaults when restoring
+        tasks persisted by a previous run.
+        """
         async with self._lock:
-            score = self.PRIORITY_SCORES.get(priority, 50)
+            score = priority_score if priority_score is not None else self.PRIORITY_SCORES.get(priority, 50)
             queued_task = QueuedTask(
                 priority_score=-score,  # Negative for min-heap behavior
-                queued_at=datetime.now(),
+                queued_at=queued_at or datetime.now(),
                 task_id=task_id,
                 agent_id=agent_id,
             )
-            heapq.heappush(self._queue, queued_task)
+            self._push(queued_task)
+        self.wake()
 
     async def dequeue(self) -> QueuedTask | None:
         """Get the highest priority task."""
         async with self._lock:
-            if not self._queue:
+            task = self._peek()
+            if task is None:
                 return None
-            return heapq.heappop(self._queue)
+            del self._entries[task.task_id]
+            self._compact()
+            return task
+
+    async def peek(self, accept: Callable[[QueuedTask], bool] | None = None) -> QueuedTask | None:
+        """Return the task dequeue() would return, without removing it.
+
+        With ``accept``, return the first task in dispatch order it accepts,
+        so tasks that can't start yet don't hold up the ones that can.
+        """
+        async with self._lock:
+            task = self._peek()
+            if task is None or accept is None or accept(task):
+                return task
+            # Slow path: walk the queue in dispatch order
+            return next((t for t in sorted(self._entries.values(), key=self._dispatch_key) if accept(t)), None)
 
     async def cancel(self, task_id: str) -> bool:
         """Cancel a queued task."""
         async with self._lock:
-            for i, task in enumerate(self._queue):
-                if task.task_id == task_id:
-                    self._queue.pop(i)
-                    heapq.heapify(self._queue)
-                    return True
-            return False
+            if self._entries.pop(task_id, None) is None:
+                return False
+            self._compact()
+            return True
 
-    async def prevent_starvation(self) -> None:
-        """Boost priority of long-waiting tasks."""
+    async def reprioritize(self, task_id: str, priority: str) -> bool:
+        """Change the priority of a queued task, keeping its place in line."""
         async with self._lock:
-            needs_reheapify = False
-            for task in self._queue:
-                task.wait_cycles += 1
-                if task.wait_cycles >= self.starvation_threshold:
-                    boost = min(
-                        task.wait_cycles * self.STARVATION_BOOST,
-                        self.MAX_BOOST,
-                    )
-                    new_score = -boost - 100
-                    if new_score < task.priority_score:
-                        task.priority_score = new_score
-                        needs_reheapify = True
-            if needs_reheapify:
-                heapq.heapify(self._queue)
-
-    def register_running(self, task_id: str, task: asyncio.Task) -> None:
-        """Register a task as running."""
+            current = self._entries.get(task_id)
+            if current is None:
+                return False
+            self._push(
+                QueuedTask(
+                    priority_score=-self.PRIORITY_SCORES.get(priority, 50),
+                    queued_at=current.queued_at,
+                    task_id=task_id,
+                    agent_id=current.agent_id,
+                )
+            )
+            self._compact()
+            return True
+
+    def _push(self, task: QueuedTask) -> None:
+        """Index a task in both heaps."""
+        self._entries[task.task_id] = task
+        heapq.heappush(self._queue, task)
+        heapq.heappush(self._by_age, (task.queued_at, task.task_id))
+
+    def _peek(self) -> QueuedTask | None:
+        """Return the next task to run, pruning tombstones off the heap tops."""
+        while self._queue and self._entries.get(self._queue[0].task_id) is not self._queue[0]:
+            heapq.heappop(self._queue)
+        while self._by_age and not self._is_live_age_entry(self._by_age[0]):
+            heapq.heappop(self._by_age)
+        if not self._queue:
+            return None
+
+        oldest_at, oldest_id = self._by_age[0]
+        if (datetime.now() - oldest_at).total_seconds() >= self.starvation_age:
+            return self._entries[oldest_id]
+        return self._queue[0]
+
+    def _dispatch_key(self, task: QueuedTask) -> tuple:
+        """Sort key matching _peek: starved tasks oldest first, then by priority."""
+        if (datetime.now() - task.queued_at).total_seconds() >= self.starvation_age:
+            return (0, task.queued_at)
+        return (1, task.priority_score, task.queued_at)
+
+    def _is_live_age_entry(self, item: tuple[datetime, str]) -> bool:
+        """Check an enqueue-time heap item still refers to a queued task."""
+        entry = self._entries.get(item[1])
+        return entry is not None and entry.queued_at == item[0]
+
+    def _compact(self) -> None:
+        """Rebuild the heaps once tombstones outnumber live entries."""
+        if len(self._queue) > 2 * len(self._entries) + 16:
+            self._queue = list(self._entries.values())
+            heapq.heapify(self._queue)
+        if len(self._by_age) > 2 * len(self._entries) + 16:
+            self._by_age = [(t.queued_at, t.task_id) for t in self._entries.values()]
+            heapq.heapify(self._by_age)
+
+    def wait_cycles(self, task: QueuedTask) -> int:
+        """Number of scheduler cycles a task has been waiting."""
+        if self.cycle_seconds <= 0:
+            return 0
+        return int((datetime.now() - task.queued_at).total_seconds() / self.cycle_seconds)
+
+    def register_running(self, task_id: str, task: asyncio.Task, batched: bool = False) -> None:
+        """Register a task as running, in a batch slot if batched."""
         self._running[task_id] = task
+        if batched:
+            self._batched.add(task_id)
 
     def unregister_running(self, task_id: str) -> None:
         """Unregister a completed task."""
-        self._running.pop(task_id, None)
+        self._batched.discard(task_id)
+        if self._running.pop(task_id, None) is not None:
+            self.wake()
+
+    def wake(self) -> None:
+        """Wake the dispatcher waiting in wait_for_work."""
+        self._work_available.set()
+
+    async def wait_for_work(self, timeout: float | None = None) -> bool:
+        """Block until work may be dispatchable.
+
+        Returns True when woken by an enqueue, a freed slot or wake(),
+        False if the timeout elapsed first.
+        """
+        try:
+            await asyncio.wait_for(self._work_available.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._work_available.clear()
+        return True
+
+    def running_tasks(self) -> list[asyncio.Task]:
+        """Get every running asyncio task."""
+        return list(self._running.values())
 
     def get_running_task(self, task_id: str) -> asyncio.Task | None:
         """Get a running asyncio task by ID."""
         return self._running.get(task_id)
 
-    def can_run_more(self) -> bool:
-        """Check if more tasks can be run."""
-        return len(self._running) < self.max_concurrent
+    def can_run_more(self, batched: bool = False) -> bool:
+        """Check if another task can run, in a batch slot if batched."""
+        if batched:
+            return len(self._batched) < self.max_batched
+        return len(self._running) - len(self._batched) < self.max_concurrent
 
     async def get_status(self) -> dict:
         """Get scheduler status."""
         async with self._lock:
             return {
                 "running": len(self._running),
-                "queued": len(self._queue),
+                "queued": len(self._entries),
                 "max_concurrent": self.max_concurrent,
+                "batched": len(self._batched),
                 "running_tasks": list(self._running.keys()),
                 "queued_tasks": [
-                    {"task_id": t.task_id, "agent_id": t.agent_id, "wait_cycles": t.wait_cycles} for t in self._queue
+                    {"task_id": t.task_id, "agent_id": t.agent_id, "wait_cycles": self.wait_cycles(t)}
+                    for t in self._entries.values()
                 ],
             }
@@ -17,12 +17,19 @@ CREATE TABLE IF NOT EXISTS agents (
     priority TEXT NOT NULL CHECK(priority IN ('high', 'normal', 'low')) DEFAULT 'normal',
     memory_limit TEXT,
     cpu_quota INTEGER,
+    bash_timeout INTEGER,
+    tools TEXT,
     workdir TEXT,
     worktree_path TEXT,
     worktree_branch TEXT,
     base_repo TEXT,
     input_tokens INTEGER DEFAULT 0,
     output_tokens INTEGER DEFAULT 0,
+    cache_read_tokens INTEGER DEFAULT 0,
+    cache_creation_tokens INTEGER DEFAULT 0,
+    cost REAL DEFAULT 0,
+    routed_turns INTEGER DEFAULT 0,
+    routing_savings REAL DEFAULT 0,
     live_output INTEGER DEFAULT 0,
     pid INTEGER,
     cgroup_path TEXT,
@@ -100,6 +107,7 @@ CREATE TABLE IF NOT EXISTS shared_context (
     task_id TEXT REFERENCES tasks(id) ON DELETE CASCADE,
     key TEXT NOT NULL,
     value JSON NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
     updated_by TEXT REFERENCES agents(id),
     updated_at TEXT NOT NULL DEFAULT (datetime('now')),
     PRIMARY KEY (task_id, key)
@@ -118,13 +126,22 @@ CREATE TABLE IF NOT EXISTS templates (
     updated_at TEXT NOT NULL DEFAULT (datetime('now'))
 );
 
--- Indexes for common queries
-CREATE INDEX IF NOT EXISTS idx_agents_status ON agents(status);
-CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status);
+-- Indexes for common queries (hot queries are checked against these in tests, see db.HOT_QUERIES)
+CREATE INDEX IF NOT EXISTS idx_agents_status_created ON agents(status, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_agents_created ON agents(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_tasks_status_priority ON tasks(status, priority_score DESC, queued_at);
 CREATE INDEX IF NOT EXISTS idx_tasks_agent ON tasks(agent_id);
-CREATE INDEX IF NOT EXISTS idx_tasks_priority ON tasks(priority_score DESC);
-CREATE INDEX IF NOT EXISTS idx_approvals_status ON approvals(status);
+CREATE INDEX IF NOT EXISTS idx_tasks_parent ON tasks(parent_task_id);
+CREATE INDEX IF NOT EXISTS idx_approvals_status_created ON approvals(status, created_at);
 CREATE INDEX IF NOT EXISTS idx_approvals_agent ON approvals(agent_id);
+CREATE INDEX IF NOT EXISTS idx_approvals_agent_pending ON approvals(agent_id, created_at) WHERE status = 'pending';
 CREATE INDEX IF NOT EXISTS idx_conversations_agent ON conversations(agent_id);
-CREATE INDEX IF NOT EXISTS idx_agent_messages_to ON agent_messages(to_agent, read);
+CREATE INDEX IF NOT EXISTS idx_agent_messages_inbox ON agent_messages(to_agent, read, created_at);
 CREATE INDEX IF NOT EXISTS idx_agent_messages_task ON agent_messages(task_id);
+
+-- Superseded by the composite indexes above
+DROP INDEX IF EXISTS idx_agents_status;
+DROP INDEX IF EXISTS idx_tasks_status;
+DROP INDEX IF EXISTS idx_tasks_priority;
+DROP INDEX IF EXISTS idx_approvals_status;
+DROP INDEX IF EXISTS idx_agent_messages_to;
@@ -0,0 +1,125 @@
+"""Async shell command runner with bounded output capture."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+import signal
+from dataclasses import dataclass
+
+# Seconds to wait after SIGTERM before killing the process group outright
+KILL_GRACE_PERIOD = 2.0
+READ_CHUNK_SIZE = 65536
+
+
+class OutputBuffer:
+    """Ring buffer that keeps only the most recent bytes of a stream."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = max(limit, 0)
+        self.dropped = 0
+        self._data = bytearray()
+
+    def write(self, chunk: bytes) -> None:
+        """Append a chunk, discarding the oldest bytes beyond the limit."""
+        self._data += chunk
+        # Trim lazily so a chatty stream doesn't shift the buffer on every chunk
+        if len(self._data) > 2 * self.limit:
+            self._trim()
+
+    def _trim(self) -> None:
+        excess = len(self._data) - self.limit
+        if excess > 0:
+            del self._data[:excess]
+            self.dropped += excess
+
+    def getvalue(self) -> str:
+        """Return the retained output, noting how much was dropped."""
+        self._trim()
+        text = self._data.decode("utf-8", errors="replace")
+        if self.dropped:
+            return f"[... {self.dropped} earlier bytes dropped ...]\n{text}"
+        return text
+
+
+@dataclass
+class ShellResult:
+    """Outcome of a shell command."""
+
+    stdout: str
+    stderr: str
+    returncode: int | None
+    timed_out: bool = False
+
+
+async def _pump(stream: asyncio.StreamReader | None, buffer: OutputBuffer) -> None:
+    """Copy a subprocess stream into a buffer until EOF."""
+    if stream is None:
+        return
+    while chunk := await stream.read(READ_CHUNK_SIZE):
+        buffer.write(chunk)
+
+
+def _signal_group(pid: int, sig: signal.Signals) -> None:
+    """Send a signal to a process group, ignoring groups that already exited."""
+    with contextlib.suppress(ProcessLookupError, PermissionError):
+        os.killpg(pid, sig)
+
+
+async def _terminate(proc: asyncio.subprocess.Process) -> None:
+    """Stop a process and everything it spawned."""
+    _signal_group(proc.pid, signal.SIGTERM)
+    with contextlib.suppress(asyncio.TimeoutError):
+        await asyncio.wait_for(proc.wait(), timeout=KILL_GRACE_PERIOD)
+    # Children may outlive the shell, so always finish the whole group
+    _signal_group(proc.pid, signal.SIGKILL)
+    await proc.wait()
+
+
+async def run_shell(
+    command: str,
+    cwd: str,
+    timeout: float,
+    max_output: int,
+    env: dict[str, str] | None = None,
+) -> ShellResult:
+    """Run a shell command without blocking the event loop.
+
+    stdout and stderr are read incrementally into ring buffers holding at
+    most max_output bytes each, so memory stays bounded however much the
+    command prints. The command runs in its own session; on timeout or
+    cancellation the whole process group is killed. Background processes
+    that redirect their output are left running after a normal exit.
+    """
+    proc = await asyncio.create_subprocess_shell(
+        command,
+        cwd=cwd,
+        env=env,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True,
+    )
+    stdout = OutputBuffer(max_output)
+    stderr = OutputBuffer(max_output)
+
+    timed_out = False
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(_pump(proc.stdout, stdout), _pump(proc.stderr, stderr), proc.wait()),
+            timeout=timeout,
+        )
+    except asyncio.TimeoutError:
+        timed_out = True
+        await _terminate(proc)
+    except BaseException:
+        await _terminate(proc)
+        raise
+
+    return ShellResult(
+        stdout=stdout.getvalue(),
+        stderr=stderr.getvalue(),
+        returncode=proc.returncode,
+        timed_out=timed_out,
+    )
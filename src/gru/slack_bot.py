@@ -12,6 +12,8 @@ from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
 from slack_bolt.async_app import AsyncApp
 from slack_sdk.web.async_client import AsyncWebClient
 
+from gru.cgroups import format_resources
+
 if TYPE_CHECKING:
     from gru.config import Config
     from gru.orchestrator import Orchestrator
@@ -393,6 +395,8 @@ Default workdir: `{self.config.default_workdir}`"""
                 f"Workdir: {agent.get('workdir', 'N/A')}\n"
                 f"Created: {agent['created_at']}"
             )
+            if agent.get("resources"):
+                msg += f"\nResources: {format_resources(agent['resources'])}"
             if agent.get("error"):
                 msg += f"\nError: {agent['error']}"
             await self._respond(respond, msg)
@@ -533,13 +537,13 @@ Default workdir: `{self.config.default_workdir}`"""
             return
 
         agent_id = self._resolve_agent_ref(args[0]) or args[0]
-        conversation = await self.orchestrator.db.get_conversation(agent_id)
+        conversation = await self.orchestrator.db.get_conversation(agent_id, limit=20)
 
         if not conversation:
             await self._respond(respond, f"No logs found for agent {agent_id}")
             return
 
-        lines = [self._format_log_entry(msg) for msg in conversation[-20:]]
+        lines = [self._format_log_entry(msg) for msg in conversation]
 
         output = "\n\n".join(lines)
         chunks = self._split_message(output)
@@ -651,7 +655,8 @@ Default workdir: `{self.config.default_workdir}`"""
         for agent in results[:10]:
             tokens = agent.get("input_tokens", 0) + agent.get("output_tokens", 0)
             token_str = f" ({tokens:,} tokens)" if tokens else ""
-            lines.append(f"`{agent['id']}` [{agent['status']}] {agent['task'][:200]}...{token_str}")
+            text = agent.get("snippet") or agent["task"]
+            lines.append(f"`{agent['id']}` [{agent['status']}] {text[:200]}...{token_str}")
 
         await self._respond(respond, f"*Search results for '{query}':*\n" + "\n".join(lines))
 
@@ -1031,6 +1036,8 @@ Default workdir: `{self.config.default_workdir}`"""
                     f"Workdir: {agent_info.get('workdir', 'N/A')}\n"
                     f"Created: {agent_info['created_at']}"
                 )
+                if agent_info.get("resources"):
+                    msg += f"\nResources: {format_resources(agent_info['resources'])}"
                 if agent_info.get("error"):
                     msg += f"\nError: {agent_info['error']}"
                 return msg
@@ -1140,6 +1147,7 @@ Default workdir: `{self.config.default_workdir}`"""
                     system=system_prompt,
                     max_tokens=1000,
                     tools=tools,
+                    priority="high",  # Someone is waiting on the reply
                 )
 
                 if response.tool_uses:
@@ -1156,7 +1164,7 @@ Default workdir: `{self.config.default_workdir}`"""
         """Build system prompt and context for natural language chat."""
         status = await self.orchestrator.get_status()
         pending = await self.orchestrator.get_pending_approvals()
-        recent_agents = await self.orchestrator.list_agents()
+        recent_agents = await self.orchestrator.list_agents(limit=5)
 
         lines = [
             "Current Gru State:",
@@ -1169,7 +1177,7 @@ Default workdir: `{self.config.default_workdir}`"""
             "Recent agents:",
         ]
 
-        for a in recent_agents[:5]:
+        for a in recent_agents:
             lines.append(f"  - {a['id']} [{a['status']}]: {a['task'][:200]}...")
             if a.get("workdir"):
                 lines.append(f"    workdir: {a['workdir']}")
@@ -25,6 +25,8 @@ from telegram.ext import (
     filters,
 )
 
+from gru.cgroups import format_resources
+
 if TYPE_CHECKING:
     from gru.config import Config
     from gru.orchestrator import Orchestrator
@@ -449,6 +451,8 @@ Default workdir: {self.config.default_workdir}"""
                 f"Workdir: {agent.get('workdir', 'N/A')}\n"
                 f"Created: {agent['created_at']}"
             )
+            if agent.get("resources"):
+                msg += f"\nResources: {format_resources(agent['resources'])}"
             if agent.get("error"):
                 msg += f"\nError: {agent['error']}"
             await update.message.reply_text(msg)  # type: ignore
@@ -601,8 +605,9 @@ Default workdir: {self.config.default_workdir}"""
         for a in results[:10]:  # Limit to 10 results
             display = self._get_agent_display(a["id"])
             status = a["status"]
-            task = a["task"][:200] + "..." if len(a["task"]) > 200 else a["task"]
-            lines.append(f"{display} [{status}] {task}")
+            text = a.get("snippet") or a["task"]
+            text = text[:200] + "..." if len(text) > 200 else text
+            lines.append(f"{display} [{status}] {text}")
 
         await update.message.reply_text("\n".join(lines))  # type: ignore
 
@@ -691,13 +696,13 @@ Default workdir: {self.config.default_workdir}"""
             return
 
         agent_id = self._resolve_agent_ref(args[0]) or args[0]
-        conversation = await self.orchestrator.db.get_conversation(agent_id)
+        conversation = await self.orchestrator.db.get_conversation(agent_id, limit=20)
 
         if not conversation:
             await update.message.reply_text(f"No logs found for agent {agent_id}")  # type: ignore
             return
 
-        lines = [self._format_log_entry(msg) for msg in conversation[-20:]]
+        lines = [self._format_log_entry(msg) for msg in conversation]
         output = "\n\n".join(lines)
         await self.send_output(update.effective_chat.id, output, f"logs_{agent_id}.txt")  # type: ignore
 
@@ -1251,7 +1256,7 @@ Just describe what you want - I'll figure out the rest!"""
         """Build system prompt and context for natural language chat."""
         status = await self.orchestrator.get_status()
         pending = await self.orchestrator.get_pending_approvals()
-        recent_agents = await self.orchestrator.list_agents()
+        recent_agents = await self.orchestrator.list_agents(limit=5)
 
         lines = [
             "Current Gru State:",
@@ -1264,7 +1269,7 @@ Just describe what you want - I'll figure out the rest!"""
             "Recent agents:",
         ]
 
-        for a in recent_agents[:5]:
+        for a in recent_agents:
             lines.append(f"  - {a['id']} [{a['status']}]: {a['task'][:200]}...")
             if a.get("workdir"):
                 lines.append(f"    workdir: {a['workdir']}")
@@ -1632,6 +1637,7 @@ Be concise and helpful."""
                 system=system_prompt,
                 max_tokens=1000,
                 tools=tools,
+                priority="high",  # Someone is waiting on the reply
             )
 
             if response.tool_uses:
@@ -117,6 +117,46 @@ def create_worktree(
         raise RuntimeError(f"Git not found: {e}") from e
 
 
+def restore_worktree(repo_path: Path, worktree_path: Path, branch_name: str) -> WorktreeInfo:
+    """Recreate a missing worktree from its existing branch.
+
+    Args:
+        repo_path: Path to the main git repository
+        worktree_path: Path where the worktree should be recreated
+        branch_name: Existing branch to check out
+
+    Returns:
+        WorktreeInfo with details about the restored worktree
+
+    Raises:
+        RuntimeError: If the worktree cannot be restored
+    """
+    worktree_path.parent.mkdir(parents=True, exist_ok=True)
+
+    try:
+        # Drop stale metadata left by the deleted worktree so its branch can be checked out again
+        subprocess.run(["git", "worktree", "prune"], cwd=repo_path, capture_output=True, text=True, timeout=30)
+        result = subprocess.run(
+            ["git", "worktree", "add", str(worktree_path), branch_name],
+            cwd=repo_path,
+            capture_output=True,
+            text=True,
+            timeout=30,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Failed to restore worktree: {result.stderr}")
+
+        return WorktreeInfo(
+            path=worktree_path,
+            branch=branch_name,
+            base_repo=repo_path,
+        )
+    except subprocess.TimeoutExpired as e:
+        raise RuntimeError(f"Worktree restore timed out: {e}") from e
+    except (FileNotFoundError, NotADirectoryError) as e:
+        raise RuntimeError(f"Cannot restore worktree: {e}") from e
+
+
 def remove_worktree(repo_path: Path, worktree_path: Path, force: bool = False) -> bool:
     """Remove a git worktree.
 
@@ -0,0 +1,115 @@
+"""Tests for Message Batches submission."""
+
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import anthropic
+import httpx
+import pytest
+
+from gru.batches import BatchRequestError, LocalBatches, MessageBatcher
+
+
+def _messages(side_effect=None) -> MagicMock:
+    """Mock messages resource echoing each request's content back."""
+
+    async def create(**params):
+        return SimpleNamespace(content=params["messages"][0]["content"])
+
+    messages = MagicMock()
+    messages.create = AsyncMock(side_effect=side_effect or create)
+    return messages
+
+
+def _params(content: str) -> dict:
+    return {"model": "m", "max_tokens": 10, "messages": [{"role": "user", "content": content}]}
+
+
+class TestMessageBatcher:
+    """Tests for collecting requests into batches."""
+
+    @pytest.mark.asyncio
+    async def test_requests_collected_into_one_batch(self):
+        """Test concurrent requests are submitted together and each gets its own message."""
+        backend = LocalBatches(_messages())
+        backend.create = AsyncMock(side_effect=backend.create)
+        batcher = MessageBatcher(backend, collect_seconds=0.05, poll_interval=0.01)
+
+        results = await asyncio.gather(*(batcher.submit(_params(f"turn {i}")) for i in range(3)))
+
+        assert [r.content for r in results] == ["turn 0", "turn 1", "turn 2"]
+        assert backend.create.await_count == 1
+        assert len(backend.create.call_args.kwargs["requests"]) == 3
+
+    @pytest.mark.asyncio
+    async def test_full_batch_submitted_immediately(self):
+        """Test reaching max_size submits without waiting for the collection window."""
+        batcher = MessageBatcher(LocalBatches(_messages()), max_size=2, collect_seconds=60, poll_interval=0.01)
+
+        results = await asyncio.wait_for(asyncio.gather(batcher.submit(_params("a")), batcher.submit(_params("b"))), 1)
+
+        assert [r.content for r in results] == ["a", "b"]
+
+    @pytest.mark.asyncio
+    async def test_errored_result(self):
+        """Test a failed request raises for its caller only."""
+        request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+
+        async def create(**params):
+            if params["messages"][0]["content"] == "bad":
+                raise anthropic.BadRequestError(
+                    "invalid",
+                    response=httpx.Response(400, request=request),
+                    body={"error": {"type": "invalid_request_error", "message": "invalid"}},
+                )
+            return SimpleNamespace(content="ok")
+
+        batcher = MessageBatcher(LocalBatches(_messages(create)), collect_seconds=0.01, poll_interval=0.01)
+
+        good, bad = await asyncio.gather(
+            batcher.submit(_params("good")), batcher.submit(_params("bad")), return_exceptions=True
+        )
+
+        assert good.content == "ok"
+        assert isinstance(bad, BatchRequestError)
+        assert bad.error_type == "invalid_request_error"
+        assert not bad.resendable
+
+    @pytest.mark.asyncio
+    async def test_cancelled_request_not_sent(self):
+        """Test a caller cancelled during the collection window drops its request."""
+        backend = LocalBatches(_messages())
+        backend.create = AsyncMock(side_effect=backend.create)
+        batcher = MessageBatcher(backend, collect_seconds=0.05, poll_interval=0.01)
+
+        cancelled = asyncio.create_task(batcher.submit(_params("gone")))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        result = await batcher.submit(_params("kept"))
+
+        assert result.content == "kept"
+        assert [r["custom_id"] for r in backend.create.call_args.kwargs["requests"]] == ["req_2"]
+
+    @pytest.mark.asyncio
+    async def test_close_cancels_waiting_requests(self):
+        """Test close cancels requests still waiting on their batch."""
+        batcher = MessageBatcher(LocalBatches(_messages()), collect_seconds=60)
+        waiting = asyncio.create_task(batcher.submit(_params("a")))
+        await asyncio.sleep(0)
+
+        await batcher.close()
+
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+
+def test_resendable():
+    """Test which batch results may be retried as ordinary requests."""
+    assert BatchRequestError("expired").resendable
+    assert BatchRequestError("canceled").resendable
+    assert BatchRequestError("errored", "overloaded_error").resendable
+    assert not BatchRequestError("errored", "invalid_request_error").resendable
+    assert not BatchRequestError("missing").resendable
@@ -0,0 +1,174 @@
+"""Tests for cgroup v2 resource limits."""
+
+from __future__ import annotations
+
+import subprocess
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from gru.cgroups import (
+    cpu_max,
+    create_agent_cgroup,
+    format_resources,
+    parse_memory_limit,
+    read_usage,
+    remove_agent_cgroup,
+    wrap_command,
+)
+
+
+@pytest.fixture
+def cgroup_root():
+    """Create a fake cgroup v2 hierarchy with cpu and memory delegated."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        root = Path(tmpdir)
+        (root / "cgroup.controllers").write_text("cpuset cpu io memory pids\n")
+        (root / "cgroup.subtree_control").write_text("")
+        base = root / "gru"
+        base.mkdir()
+        # A real kernel populates these when the directory is created
+        (base / "cgroup.controllers").write_text("cpu memory\n")
+        (base / "cgroup.subtree_control").write_text("")
+        yield base
+
+
+class TestLimits:
+    """Tests for limit conversion."""
+
+    @pytest.mark.parametrize(
+        ("value", "expected"),
+        [
+            ("512M", str(512 * 1024**2)),
+            ("2G", str(2 * 1024**3)),
+            ("64k", str(64 * 1024)),
+            ("1GB", str(1024**3)),
+            ("4096", "4096"),
+            ("max", "max"),
+        ],
+    )
+    def test_parse_memory_limit(self, value, expected):
+        """Test memory limits are converted to bytes."""
+        assert parse_memory_limit(value) == expected
+
+    def test_parse_memory_limit_invalid(self):
+        """Test malformed memory limits are rejected."""
+        with pytest.raises(ValueError, match="Invalid memory limit"):
+            parse_memory_limit("lots")
+
+    def test_cpu_max(self):
+        """Test CPU quota percent maps onto the cpu.max period."""
+        assert cpu_max(50) == "50000 100000"
+        assert cpu_max(200) == "200000 100000"
+        assert cpu_max(0) == "max 100000"
+        assert cpu_max(None) == "max 100000"
+
+
+class TestCreateAgentCgroup:
+    """Tests for creating agent cgroups."""
+
+    def test_writes_limits(self, cgroup_root):
+        """Test the agent cgroup gets memory.max and cpu.max."""
+        path = create_agent_cgroup(cgroup_root, "abc", "256M", 25)
+
+        assert path == cgroup_root / "agent-abc"
+        assert (path / "memory.max").read_text() == str(256 * 1024**2)
+        assert (path / "cpu.max").read_text() == "25000 100000"
+        assert (cgroup_root / "cgroup.subtree_control").read_text() == "+cpu +memory"
+
+    def test_no_cgroup_v2(self):
+        """Test a missing unified hierarchy is reported."""
+        with tempfile.TemporaryDirectory() as tmpdir, pytest.raises(RuntimeError, match="cgroup v2 not available"):
+            create_agent_cgroup(Path(tmpdir) / "gru", "abc", "512M", 50)
+
+    def test_controllers_not_delegated(self, cgroup_root):
+        """Test a base cgroup without the memory controller is rejected."""
+        (cgroup_root / "cgroup.controllers").write_text("cpu\n")
+        with pytest.raises(RuntimeError, match="memory"):
+            create_agent_cgroup(cgroup_root, "abc", "512M", 50)
+
+    def test_invalid_memory_limit(self, cgroup_root):
+        """Test an invalid limit surfaces as RuntimeError."""
+        with pytest.raises(RuntimeError, match="Invalid memory limit"):
+            create_agent_cgroup(cgroup_root, "abc", "lots", 50)
+
+
+class TestWrapCommand:
+    """Tests for joining a cgroup from the shell."""
+
+    def test_joins_before_running(self, cgroup_root):
+        """Test the shell writes itself into cgroup.procs, then runs the command."""
+        path = create_agent_cgroup(cgroup_root, "abc", "512M", 50)
+        result = subprocess.run(wrap_command(path, "echo ran"), shell=True, capture_output=True, text=True, check=False)
+
+        assert result.stdout == "ran\n"
+        assert (path / "cgroup.procs").read_text() == "0\n"
+
+    def test_refuses_to_run_outside_cgroup(self, cgroup_root):
+        """Test the command does not run when joining the cgroup fails."""
+        result = subprocess.run(
+            wrap_command(cgroup_root / "missing", "echo ran"), shell=True, capture_output=True, text=True, check=False
+        )
+
+        assert result.returncode == 125
+        assert "ran" not in result.stdout
+
+
+class TestUsage:
+    """Tests for reading and formatting usage."""
+
+    def test_read_usage(self, cgroup_root):
+        """Test usage is read from the cgroup's stat files."""
+        path = create_agent_cgroup(cgroup_root, "abc", "512M", 50)
+        (path / "memory.current").write_text("1048576\n")
+        (path / "memory.peak").write_text("2097152\n")
+        (path / "cpu.stat").write_text("usage_usec 1500000\nuser_usec 1000000\nsystem_usec 500000\n")
+        (path / "memory.events").write_text("low 0\nhigh 0\nmax 3\noom 1\noom_kill 1\n")
+
+        usage = read_usage(path)
+
+        assert usage == {
+            "memory_current": 1048576,
+            "memory_peak": 2097152,
+            "memory_max": 512 * 1024**2,
+            "cpu_usage_usec": 1500000,
+            "oom_kills": 1,
+        }
+        assert format_resources(usage) == "mem 1.0MB (peak 2.0MB) / 512.0MB, CPU 1.5s, OOM kills: 1"
+
+    def test_read_usage_unlimited(self, cgroup_root):
+        """Test an unlimited cgroup reports no memory maximum."""
+        path = create_agent_cgroup(cgroup_root, "abc", "max", None)
+
+        usage = read_usage(path)
+
+        assert usage["memory_max"] is None
+        assert format_resources(usage) == "mem 0.0MB, CPU 0.0s"
+
+    def test_read_usage_removed(self, cgroup_root):
+        """Test a removed cgroup has no usage."""
+        assert read_usage(cgroup_root / "agent-gone") is None
+
+
+class TestRemoveAgentCgroup:
+    """Tests for removing agent cgroups."""
+
+    def test_remove_missing(self, cgroup_root):
+        """Test removing a cgroup that is already gone succeeds."""
+        assert remove_agent_cgroup(cgroup_root / "agent-gone") is True
+
+    def test_remove_empty(self, cgroup_root):
+        """Test an empty cgroup directory is removed."""
+        path = cgroup_root / "agent-abc"
+        path.mkdir()
+
+        assert remove_agent_cgroup(path) is True
+        assert not path.exists()
+
+    def test_remove_failure(self, cgroup_root):
+        """Test failure to remove is reported rather than raised."""
+        path = create_agent_cgroup(cgroup_root, "abc", "512M", 50)
+
+        # A regular directory with files in it cannot be rmdir'ed, like a busy cgroup
+        assert remove_agent_cgroup(path) is False
@@ -2,22 +2,31 @@
 
 from __future__ import annotations
 
+import asyncio
+import time
 from dataclasses import dataclass
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import anthropic
 import pytest
 
+from gru.batches import BatchRequestError
 from gru.claude import (
     DEFAULT_TOOLS,
+    MAX_RETRIES,
     ClaudeClient,
     Response,
+    StreamInterruptedError,
     ToolDefinition,
+    ToolRegistry,
     ToolResult,
+    ToolSet,
     ToolUse,
     retry_with_backoff,
 )
 from gru.config import Config
+from gru.mcp import MCPClient
+from gru.ratelimit import RateGovernor
 
 
 @dataclass
@@ -175,6 +184,7 @@ async def test_send_message_text_response(client):
     assert response.stop_reason == "end_turn"
     assert response.usage["input_tokens"] == 10
     assert response.usage["output_tokens"] == 20
+    assert response.usage["cache_read_input_tokens"] == 0
 
 
 @pytest.mark.asyncio
@@ -189,7 +199,141 @@ async def test_send_message_with_system_prompt(client):
     )
 
     call_kwargs = client._client.messages.create.call_args.kwargs
-    assert call_kwargs["system"] == "You are a helpful assistant."
+    assert call_kwargs["system"][0]["text"] == "You are a helpful assistant."
+
+
+@pytest.mark.asyncio
+async def test_send_message_cache_breakpoints(client):
+    """Test cache breakpoints on system prompt, last tool and last message."""
+    mock_response = MockResponse(content=[MockTextBlock(text="Response")])
+    client._client.messages.create = AsyncMock(return_value=mock_response)
+    messages = [
+        {"role": "user", "content": "Hi"},
+        {"role": "assistant", "content": "Hello"},
+        {"role": "user", "content": "Do it"},
+    ]
+
+    await client.send_message(messages=messages, system="System prompt", tools=DEFAULT_TOOLS)
+
+    call_kwargs = client._client.messages.create.call_args.kwargs
+    assert call_kwargs["system"] == [{"type": "text", "text": "System prompt", "cache_control": {"type": "ephemeral"}}]
+    assert call_kwargs["tools"][-1]["cache_control"] == {"type": "ephemeral"}
+    assert all("cache_control" not in t for t in call_kwargs["tools"][:-1])
+    sent = call_kwargs["messages"]
+    assert sent[-1]["content"] == [{"type": "text", "text": "Do it", "cache_control": {"type": "ephemeral"}}]
+    assert sent[:2] == messages[:2]
+    # Caller's history is left untouched
+    assert messages[-1] == {"role": "user", "content": "Do it"}
+
+
+@pytest.mark.asyncio
+async def test_send_message_cache_breakpoint_on_tool_results(client):
+    """Test the breakpoint lands on the last tool_result block without mutating it."""
+    mock_response = MockResponse(content=[MockTextBlock(text="Response")])
+    client._client.messages.create = AsyncMock(return_value=mock_response)
+    result_block = {"type": "tool_result", "tool_use_id": "tu_1", "content": "ok"}
+
+    await client.send_message(messages=[{"role": "user", "content": [result_block]}])
+
+    sent = client._client.messages.create.call_args.kwargs["messages"]
+    assert sent[-1]["content"][-1]["cache_control"] == {"type": "ephemeral"}
+    assert "cache_control" not in result_block
+
+
+@pytest.mark.asyncio
+async def test_send_message_caching_disabled(client, config):
+    """Test prompt caching can be turned off."""
+    config.prompt_caching = False
+    mock_response = MockResponse(content=[MockTextBlock(text="Response")])
+    client._client.messages.create = AsyncMock(return_value=mock_response)
+
+    await client.send_message(messages=[{"role": "user", "content": "Hi"}], system="Plain", tools=DEFAULT_TOOLS)
+
+    call_kwargs = client._client.messages.create.call_args.kwargs
+    assert call_kwargs["system"] == "Plain"
+    assert call_kwargs["messages"] == [{"role": "user", "content": "Hi"}]
+    assert all("cache_control" not in t for t in call_kwargs["tools"])
+
+
+@pytest.mark.asyncio
+async def test_send_message_reuses_tool_payload(client):
+    """Test a ToolSet is serialized once and shared by every request."""
+    mock_response = MockResponse(content=[MockTextBlock(text="Response")])
+    client._client.messages.create = AsyncMock(return_value=mock_response)
+    tool_set = ToolSet(DEFAULT_TOOLS)
+
+    await client.send_message(messages=[{"role": "user", "content": "Hi"}], tools=tool_set)
+    first = client._client.messages.create.call_args.kwargs["tools"]
+    await client.send_message(messages=[{"role": "user", "content": "Again"}], tools=tool_set)
+
+    assert client._client.messages.create.call_args.kwargs["tools"] is first
+    assert first[-1]["cache_control"] == {"type": "ephemeral"}
+    assert "cache_control" not in tool_set.payload(False)[-1]
+
+
+@pytest.mark.asyncio
+async def test_send_message_batched(config):
+    """Test batched requests go through Message Batches and skip the rate governor."""
+    config.batch_backend = "local"
+    config.batch_collect_seconds = 0.01
+    config.batch_poll_interval = 0.01
+    client = ClaudeClient(config)
+    client._client.messages.create = AsyncMock(return_value=MockResponse(content=[MockTextBlock(text="Done")]))
+    client.governor.acquire = AsyncMock()
+
+    responses = await asyncio.gather(
+        *(client.send_message(messages=[{"role": "user", "content": f"Task {i}"}], batch=True) for i in range(2))
+    )
+
+    assert [r.content for r in responses] == ["Done", "Done"]
+    assert client._client.messages.create.await_count == 2
+    client.governor.acquire.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_send_message_batch_expired_resent(client):
+    """Test an expired batched request is sent again directly."""
+    client.batcher.submit = AsyncMock(side_effect=BatchRequestError("expired"))
+    client._client.messages.create = AsyncMock(return_value=MockResponse(content=[MockTextBlock(text="Direct")]))
+
+    response = await client.send_message(messages=[{"role": "user", "content": "Hi"}], batch=True)
+
+    assert response.content == "Direct"
+
+
+def test_tool_registry_subsets_and_invalidation():
+    """Test tool sets are cached per subset until the MCP tools change."""
+    mcp = MCPClient()
+    registry = ToolRegistry(DEFAULT_TOOLS, mcp)
+    subset = frozenset({"bash", "read_file"})
+
+    everything = registry.tool_set()
+    assert registry.tool_set() is everything
+    assert [t.name for t in registry.tool_set(subset)] == ["bash", "read_file"]
+
+    extra = ToolDefinition(name="srv__search", description="Search", input_schema={"type": "object"})
+    mcp._all_tools.append(extra)
+    assert registry.tool_set() is everything
+    mcp.tools_version += 1
+
+    assert registry.tool_set() is not everything
+    assert "srv__search" in registry.tool_set().names
+    assert "srv__search" not in registry.tool_set(subset).names
+
+
+@pytest.mark.asyncio
+async def test_send_message_cache_usage(client):
+    """Test cache read/creation token counts are reported."""
+    usage = MockUsage()
+    usage.cache_read_input_tokens = 900
+    usage.cache_creation_input_tokens = 50
+    mock_response = MockResponse(content=[MockTextBlock(text="Response")], usage=usage)
+    client._client.messages.create = AsyncMock(return_value=mock_response)
+
+    response = await client.send_message(messages=[{"role": "user", "content": "Hi"}])
+
+    assert response.usage["cache_read_input_tokens"] == 900
+    assert response.usage["cache_creation_input_tokens"] == 50
 
 
 @pytest.mark.asyncio
@@ -504,3 +648,187 @@ async def test_send_message_with_retry(client):
 
     assert response.content == "Success"
     assert call_count == 2
+
+
+class MockStream:
+    """Mock Anthropic message stream yielding preset events."""
+
+    def __init__(self, events: list, final: MockResponse):
+        self._events = events
+        self._final = final
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def __aiter__(self):
+        for event in self._events:
+            yield event
+
+    async def get_final_message(self):
+        return self._final
+
+
+@pytest.mark.asyncio
+async def test_stream_turn_reports_text_and_tool_uses(client):
+    """Test stream_turn forwards text deltas and completed tool_use blocks."""
+    tool_block = MockToolUseBlock(id="tu1", name="bash", input={"command": "ls"})
+    events = [
+        MagicMock(type="text", text="Let me "),
+        MagicMock(type="text", text="check."),
+        MagicMock(type="content_block_stop", content_block=MockTextBlock(text="Let me check.")),
+        MagicMock(type="content_block_stop", content_block=tool_block),
+    ]
+    final = MockResponse(content=[MockTextBlock(text="Let me check."), tool_block], stop_reason="tool_use")
+    client._client.messages.stream = MagicMock(return_value=MockStream(events, final))
+
+    texts: list[str] = []
+    dispatched: list[ToolUse] = []
+
+    async def on_text(text):
+        texts.append(text)
+
+    async def on_tool_use(tool_use):
+        dispatched.append(tool_use)
+
+    response = await client.stream_turn(
+        messages=[{"role": "user", "content": "Hi"}],
+        on_text=on_text,
+        on_tool_use=on_tool_use,
+    )
+
+    assert texts == ["Let me ", "check."]
+    assert [t.id for t in dispatched] == ["tu1"]
+    assert response.content == "Let me check."
+    assert response.tool_uses[0].input == {"command": "ls"}
+    assert response.stop_reason == "tool_use"
+    assert response.usage["input_tokens"] == 10
+
+
+@pytest.mark.asyncio
+async def test_stream_turn_no_retry_after_tool_dispatch(client):
+    """Test a stream failing after a tool was dispatched is not retried."""
+    tool_block = MockToolUseBlock(id="tu1", name="bash", input={"command": "ls"})
+    calls = 0
+
+    class FailingStream(MockStream):
+        async def __aiter__(self):
+            yield MagicMock(type="message_start", message=MockResponse())
+            yield MagicMock(type="text", text="Listing")
+            yield MagicMock(type="content_block_stop", content_block=tool_block)
+            yield MagicMock(type="message_delta", usage=MagicMock(output_tokens=7))
+            raise anthropic.APIConnectionError(request=MagicMock())
+
+    def mock_stream(**kwargs):
+        nonlocal calls
+        calls += 1
+        return FailingStream([], MockResponse())
+
+    client._client.messages.stream = mock_stream
+
+    async def on_tool_use(tool_use):
+        pass
+
+    with patch("gru.claude.BASE_DELAY", 0.01), pytest.raises(StreamInterruptedError) as exc_info:
+        await client.stream_turn(messages=[{"role": "user", "content": "Hi"}], on_tool_use=on_tool_use)
+
+    assert calls == 1
+    assert [t.id for t in exc_info.value.dispatched] == ["tu1"]
+    assert exc_info.value.text == "Listing"
+    assert exc_info.value.usage["input_tokens"] == 10
+    assert exc_info.value.usage["output_tokens"] == 7
+
+
+@pytest.mark.asyncio
+async def test_stream_turn_retry_calls_on_retry(client):
+    """Test on_retry runs before a stream that failed without dispatching is retried."""
+    calls = 0
+
+    class FailingStream(MockStream):
+        async def __aiter__(self):
+            yield MagicMock(type="text", text="partial")
+            raise anthropic.APIConnectionError(request=MagicMock())
+
+    def mock_stream(**kwargs):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            return FailingStream([], MockResponse())
+        return MockStream([MagicMock(type="text", text="full")], MockResponse(content=[MockTextBlock(text="full")]))
+
+    client._client.messages.stream = mock_stream
+    events: list[str] = []
+
+    async def on_text(text):
+        events.append(text)
+
+    async def on_retry():
+        events.append("retry")
+
+    with patch("gru.claude.BASE_DELAY", 0.01):
+        response = await client.stream_turn(
+            messages=[{"role": "user", "content": "Hi"}], on_text=on_text, on_retry=on_retry
+        )
+
+    assert events == ["partial", "retry", "full"]
+    assert response.content == "full"
+
+
+def _rate_limit_error(retry_after: str | None = "0") -> anthropic.RateLimitError:
+    headers = {"retry-after": retry_after} if retry_after is not None else {}
+    return anthropic.RateLimitError(
+        message="Rate limited",
+        response=MagicMock(status_code=429, headers=headers),
+        body={"error": {"message": "Rate limited"}},
+    )
+
+
+@pytest.mark.asyncio
+async def test_send_message_waits_out_rate_limits(client):
+    """Test 429s are waited out by the governor rather than failing after the usual retries."""
+    call_count = 0
+
+    async def mock_create(**kwargs):
+        nonlocal call_count
+        call_count += 1
+        if call_count <= MAX_RETRIES + 2:
+            raise _rate_limit_error("0.01")
+        return MockResponse(content=[MockTextBlock(text="Success")])
+
+    client._client.messages.create = mock_create
+
+    response = await client.send_message(messages=[{"role": "user", "content": "Hi"}])
+
+    assert response.content == "Success"
+    assert call_count == MAX_RETRIES + 3
+
+
+@pytest.mark.asyncio
+async def test_send_message_charges_actual_usage(client):
+    """Test the governor is charged the request's real token usage."""
+    client.governor = RateGovernor(input_tokens_per_minute=60000, output_tokens_per_minute=60000)
+    usage = MockUsage()
+    usage.input_tokens = 1500
+    usage.output_tokens = 300
+    client._client.messages.create = AsyncMock(return_value=MockResponse(content=[], usage=usage))
+
+    await client.send_message(messages=[{"role": "user", "content": "Hi"}], priority="high")
+
+    assert client.governor.buckets["input_tokens"].level == pytest.approx(58500, abs=50)
+    assert client.governor.buckets["output_tokens"].level == pytest.approx(59700, abs=50)
+
+
+@pytest.mark.asyncio
+async def test_observe_response_headers(client):
+    """Test every response's rate-limit headers reach the governor, and 429s pause it."""
+    response = MagicMock(
+        status_code=429,
+        headers={"anthropic-ratelimit-requests-limit": "50", "retry-after": "0.1"},
+    )
+
+    await client._observe_response(response)
+
+    assert client.governor.buckets["requests"].capacity == 50
+    assert client.governor._delay({"requests": 1}, time.monotonic()) > 0.05
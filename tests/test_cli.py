@@ -148,6 +148,15 @@ class TestSpawnCommand:
         assert call_kwargs["priority"] == "high"
         assert call_kwargs["supervised"] is False
 
+    def test_spawn_with_bash_timeout(self, runner, mock_db, mock_crypto, mock_secrets, mock_orchestrator):
+        """Test spawn with a per-agent bash timeout."""
+        with setup_cli_mocks(mock_db, mock_crypto, mock_secrets, mock_orchestrator):
+            result = runner.invoke(cli, ["spawn", "test task", "--bash-timeout", "600"])
+
+        assert result.exit_code == 0
+        call_kwargs = mock_orchestrator.spawn_agent.call_args.kwargs
+        assert call_kwargs["bash_timeout"] == 600
+
     def test_spawn_with_model(self, runner, mock_db, mock_crypto, mock_secrets, mock_orchestrator):
         """Test spawn with model option."""
         with setup_cli_mocks(mock_db, mock_crypto, mock_secrets, mock_orchestrator):
@@ -371,11 +380,12 @@ class TestLogsCommand:
             {"role": "assistant", "content": "Hi there"},
         ]
         with setup_cli_mocks(mock_db, mock_crypto, mock_secrets, mock_orchestrator):
-            result = runner.invoke(cli, ["logs", "agent-123"])
+            result = runner.invoke(cli, ["logs", "agent-123", "-t", "5"])
 
         assert result.exit_code == 0
         assert "[USER]" in result.output
         assert "[ASSISTANT]" in result.output
+        mock_db.get_conversation.assert_called_once_with("agent-123", limit=5)
 
     def test_logs_with_list_content(self, runner, mock_db, mock_crypto, mock_secrets, mock_orchestrator):
         """Test logs with list content (tool uses)."""
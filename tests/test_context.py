@@ -0,0 +1,164 @@
+"""Tests for the token-budget context window."""
+
+from __future__ import annotations
+
+from gru.context import ContextWindow, estimate_tokens, summarize_message
+
+
+def _tool_turn(i: int, output: str = "ok") -> list[dict]:
+    """Build an assistant tool_use message and its tool_result."""
+    return [
+        {
+            "role": "assistant",
+            "content": [{"type": "tool_use", "id": f"tu{i}", "name": "bash", "input": {"command": f"step {i}"}}],
+        },
+        {"role": "user", "content": [{"type": "tool_result", "tool_use_id": f"tu{i}", "content": output}]},
+    ]
+
+
+def _assert_pairs_intact(messages: list[dict]) -> None:
+    """Check every tool_result refers to a tool_use that is still present."""
+    tool_use_ids = {
+        b["id"] for m in messages if isinstance(m["content"], list) for b in m["content"] if b.get("type") == "tool_use"
+    }
+    for m in messages:
+        if isinstance(m["content"], list):
+            for b in m["content"]:
+                if b.get("type") == "tool_result":
+                    assert b["tool_use_id"] in tool_use_ids
+
+
+class TestEstimateTokens:
+    """Tests for token estimation."""
+
+    def test_string_content(self):
+        """Test plain text is estimated at about four characters per token."""
+        assert estimate_tokens({"role": "user", "content": "x" * 400}) == 104
+
+    def test_blocks(self):
+        """Test tool blocks count their inputs and results."""
+        small = estimate_tokens(_tool_turn(1)[1])
+        large = estimate_tokens(_tool_turn(1, "x" * 4000)[1])
+        assert large - small >= 999
+        assert estimate_tokens(_tool_turn(1)[0]) > estimate_tokens({"role": "assistant", "content": []})
+
+
+class TestContextWindow:
+    """Tests for trimming conversations to a budget."""
+
+    def test_under_budget_unchanged(self):
+        """Test a conversation within both limits is returned as-is."""
+        window = ContextWindow(token_budget=10000, max_messages=50)
+        messages = [{"role": "user", "content": "task"}, *_tool_turn(1)]
+        assert window.build(messages) is messages
+
+    def test_large_tool_result_triggers_trim(self):
+        """Test a few huge messages are trimmed even under the message limit."""
+        window = ContextWindow(token_budget=2000, max_messages=50)
+        messages = [{"role": "user", "content": "task"}]
+        for i in range(4):
+            messages += _tool_turn(i, "x" * 4000)
+
+        result = window.build(messages)
+
+        assert result[0]["content"] == "task"
+        assert "truncated" in result[1]["content"]
+        assert sum(estimate_tokens(m) for m in result) <= 2000
+        assert result[-1] is messages[-1]
+        _assert_pairs_intact(result)
+
+    def test_small_messages_kept(self):
+        """Test many tiny messages fit the token budget up to the message limit."""
+        window = ContextWindow(token_budget=100000, max_messages=100)
+        messages = [{"role": "user", "content": "task"}]
+        for i in range(40):
+            messages += _tool_turn(i)
+
+        assert window.build(messages) is messages
+
+    def test_never_splits_tool_pairs(self):
+        """Test the cut moves past a tool_result whose tool_use would be dropped."""
+        window = ContextWindow(token_budget=100000, max_messages=10)
+        messages = [{"role": "user", "content": "task"}]
+        for i in range(20):
+            messages += _tool_turn(i)
+            _assert_pairs_intact(window.build(messages))
+
+    def test_prefix_stable_between_trims(self):
+        """Test the kept prefix stays identical until the budget is exceeded again."""
+        window = ContextWindow(token_budget=3000, max_messages=1000)
+        messages = [{"role": "user", "content": "task"}]
+        for i in range(6):
+            messages += _tool_turn(i, "x" * 2000)
+        first = window.build(messages)
+
+        messages += _tool_turn(6, "small")
+        second = window.build(messages)
+
+        assert second[: len(first)] == first
+
+    def test_cut_only_moves_forward(self):
+        """Test later turns never bring back messages that were already dropped."""
+        window = ContextWindow(token_budget=3000, max_messages=1000)
+        messages = [{"role": "user", "content": "task"}]
+        removed = 0
+        for i in range(30):
+            messages += _tool_turn(i, "x" * (2000 if i % 3 == 0 else 10))
+            result = window.build(messages)
+            now_removed = len(messages) - len(result) + (1 if result is not messages else 0)
+            assert now_removed >= removed
+            removed = now_removed
+
+    def test_new_list_resets(self):
+        """Test passing a different list re-indexes from scratch."""
+        window = ContextWindow(token_budget=2000, max_messages=50)
+        big = [{"role": "user", "content": "task"}, *_tool_turn(0, "x" * 10000), *_tool_turn(1)]
+        assert window.build(big) is not big
+
+        small = [{"role": "user", "content": "task"}, *_tool_turn(0)]
+        assert window.build(small) is small
+
+    def test_summary(self):
+        """Test dropped turns are summarized when enabled."""
+        window = ContextWindow(token_budget=2000, max_messages=50, summarize=True)
+        messages = [{"role": "user", "content": "task"}]
+        for i in range(4):
+            messages += _tool_turn(i, "x" * 4000)
+
+        notice = window.build(messages)[1]["content"]
+
+        assert "Summary of removed turns" in notice
+        assert 'called bash {"command": "step 0"}' in notice
+
+
+class TestSummarizeMessage:
+    """Tests for message summaries."""
+
+    def test_text_and_tools(self):
+        """Test text and tool calls each get a line."""
+        message = {
+            "role": "assistant",
+            "content": [
+                {"type": "text", "text": "Running the tests\nnow"},
+                {"type": "tool_use", "id": "t1", "name": "bash", "input": {"command": "pytest"}},
+            ],
+        }
+        assert summarize_message(message) == ["assistant: Running the tests now", 'called bash {"command": "pytest"}']
+
+    def test_failed_results(self):
+        """Test tool results are reduced to a failure count."""
+        message = {
+            "role": "user",
+            "content": [
+                {"type": "tool_result", "tool_use_id": "t1", "content": "boom", "is_error": True},
+                {"type": "tool_result", "tool_use_id": "t2", "content": "ok", "is_error": False},
+            ],
+        }
+        assert summarize_message(message) == ["1 tool call(s) failed"]
+
+    def test_long_text_clipped(self):
+        """Test long text is clipped to one line."""
+        lines = summarize_message({"role": "user", "content": "y" * 1000})
+        assert len(lines) == 1
+        assert lines[0].endswith("...")
+        assert len(lines[0]) <= 160
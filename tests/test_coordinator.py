@@ -2,8 +2,10 @@
 
 from __future__ import annotations
 
+import asyncio
 import tempfile
 from pathlib import Path
+from unittest.mock import patch
 
 import pytest
 
@@ -214,6 +216,48 @@ async def test_broadcast_with_exclude(coordinator, db):
     assert len(messages2) == 1
 
 
+@pytest.mark.asyncio
+async def test_broadcast_recursive(coordinator, db):
+    """Test a recursive broadcast reaches agents on nested subtasks."""
+    for agent_id in ("sender", "child", "grandchild", "unrelated"):
+        await db.create_agent(agent_id=agent_id, task="Task", model="test")
+    await db.create_task(task_id="main_task", agent_id="sender")
+    await db.create_task(task_id="sub_task", agent_id="child", parent_task_id="main_task")
+    await db.create_task(task_id="sub_sub_task", agent_id="grandchild", parent_task_id="sub_task")
+    await db.create_task(task_id="other_task", agent_id="unrelated")
+
+    shallow = await coordinator.broadcast(from_agent="sender", content="direct", task_id="main_task")
+    deep = await coordinator.broadcast(from_agent="sender", content="all", task_id="main_task", recursive=True)
+
+    assert len(shallow) == 1
+    assert len(deep) == 2
+    assert [m["content"] for m in await coordinator.get_messages("grandchild")] == ["all"]
+    assert await coordinator.get_messages("unrelated") == []
+
+
+@pytest.mark.asyncio
+async def test_broadcast_single_batch(coordinator, db):
+    """Test a broadcast stores every message with one batched insert and pushes to mailboxes."""
+    await db.create_agent(agent_id="sender", task="Main", model="test")
+    await db.create_task(task_id="main_task", agent_id="sender")
+    for i in range(5):
+        await db.create_agent(agent_id=f"worker{i}", task="Sub", model="test")
+        await db.create_task(task_id=f"sub{i}", agent_id=f"worker{i}", parent_task_id="main_task")
+    await coordinator.open_mailbox("worker0")
+
+    with (
+        patch.object(db, "send_agent_message", side_effect=AssertionError("per-message insert")),
+        patch.object(db, "executemany", wraps=db.executemany) as executemany,
+    ):
+        msg_ids = await coordinator.broadcast(from_agent="sender", content="go", task_id="main_task")
+
+    assert len(msg_ids) == 5
+    assert executemany.call_count == 1
+    pushed = await coordinator.receive("worker0")
+    assert [m["content"] for m in pushed] == ["go"]
+    assert len(await coordinator.get_messages("worker4")) == 1
+
+
 @pytest.mark.asyncio
 async def test_request_handoff(coordinator, agents, db):
     """Test requesting a task handoff."""
@@ -274,6 +318,83 @@ async def test_get_context_missing_key(coordinator, db):
     assert value is None
 
 
+@pytest.mark.asyncio
+async def test_get_context_served_from_cache(coordinator, db):
+    """Test repeated reads after a write don't touch the database."""
+    await db.create_agent(agent_id="agent1", task="Task", model="test")
+    await db.create_task(task_id="task1", agent_id="agent1")
+    await coordinator.set_context("task1", "key1", "value1", "agent1")
+    await coordinator.get_context("task1")
+
+    with (
+        patch.object(db, "get_shared_context", side_effect=AssertionError("loaded all")),
+        patch.object(db, "get_shared_context_entries", side_effect=AssertionError("loaded all")),
+        patch.object(db, "get_shared_context_entry", side_effect=AssertionError("loaded key")),
+    ):
+        assert await coordinator.get_context("task1", "key1") == "value1"
+        assert await coordinator.get_context("task1", "missing") is None
+        assert await coordinator.get_context("task1") == {"key1": "value1"}
+
+
+@pytest.mark.asyncio
+async def test_forget_task(coordinator, db):
+    """Test a forgotten task's context is dropped from the cache but still readable."""
+    await db.create_agent(agent_id="agent1", task="Task", model="test")
+    await db.create_task(task_id="task1", agent_id="agent1")
+    await coordinator.set_context("task1", "key1", "value1", "agent1")
+    await coordinator.get_context("task1")
+
+    coordinator.forget_task("task1")
+
+    assert "task1" not in coordinator._context
+    assert "task1" not in coordinator._context_loaded
+    assert await coordinator.get_context("task1") == {"key1": "value1"}
+
+
+@pytest.mark.asyncio
+async def test_get_context_single_key_query(coordinator, db):
+    """Test a cold single-key read loads only that key."""
+    await db.create_agent(agent_id="agent1", task="Task", model="test")
+    await db.create_task(task_id="task1", agent_id="agent1")
+    await db.set_shared_context("task1", "key1", "value1", "agent1")
+    await db.set_shared_context("task1", "key2", "value2", "agent1")
+
+    with patch.object(db, "get_shared_context", side_effect=AssertionError("loaded all")):
+        assert await coordinator.get_context("task1", "key2") == "value2"
+
+
+@pytest.mark.asyncio
+async def test_compare_and_set_context(coordinator, db):
+    """Test compare-and-set only succeeds against the current version."""
+    await db.create_agent(agent_id="agent1", task="Task", model="test")
+    await db.create_agent(agent_id="agent2", task="Task", model="test")
+    await db.create_task(task_id="task1", agent_id="agent1")
+
+    assert await coordinator.compare_and_set_context("task1", "owner", "agent1", "agent1", 0) == (True, 1)
+    assert await coordinator.compare_and_set_context("task1", "owner", "agent2", "agent2", 0) == (False, 1)
+    assert await coordinator.get_context_entry("task1", "owner") == ("agent1", 1)
+    assert await coordinator.compare_and_set_context("task1", "owner", "agent2", "agent2", 1) == (True, 2)
+    assert await coordinator.get_context("task1", "owner") == "agent2"
+
+
+@pytest.mark.asyncio
+async def test_wait_for_context(coordinator, db):
+    """Test a waiter wakes when the key passes the given version."""
+    await db.create_agent(agent_id="agent1", task="Task", model="test")
+    await db.create_task(task_id="task1", agent_id="agent1")
+    await coordinator.set_context("task1", "status", "working", "agent1")
+
+    waiter = asyncio.create_task(coordinator.wait_for_context("task1", "status", after_version=1, timeout=5))
+    await asyncio.sleep(0)
+    assert not waiter.done()
+
+    await coordinator.set_context("task1", "status", "done", "agent1")
+
+    assert await asyncio.wait_for(waiter, timeout=1) == ("done", 2)
+    assert await coordinator.wait_for_context("task1", "status", after_version=0) == ("done", 2)
+    assert await coordinator.wait_for_context("task1", "status", after_version=2, timeout=0.01) is None
+
+
 @pytest.mark.asyncio
 async def test_resolve_agent_by_id(coordinator, agents):
     """Test resolving agent by ID."""
@@ -332,3 +453,84 @@ async def test_message_types(coordinator, agents):
     assert "response" in types
     assert "info" in types
     assert "handoff" in types
+
+
+@pytest.mark.asyncio
+async def test_mailbox_push(coordinator, agents, db):
+    """Test messages sent to an open mailbox are delivered without a query."""
+    await coordinator.open_mailbox("agent2")
+    await coordinator.send_message("agent1", "agent2", "ping", message_type="request")
+
+    with patch.object(db, "get_agent_messages", side_effect=AssertionError("polled")):
+        messages = await coordinator.receive("agent2")
+
+    assert [m["content"] for m in messages] == ["ping"]
+    assert messages[0]["message_type"] == "request"
+    assert await coordinator.receive("agent2") == []
+
+
+@pytest.mark.asyncio
+async def test_mailbox_seeded_with_unread(coordinator, agents):
+    """Test opening a mailbox delivers messages sent while the agent wasn't running."""
+    await coordinator.send_message("agent1", "agent2", "earlier")
+    await coordinator.open_mailbox("agent2")
+    await coordinator.send_message("agent1", "agent2", "later")
+
+    messages = await coordinator.receive("agent2")
+
+    assert [m["content"] for m in messages] == ["earlier", "later"]
+
+
+@pytest.mark.asyncio
+async def test_receive_without_mailbox(coordinator, agents):
+    """Test receiving for an agent without a mailbox reads unread messages from the database."""
+    await coordinator.send_message("agent1", "agent2", "stored")
+
+    messages = await coordinator.receive("agent2")
+
+    assert [m["content"] for m in messages] == ["stored"]
+
+
+@pytest.mark.asyncio
+async def test_close_mailbox_keeps_messages_unread(coordinator, agents):
+    """Test messages sent after a mailbox closes stay in the database."""
+    await coordinator.open_mailbox("agent2")
+    coordinator.close_mailbox("agent2")
+    await coordinator.send_message("agent1", "agent2", "after close")
+
+    unread = await coordinator.get_messages("agent2", unread_only=True)
+
+    assert [m["content"] for m in unread] == ["after close"]
+
+
+@pytest.mark.asyncio
+async def test_wait_for_messages_wakes_on_arrival(coordinator, agents):
+    """Test a waiting agent wakes as soon as a message is sent."""
+    await coordinator.open_mailbox("agent2")
+    waiter = asyncio.create_task(coordinator.wait_for_messages("agent2", timeout=5))
+    await asyncio.sleep(0)
+    assert not waiter.done()
+
+    await coordinator.send_message("agent1", "agent2", "reply", message_type="response")
+    messages = await asyncio.wait_for(waiter, timeout=1)
+
+    assert [m["content"] for m in messages] == ["reply"]
+
+
+@pytest.mark.asyncio
+async def test_wait_for_messages_timeout(coordinator, agents):
+    """Test waiting returns nothing when no message arrives in time."""
+    assert await coordinator.wait_for_messages("agent2", timeout=0.01) == []
+
+
+@pytest.mark.asyncio
+async def test_mark_read_many(coordinator, agents):
+    """Test several messages are marked read at once."""
+    for i in range(3):
+        await coordinator.send_message("agent1", "agent2", f"msg{i}")
+    messages = await coordinator.get_messages("agent2", unread_only=True)
+
+    await coordinator.mark_read(*(m["id"] for m in messages[:2]))
+
+    unread = await coordinator.get_messages("agent2", unread_only=True)
+    assert [m["content"] for m in unread] == ["msg2"]
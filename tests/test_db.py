@@ -2,12 +2,15 @@
 
 from __future__ import annotations
 
+import asyncio
+import sqlite3
 import tempfile
 from pathlib import Path
+from unittest.mock import patch
 
 import pytest
 
-from gru.db import Database
+from gru.db import HOT_QUERIES, MIGRATIONS, Database, _fts_query
 
 
 @pytest.fixture
@@ -71,6 +74,21 @@ async def test_update_agent(db: Database):
     assert agent["status"] == "running"
 
 
+@pytest.mark.asyncio
+async def test_add_tokens_with_cache(db: Database):
+    """Test prompt-cache token counts accumulate alongside input/output."""
+    await db.create_agent(agent_id="agent1", task="Task", model="test-model")
+
+    await db.add_tokens("agent1", 10, 5, cache_read_tokens=100, cache_creation_tokens=20)
+    await db.add_tokens("agent1", 10, 5, cache_read_tokens=100)
+
+    agent = await db.get_agent("agent1")
+    assert agent["input_tokens"] == 20
+    assert agent["output_tokens"] == 10
+    assert agent["cache_read_tokens"] == 200
+    assert agent["cache_creation_tokens"] == 20
+
+
 @pytest.mark.asyncio
 async def test_create_task(db: Database):
     """Test task creation."""
@@ -109,6 +127,44 @@ async def test_conversation(db: Database):
     assert conversation[1]["role"] == "assistant"
 
 
+@pytest.mark.asyncio
+async def test_conversation_pagination(db: Database):
+    """Test cursor-based conversation pages and tails."""
+    await db.create_agent(agent_id="agent1", task="Agent task", model="claude-sonnet-4-20250514")
+    await db.create_agent(agent_id="agent2", task="Other task", model="claude-sonnet-4-20250514")
+    for i in range(10):
+        await db.add_message("agent1", "user", f"msg{i}")
+        await db.add_message("agent2", "user", f"other{i}")
+
+    tail = await db.get_conversation("agent1", limit=3)
+    assert [m["content"] for m in tail] == ["msg7", "msg8", "msg9"]
+
+    before = await db.get_conversation("agent1", before_id=tail[0]["id"], limit=2)
+    assert [m["content"] for m in before] == ["msg5", "msg6"]
+
+    first = await db.get_conversation("agent1", after_id=0, limit=4)
+    assert [m["content"] for m in first] == ["msg0", "msg1", "msg2", "msg3"]
+    after = await db.get_conversation("agent1", after_id=first[-1]["id"], limit=4)
+    assert [m["content"] for m in after] == ["msg4", "msg5", "msg6", "msg7"]
+
+    between = await db.get_conversation("agent1", after_id=first[0]["id"], before_id=first[-1]["id"])
+    assert [m["content"] for m in between] == ["msg1", "msg2"]
+
+
+@pytest.mark.asyncio
+async def test_iter_conversation(db: Database):
+    """Test streaming a conversation in pages with decoded tool data."""
+    await db.create_agent(agent_id="agent1", task="Agent task", model="claude-sonnet-4-20250514")
+    for i in range(5):
+        await db.add_message("agent1", "assistant", f"msg{i}", tool_use=[{"id": f"t{i}", "name": "bash"}])
+
+    rows = [row async for row in db.iter_conversation("agent1", batch_size=2)]
+
+    assert [r["content"] for r in rows] == [f"msg{i}" for i in range(5)]
+    assert rows[4]["tool_use"] == [{"id": "t4", "name": "bash"}]
+    assert [r async for r in db.iter_conversation("agent1", after_id=rows[-1]["id"])] == []
+
+
 @pytest.mark.asyncio
 async def test_secrets(db: Database):
     """Test secret storage."""
@@ -183,6 +239,32 @@ async def test_agent_messages(db: Database):
     assert len(messages) == 0
 
 
+@pytest.mark.asyncio
+async def test_count_agents_by_status(db: Database):
+    """Test counting agents per status."""
+    assert await db.count_agents_by_status() == {}
+    for i in range(3):
+        await db.create_agent(agent_id=f"agent{i}", task="Task", model="test-model")
+    await db.update_agent("agent0", status="running")
+
+    assert await db.count_agents_by_status() == {"idle": 2, "running": 1}
+
+
+@pytest.mark.asyncio
+async def test_mark_messages_read(db: Database):
+    """Test marking several agent messages read in one call."""
+    await db.create_agent(agent_id="agent1", task="Task 1", model="claude-sonnet-4-20250514")
+    await db.create_agent(agent_id="agent2", task="Task 2", model="claude-sonnet-4-20250514")
+    for i in range(3):
+        await db.send_agent_message(f"msg{i}", "agent1", "agent2", None, "info", f"Hello {i}")
+
+    await db.mark_messages_read(["msg0", "msg2"])
+    await db.mark_messages_read([])
+
+    messages = await db.get_agent_messages("agent2", unread_only=True)
+    assert [m["id"] for m in messages] == ["msg1"]
+
+
 @pytest.mark.asyncio
 async def test_shared_context(db: Database):
     """Test shared context."""
@@ -202,3 +284,448 @@ async def test_shared_context(db: Database):
     context = await db.get_shared_context("task1")
     assert context["key1"] == {"value": 1}
     assert context["key2"] == "string_value"
+
+
+@pytest.mark.asyncio
+async def test_shared_context_versions(db: Database):
+    """Test shared context versions and compare-and-set."""
+    await db.create_agent(agent_id="agent1", task="Task", model="claude-sonnet-4-20250514")
+    await db.create_task(task_id="task1", agent_id="agent1")
+
+    assert await db.compare_and_set_shared_context("task1", "lock", "a", "agent1", expected_version=0) == 1
+    assert await db.compare_and_set_shared_context("task1", "lock", "b", "agent1", expected_version=0) is None
+    assert await db.set_shared_context("task1", "lock", "c", "agent1") == 2
+    assert await db.compare_and_set_shared_context("task1", "lock", "d", "agent1", expected_version=1) is None
+    assert await db.compare_and_set_shared_context("task1", "lock", "e", "agent1", expected_version=2) == 3
+
+    assert await db.get_shared_context_entry("task1", "lock") == {"value": "e", "version": 3}
+    assert await db.get_shared_context_entry("task1", "missing") is None
+    assert await db.get_shared_context_entries("task1") == {"lock": {"value": "e", "version": 3}}
+
+
+@pytest.fixture
+async def batched_db():
+    """Create a temporary database with group commit enabled."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = Path(tmpdir) / "test.db"
+        database = Database(db_path, group_commit=True, commit_interval=0.05, commit_max_statements=3)
+        await database.connect()
+        yield database
+        await database.close()
+
+
+def _committed_messages(db_path: Path) -> int:
+    """Count conversation rows visible to a separate connection."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.mark.asyncio
+async def test_group_commit_defers_and_reads_own_writes(batched_db: Database):
+    """Test batched writes are readable immediately but committed later."""
+    await batched_db.create_agent(agent_id="agent1", task="Task", model="test-model")
+
+    await batched_db.add_message("agent1", "user", "Hello")
+
+    assert len(await batched_db.get_conversation("agent1")) == 1
+    assert _committed_messages(batched_db.db_path) == 0
+
+    await asyncio.sleep(0.15)
+    assert _committed_messages(batched_db.db_path) == 1
+
+
+@pytest.mark.asyncio
+async def test_group_commit_flushes_at_max_statements(batched_db: Database):
+    """Test reaching the statement limit commits without waiting."""
+    batched_db.commit_interval = 60
+    await batched_db.create_agent(agent_id="agent1", task="Task", model="test-model")
+
+    for i in range(3):
+        await batched_db.add_message("agent1", "user", f"msg{i}")
+
+    assert _committed_messages(batched_db.db_path) == 3
+
+
+@pytest.mark.asyncio
+async def test_group_commit_flush_on_close(batched_db: Database):
+    """Test closing the database commits pending writes."""
+    batched_db.commit_interval = 60
+    await batched_db.create_agent(agent_id="agent1", task="Task", model="test-model")
+    await batched_db.add_message("agent1", "user", "Hello")
+
+    await batched_db.close()
+
+    assert _committed_messages(batched_db.db_path) == 1
+
+
+@pytest.mark.asyncio
+async def test_reads_use_reader_connections(db: Database):
+    """Test committed reads run on the reader pool, not the writer."""
+    await db.create_agent(agent_id="agent1", task="Task", model="test-model")
+
+    with patch.object(db._conn, "execute", side_effect=AssertionError("read on writer")):
+        agent = await db.get_agent("agent1")
+        agents = await db.get_agents()
+
+    assert agent["id"] == "agent1"
+    assert [a["id"] for a in agents] == ["agent1"]
+    assert db._idle_readers.qsize() == db.read_connections
+
+
+@pytest.mark.asyncio
+async def test_concurrent_reads_share_pool(db: Database):
+    """Test more concurrent reads than readers all complete."""
+    await db.create_agent(agent_id="agent1", task="Task", model="test-model")
+
+    results = await asyncio.gather(*(db.get_agent("agent1") for _ in range(10)))
+
+    assert all(r["id"] == "agent1" for r in results)
+    assert db._idle_readers.qsize() == db.read_connections
+
+
+@pytest.mark.asyncio
+async def test_reader_connections_are_read_only(db: Database):
+    """Test reader connections reject writes."""
+    reader = db._readers[0]
+    with pytest.raises(sqlite3.OperationalError, match="readonly"):
+        await reader.execute("DELETE FROM agents")
+
+
+@pytest.mark.asyncio
+async def test_writes_with_returning_use_writer(db: Database):
+    """Test write statements read through fetchone stay on the writer."""
+    await db.create_agent(agent_id="agent1", task="Task", model="test-model")
+    await db.create_task(task_id="task1", agent_id="agent1")
+
+    assert await db.set_shared_context("task1", "key", "value", "agent1") == 1
+
+
+@pytest.mark.asyncio
+async def test_batched_writes_read_on_writer(batched_db: Database):
+    """Test reads see uncommitted group-commit writes by staying on the writer."""
+    batched_db.commit_interval = 60
+    await batched_db.create_agent(agent_id="agent1", task="Task", model="test-model")
+    await batched_db.add_message("agent1", "user", "Hello")
+
+    assert batched_db._conn.in_transaction
+    assert len(await batched_db.get_conversation("agent1")) == 1
+
+
+@pytest.mark.asyncio
+async def test_no_reader_connections():
+    """Test read_connections=0 serves every query from the writer."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database = Database(Path(tmpdir) / "test.db", read_connections=0)
+        await database.connect()
+        try:
+            await database.create_agent(agent_id="agent1", task="Task", model="test-model")
+            assert (await database.get_agent("agent1"))["id"] == "agent1"
+            assert database._readers == []
+        finally:
+            await database.close()
+
+
+def _plan_problems(plan: list[str]) -> list[str]:
+    """Find query plan steps that scan a whole table or sort in a temporary B-tree."""
+    return [step for step in plan if "TEMP B-TREE" in step or (step.startswith("SCAN ") and " INDEX " not in step)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+async def test_hot_query_uses_index(db: Database, name: str):
+    """Test each registered hot query is answered from an index without sorting."""
+    sql, params = HOT_QUERIES[name]
+
+    plan = await db.query_plan(sql, params)
+
+    assert not _plan_problems(plan), f"{name}: {plan}"
+
+
+@pytest.mark.asyncio
+async def test_plan_checker_flags_scans(db: Database):
+    """Test the plan checker catches full scans and temporary sorts."""
+    plan = await db.query_plan("SELECT * FROM agents WHERE task = ? ORDER BY name", ("x",))
+    assert len(_plan_problems(plan)) == 2
+
+
+@pytest.mark.asyncio
+async def test_superseded_indexes_dropped():
+    """Test reconnecting replaces old single-column indexes with the composite ones."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = Path(tmpdir) / "test.db"
+        conn = sqlite3.connect(db_path)
+        conn.execute(
+            "CREATE TABLE agents (id TEXT PRIMARY KEY, name TEXT, task TEXT, model TEXT, status TEXT, created_at TEXT)"
+        )
+        conn.execute("CREATE INDEX idx_agents_status ON agents(status)")
+        conn.commit()
+        conn.close()
+
+        database = Database(db_path)
+        await database.connect()
+        try:
+            rows = await database.fetchall(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'agents'"
+            )
+        finally:
+            await database.close()
+
+    names = {row["name"] for row in rows}
+    assert "idx_agents_status" not in names
+    assert {"idx_agents_status_created", "idx_agents_created"} <= names
+
+
+async def _user_version(database: Database) -> int:
+    row = await database.fetchone("PRAGMA user_version")
+    return row["user_version"]
+
+
+@pytest.mark.asyncio
+async def test_fresh_database_at_latest_version(db: Database):
+    """Test a new database is created at the latest schema version."""
+    assert await _user_version(db) == len(MIGRATIONS)
+
+    await db.create_agent(agent_id="agent1", task="Refactor parser", model="test-model")
+    rows = await db.fetchall("SELECT id FROM agents_fts WHERE agents_fts MATCH 'parser'")
+    assert [row["id"] for row in rows] == ["agent1"]
+
+
+@pytest.mark.asyncio
+async def test_up_to_date_database_skips_migrations():
+    """Test reconnecting to a current database runs no migrations."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = Path(tmpdir) / "test.db"
+        database = Database(db_path)
+        await database.connect()
+        await database.close()
+
+        async def fail(conn):
+            raise AssertionError("migration re-run")
+
+        with patch("gru.db.MIGRATIONS", [fail] * len(MIGRATIONS)):
+            database = Database(db_path)
+            await database.connect()
+            await database.close()
+
+
+@pytest.mark.asyncio
+async def test_legacy_database_upgraded():
+    """Test a database from before versioned migrations gains the newer columns and search index."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = Path(tmpdir) / "test.db"
+        conn = sqlite3.connect(db_path)
+        conn.execute(
+            "CREATE TABLE agents (id TEXT PRIMARY KEY, name TEXT, status TEXT NOT NULL DEFAULT 'idle', "
+            "task TEXT NOT NULL, model TEXT NOT NULL, system_prompt TEXT, supervised INTEGER NOT NULL DEFAULT 1, "
+            "timeout_mode TEXT NOT NULL DEFAULT 'block', priority TEXT NOT NULL DEFAULT 'normal', "
+            "memory_limit TEXT, cpu_quota INTEGER, workdir TEXT, pid INTEGER, cgroup_path TEXT, "
+            "created_at TEXT NOT NULL DEFAULT (datetime('now')), started_at TEXT, completed_at TEXT, error TEXT)"
+        )
+        conn.execute(
+            "CREATE TABLE shared_context (task_id TEXT, key TEXT NOT NULL, value JSON NOT NULL, "
+            "updated_by TEXT, updated_at TEXT NOT NULL DEFAULT (datetime('now')), PRIMARY KEY (task_id, key))"
+        )
+        conn.execute("INSERT INTO agents (id, name, task, model) VALUES ('old1', 'Old', 'Legacy task', 'm')")
+        conn.commit()
+        conn.close()
+
+        database = Database(db_path)
+        await database.connect()
+        try:
+            agent = await database.get_agent("old1")
+            version = await _user_version(database)
+            rows = await database.fetchall("SELECT id FROM agents_fts WHERE agents_fts MATCH 'legacy'")
+            context_version = await database.set_shared_context(None, "k", "v", None)
+        finally:
+            await database.close()
+
+    assert version == len(MIGRATIONS)
+    assert agent["bash_timeout"] is None
+    assert agent["input_tokens"] == 0
+    assert agent["worktree_path"] is None
+    assert [row["id"] for row in rows] == ["old1"]
+    assert context_version == 1
+
+
+@pytest.mark.asyncio
+async def test_agent_costs_backfilled():
+    """Test upgrading prices the token usage agents already had at their model."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = Path(tmpdir) / "test.db"
+        database = Database(db_path)
+        with patch("gru.db.MIGRATIONS", MIGRATIONS[:3]):
+            await database.connect()
+        await database.create_agent(agent_id="a1", task="Task", model="claude-sonnet-4-20250514")
+        await database.execute("UPDATE agents SET input_tokens = 1000000, output_tokens = 500000")
+        await database.commit()
+        await database.close()
+
+        database = Database(db_path)
+        await database.connect()
+        try:
+            agent = await database.get_agent("a1")
+        finally:
+            await database.close()
+
+    assert agent["cost"] == pytest.approx(10.5)
+    assert agent["routed_turns"] == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_migration_rolls_back():
+    """Test a failing migration raises and leaves the database at its previous version."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = Path(tmpdir) / "test.db"
+        database = Database(db_path)
+        await database.connect()
+        await database.close()
+
+        async def broken(conn):
+            await conn.execute("CREATE TABLE scratch (id INTEGER)")
+            await conn.execute("SELECT * FROM no_such_table")
+
+        with patch("gru.db.MIGRATIONS", [*MIGRATIONS, broken]):
+            database = Database(db_path)
+            with pytest.raises(sqlite3.OperationalError, match="no_such_table"):
+                await database.connect()
+
+        conn = sqlite3.connect(db_path)
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        finally:
+            conn.close()
+
+    assert version == len(MIGRATIONS)
+    assert "scratch" not in tables
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("fix bug", '"fix" "bug"'),
+        ("pars*", '"pars"*'),
+        ('"login page" crash', '"login page" "crash"'),
+        ('"login pa"*', '"login pa"*'),
+        ("NOT AND", '"NOT" "AND"'),
+        ("src/gru/db.py", '"src/gru/db.py"'),
+        ('say "hi', '"say" "hi"'),
+        ('a"b', '"a""b"'),
+        ("- * ()", ""),
+    ],
+)
+def test_fts_query(text: str, expected: str):
+    """Test search input is turned into quoted FTS5 terms."""
+    assert _fts_query(text) == expected
+
+
+@pytest.fixture
+async def indexed_db():
+    """Create a temporary database with conversation indexing enabled."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database = Database(Path(tmpdir) / "test.db", index_conversations=True)
+        await database.connect()
+        yield database
+        await database.close()
+
+
+@pytest.mark.asyncio
+async def test_search_agents_ranked(db: Database):
+    """Test name matches rank above task matches and results carry snippets."""
+    await db.create_agent(agent_id="agent1", task="Run the parser tests", model="m", name="tests")
+    await db.create_agent(agent_id="agent2", task="Write docs", model="m", name="parser")
+    await db.create_agent(agent_id="agent3", task="Unrelated", model="m")
+
+    results = await db.search_agents("parser")
+
+    assert [r["id"] for r in results] == ["agent2", "agent1"]
+    assert results[1]["snippet"] == "Run the **parser** tests"
+
+
+@pytest.mark.asyncio
+async def test_search_agents_prefix_and_phrase(db: Database):
+    """Test prefix terms and quoted phrases."""
+    await db.create_agent(agent_id="agent1", task="Fix the login page crash", model="m")
+    await db.create_agent(agent_id="agent2", task="Page through the login logs", model="m")
+
+    assert {r["id"] for r in await db.search_agents("log*")} == {"agent1", "agent2"}
+    assert [r["id"] for r in await db.search_agents('"login page"')] == ["agent1"]
+    assert await db.search_agents("OR (") == []
+
+
+@pytest.mark.asyncio
+async def test_search_agents_after_updates(db: Database):
+    """Test the index follows task changes and deletes but not status updates."""
+    await db.create_agent(agent_id="agent1", task="Old task", model="m")
+    await db.update_agent("agent1", status="running", input_tokens=10)
+    assert [r["id"] for r in await db.search_agents("old")] == ["agent1"]
+
+    await db.execute("UPDATE agents SET task = 'New task' WHERE id = 'agent1'")
+    assert await db.search_agents("old") == []
+    assert [r["id"] for r in await db.search_agents("new")] == ["agent1"]
+
+    await db.execute("DELETE FROM agents WHERE id = 'agent1'")
+    assert await db.search_agents("new") == []
+
+
+@pytest.mark.asyncio
+async def test_conversation_search_disabled(db: Database):
+    """Test conversations are not searched unless the index is enabled."""
+    await db.create_agent(agent_id="agent1", task="Task", model="m")
+    await db.add_message("agent1", "assistant", "Editing src/gru/db.py")
+
+    assert not await db.has_conversation_index()
+    assert await db.search_conversations("db.py") == []
+
+
+@pytest.mark.asyncio
+async def test_conversation_search(indexed_db: Database):
+    """Test messages and tool output are searchable and lead back to their agent."""
+    await indexed_db.create_agent(agent_id="agent1", task="Task one", model="m")
+    await indexed_db.create_agent(agent_id="agent2", task="Task two", model="m")
+    await indexed_db.add_message("agent1", "assistant", "Looking around")
+    await indexed_db.add_message(
+        "agent2", "user", "", tool_result={"output": "KeyError: 'session_token' in src/gru/auth.py"}
+    )
+
+    hits = await indexed_db.search_conversations("session_token")
+    results = await indexed_db.search_agents('"src/gru/auth.py"')
+
+    assert [(h["agent_id"], h["role"]) for h in hits] == [("agent2", "user")]
+    assert "**session_token**" in hits[0]["snippet"]
+    assert [r["id"] for r in results] == ["agent2"]
+    assert await indexed_db.search_conversations("session_token", agent_id="agent1") == []
+
+
+@pytest.mark.asyncio
+async def test_conversation_index_toggle():
+    """Test enabling indexes existing history and disabling empties the index."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = Path(tmpdir) / "test.db"
+        database = Database(db_path)
+        await database.connect()
+        await database.create_agent(agent_id="agent1", task="Task", model="m")
+        await database.add_message("agent1", "assistant", "Found the flaky test")
+        await database.close()
+
+        database = Database(db_path, index_conversations=True)
+        await database.connect()
+        try:
+            enabled = await database.search_conversations("flaky")
+        finally:
+            await database.close()
+
+        database = Database(db_path, index_conversations=False)
+        await database.connect()
+        try:
+            disabled = await database.has_conversation_index()
+            rows = await database.fetchall("SELECT rowid FROM conversations_fts WHERE conversations_fts MATCH 'flaky'")
+        finally:
+            await database.close()
+
+    assert len(enabled) == 1
+    assert not disabled
+    assert rows == []
@@ -81,7 +81,7 @@ async def test_agent_spawn_and_complete(setup):
         usage={"input_tokens": 10, "output_tokens": 5},
     )
 
-    with patch.object(orchestrator.claude, "send_message", new_callable=AsyncMock, return_value=mock_response):
+    with patch.object(orchestrator.claude, "stream_turn", new_callable=AsyncMock, return_value=mock_response):
         agent_data = await orchestrator.spawn_agent(
             task="Test task",
             supervised=False,
@@ -129,7 +129,7 @@ async def test_agent_with_tool_execution(setup):
             return tool_response
         return complete_response
 
-    with patch.object(orchestrator.claude, "send_message", side_effect=mock_send):
+    with patch.object(orchestrator.claude, "stream_turn", side_effect=mock_send):
         agent_data = await orchestrator.spawn_agent(
             task="Write a test file",
             supervised=False,
@@ -182,7 +182,7 @@ async def test_agent_with_bash_execution(setup):
             return tool_response
         return complete_response
 
-    with patch.object(orchestrator.claude, "send_message", side_effect=mock_send):
+    with patch.object(orchestrator.claude, "stream_turn", side_effect=mock_send):
         agent_data = await orchestrator.spawn_agent(
             task="Run a command",
             supervised=False,
@@ -211,7 +211,7 @@ async def test_agent_turn_limit(setup):
         usage={"input_tokens": 10, "output_tokens": 20},
     )
 
-    with patch.object(orchestrator.claude, "send_message", new_callable=AsyncMock, return_value=tool_response):
+    with patch.object(orchestrator.claude, "stream_turn", new_callable=AsyncMock, return_value=tool_response):
         agent_data = await orchestrator.spawn_agent(
             task="Infinite loop task",
             supervised=False,
@@ -298,7 +298,7 @@ async def test_multiple_agents(setup):
         usage={"input_tokens": 10, "output_tokens": 5},
     )
 
-    with patch.object(orchestrator.claude, "send_message", new_callable=AsyncMock, return_value=mock_response):
+    with patch.object(orchestrator.claude, "stream_turn", new_callable=AsyncMock, return_value=mock_response):
         agents = []
         for i in range(3):
             agent_data = await orchestrator.spawn_agent(
@@ -351,7 +351,7 @@ async def test_read_file_tool(setup):
             return tool_response
         return complete_response
 
-    with patch.object(orchestrator.claude, "send_message", side_effect=mock_send):
+    with patch.object(orchestrator.claude, "stream_turn", side_effect=mock_send):
         agent_data = await orchestrator.spawn_agent(
             task="Read a file",
             supervised=False,
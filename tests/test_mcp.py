@@ -2,11 +2,14 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
-import subprocess
+import sys
 import tempfile
+import textwrap
+import time
 from pathlib import Path
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 
@@ -35,14 +38,91 @@ def mcp_config_file():
         return Path(f.name)
 
 
+FAKE_SERVER = textwrap.dedent(
+    """
+    import json, os, sys, threading, time
+
+    log = open(sys.argv[1], "a")
+    write_lock = threading.Lock()
+    answered = {}  # server request id -> event set once the client responds
+
+    def send(message):
+        with write_lock:
+            sys.stdout.write(json.dumps(message) + "\\n")
+            sys.stdout.flush()
+
+    def reply(request_id, text):
+        send({"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": text}]}})
+
+    def call(request):
+        name, args = request["params"]["name"], request["params"]["arguments"]
+        send({"jsonrpc": "2.0", "method": "notifications/progress", "params": {"progressToken": request["id"]}})
+        if name == "slow":
+            time.sleep(args["seconds"])
+            reply(request["id"], "slow done")
+        elif name == "ask":
+            answered["roots"] = threading.Event()
+            send({"jsonrpc": "2.0", "id": "roots", "method": "roots/list"})
+            answered["roots"].wait(5)
+            reply(request["id"], "asked")
+        elif name == "fail":
+            send({"jsonrpc": "2.0", "id": request["id"], "error": {"code": -32000, "message": "failed"}})
+        elif name == "crash":
+            os._exit(1)
+        else:
+            reply(request["id"], args.get("text", ""))
+
+    for line in sys.stdin:
+        message = json.loads(line)
+        log.write(line)
+        log.flush()
+        method = message.get("method")
+        if method == "initialize":
+            send({"jsonrpc": "2.0", "id": message["id"], "result": {"protocolVersion": "2024-11-05"}})
+        elif method == "tools/list":
+            tool = {"name": "echo", "description": "Echo text", "inputSchema": {"type": "object"}}
+            send({"jsonrpc": "2.0", "id": message["id"], "result": {"tools": [tool]}})
+        elif method == "tools/call":
+            threading.Thread(target=call, args=(message,), daemon=True).start()
+        elif method is None and message.get("id") in answered:
+            answered[message["id"]].set()
+    """
+)
+
+
+@pytest.fixture
+def fake_server(tmp_path):
+    """Create an MCP server running a small Python JSON-RPC server that logs what it receives."""
+    script = tmp_path / "server.py"
+    script.write_text(FAKE_SERVER)
+    log = tmp_path / "received.jsonl"
+    log.touch()
+    server = MCPServer(name="fake", command=sys.executable, args=[str(script), str(log)])
+    server.log = log  # type: ignore[attr-defined]
+    return server
+
+
+def _received(server: MCPServer) -> list[dict]:
+    """Messages the fake server has received so far."""
+    return [json.loads(line) for line in server.log.read_text().splitlines()]  # type: ignore[attr-defined]
+
+
+async def _wait_received(server: MCPServer, method: str) -> dict:
+    """Wait for the fake server to receive a message with a method."""
+    for _ in range(100):
+        for message in _received(server):
+            if message.get("method") == method:
+                return message
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"{method} not received")
+
+
 @pytest.fixture
 def mock_process():
-    """Create a mock subprocess."""
+    """Create a mock asyncio subprocess."""
     process = MagicMock()
-    process.stdin = MagicMock()
-    process.stdout = MagicMock()
-    process.stderr = MagicMock()
-    process.poll.return_value = None
+    process.returncode = None
+    process.wait = AsyncMock(return_value=0)
     return process
 
 
@@ -181,96 +261,86 @@ class TestMCPClientServerLifecycle:
     """Tests for MCP server start/stop."""
 
     @pytest.mark.asyncio
-    async def test_start_server_success(self, mock_process):
+    async def test_start_server_success(self, fake_server):
         """Test successfully starting a server."""
-        server = MCPServer(name="test", command="echo", args=["hello"])
-
-        init_response = json.dumps(
-            {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "result": {"protocolVersion": "2024-11-05"},
-            }
-        )
-        tools_response = json.dumps(
-            {
-                "jsonrpc": "2.0",
-                "id": 2,
-                "result": {
-                    "tools": [
-                        {
-                            "name": "test_tool",
-                            "description": "A test tool",
-                            "inputSchema": {"type": "object", "properties": {}},
-                        }
-                    ]
-                },
-            }
-        )
-        mock_process.stdout.readline.side_effect = [init_response, tools_response]
-
         client = MCPClient()
-        client.servers["test"] = server
+        client.servers["fake"] = fake_server
 
-        with patch("subprocess.Popen", return_value=mock_process):
-            result = await client.start_server(server)
+        result = await client.start_server(fake_server)
 
-        assert result is True
-        assert server.process is not None
-        assert len(server.tools) == 1
-        assert server.tools[0].name == "test__test_tool"
-        assert "test__test_tool" in client._tool_to_server
-        assert client._tool_to_server["test__test_tool"] == "test"
+        try:
+            assert result is True
+            assert fake_server.process is not None
+            assert len(fake_server.tools) == 1
+            assert fake_server.tools[0].name == "fake__echo"
+            assert client._tool_to_server["fake__echo"] == "fake"
+            assert [m.get("method") for m in _received(fake_server)] == [
+                "initialize",
+                "notifications/initialized",
+                "tools/list",
+            ]
+        finally:
+            await client.stop_all()
 
     @pytest.mark.asyncio
-    async def test_start_server_init_failure(self, mock_process):
-        """Test server start failure during init."""
-        server = MCPServer(name="test", command="echo")
-        mock_process.stdout.readline.return_value = ""
-
+    async def test_start_server_init_failure(self):
+        """Test a server exiting before initializing is stopped."""
+        server = MCPServer(name="test", command=sys.executable, args=["-c", "pass"])
         client = MCPClient()
 
-        with patch("subprocess.Popen", return_value=mock_process):
-            result = await client.start_server(server)
+        result = await client.start_server(server)
 
         assert result is False
+        assert server.process is None
+        assert server._tasks == []
 
     @pytest.mark.asyncio
-    async def test_start_server_popen_failure(self):
-        """Test server start failure when Popen raises."""
-        server = MCPServer(name="test", command="nonexistent_command")
+    async def test_start_server_spawn_failure(self):
+        """Test server start failure when the command doesn't exist."""
+        server = MCPServer(name="test", command="nonexistent_command_for_gru_tests")
         client = MCPClient()
 
-        with patch("subprocess.Popen", side_effect=FileNotFoundError("Command not found")):
-            result = await client.start_server(server)
+        result = await client.start_server(server)
 
         assert result is False
 
     @pytest.mark.asyncio
-    async def test_stop_server(self, mock_process):
+    async def test_stop_server(self, fake_server):
         """Test stopping a server."""
+        client = MCPClient()
+        await client.start_server(fake_server)
+        process = fake_server.process
+
+        await client.stop_server(fake_server)
+
+        assert process.returncode is not None
+        assert fake_server.process is None
+        assert fake_server._tasks == []
+
+    @pytest.mark.asyncio
+    async def test_stop_server_kill_on_timeout(self, mock_process):
+        """Test server is killed if terminate times out."""
         server = MCPServer(name="test", command="echo")
         server.process = mock_process
+        mock_process.wait.side_effect = [asyncio.TimeoutError(), 0]
 
         client = MCPClient()
         await client.stop_server(server)
 
         mock_process.terminate.assert_called_once()
-        mock_process.wait.assert_called_once_with(timeout=5)
+        mock_process.kill.assert_called_once()
         assert server.process is None
 
     @pytest.mark.asyncio
-    async def test_stop_server_kill_on_timeout(self, mock_process):
-        """Test server is killed if terminate times out."""
+    async def test_stop_server_already_exited(self, mock_process):
+        """Test stopping a server whose process is already gone."""
         server = MCPServer(name="test", command="echo")
         server.process = mock_process
-        mock_process.wait.side_effect = subprocess.TimeoutExpired("echo", 5)
+        mock_process.terminate.side_effect = ProcessLookupError()
 
         client = MCPClient()
         await client.stop_server(server)
 
-        mock_process.terminate.assert_called_once()
-        mock_process.kill.assert_called_once()
         assert server.process is None
 
     @pytest.mark.asyncio
@@ -283,37 +353,19 @@ class TestMCPClientServerLifecycle:
         await client.stop_server(server)  # Should not raise
 
     @pytest.mark.asyncio
-    async def test_start_all(self, mock_process):
+    async def test_start_all(self, fake_server):
         """Test starting all servers."""
-        init_response = json.dumps(
-            {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "result": {"protocolVersion": "2024-11-05"},
-            }
-        )
-        tools_response = json.dumps(
-            {
-                "jsonrpc": "2.0",
-                "id": 2,
-                "result": {"tools": []},
-            }
-        )
-        mock_process.stdout.readline.side_effect = [
-            init_response,
-            tools_response,
-            init_response,
-            tools_response,
-        ]
-
         client = MCPClient()
-        client.servers["server1"] = MCPServer(name="server1", command="echo")
-        client.servers["server2"] = MCPServer(name="server2", command="cat")
+        client.servers["server1"] = MCPServer(name="server1", command=fake_server.command, args=fake_server.args)
+        client.servers["server2"] = MCPServer(name="server2", command=fake_server.command, args=fake_server.args)
 
-        with patch("subprocess.Popen", return_value=mock_process):
-            started = await client.start_all()
+        started = await client.start_all()
 
-        assert started == 2
+        try:
+            assert started == 2
+            assert sorted(client._tool_to_server) == ["server1__echo", "server2__echo"]
+        finally:
+            await client.stop_all()
 
     @pytest.mark.asyncio
     async def test_stop_all(self, mock_process):
@@ -356,67 +408,48 @@ class TestMCPClientToolCalls:
         assert "MCP server not running" in result
 
     @pytest.mark.asyncio
-    async def test_call_tool_success(self, mock_process):
-        """Test successfully calling a tool."""
-        response = json.dumps(
-            {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "result": {"content": [{"type": "text", "text": "Tool output"}]},
-            }
-        )
-        mock_process.stdout.readline.return_value = response
-
-        server = MCPServer(name="test", command="echo")
-        server.process = mock_process
-
+    async def test_call_tool_success(self, fake_server):
+        """Test successfully calling a tool, with a notification ahead of the response."""
         client = MCPClient()
-        client.servers["test"] = server
-        client._tool_to_server["test__my_tool"] = "test"
+        client.servers["fake"] = fake_server
+        await client.start_server(fake_server)
+
+        try:
+            result = await client.call_tool("fake__echo", {"text": "Tool output"})
+        finally:
+            await client.stop_all()
 
-        result = await client.call_tool("test__my_tool", {"arg": "value"})
         assert result == "Tool output"
 
     @pytest.mark.asyncio
     async def test_call_tool_multiple_text_blocks(self, mock_process):
         """Test tool response with multiple text blocks."""
-        response = json.dumps(
-            {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "result": {
-                    "content": [
-                        {"type": "text", "text": "Line 1"},
-                        {"type": "text", "text": "Line 2"},
-                    ]
-                },
-            }
-        )
-        mock_process.stdout.readline.return_value = response
-
         server = MCPServer(name="test", command="echo")
-        server.process = mock_process
-
         client = MCPClient()
         client.servers["test"] = server
         client._tool_to_server["test__my_tool"] = "test"
+        content = [{"type": "text", "text": "Line 1"}, {"type": "image"}, {"type": "text", "text": "Line 2"}]
+        client._send_request = AsyncMock(return_value={"content": content})
+        server.process = mock_process
 
         result = await client.call_tool("test__my_tool", {})
+
         assert result == "Line 1\nLine 2"
+        client._send_request.assert_awaited_once_with(server, "tools/call", {"name": "my_tool", "arguments": {}})
 
     @pytest.mark.asyncio
-    async def test_call_tool_request_failure(self, mock_process):
-        """Test tool call when request fails."""
-        mock_process.stdout.readline.return_value = ""
-
-        server = MCPServer(name="test", command="echo")
-        server.process = mock_process
-
+    async def test_call_tool_request_failure(self, fake_server):
+        """Test tool call when the server answers with an error."""
         client = MCPClient()
-        client.servers["test"] = server
-        client._tool_to_server["test__my_tool"] = "test"
+        client.servers["fake"] = fake_server
+        await client.start_server(fake_server)
+        client._tool_to_server["fake__fail"] = "fake"
+
+        try:
+            result = await client.call_tool("fake__fail", {})
+        finally:
+            await client.stop_all()
 
-        result = await client.call_tool("test__my_tool", {})
         assert result == "MCP tool call failed"
 
 
@@ -480,23 +513,106 @@ class TestMCPClientRequests:
         assert result is None
 
     @pytest.mark.asyncio
-    async def test_send_request_error_response(self, mock_process):
-        """Test handling error response."""
-        response = json.dumps(
-            {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "error": {"code": -32600, "message": "Invalid request"},
-            }
-        )
-        mock_process.stdout.readline.return_value = response
+    async def test_concurrent_requests(self, fake_server):
+        """Test requests are in flight together and resolved as their responses arrive."""
+        client = MCPClient()
+        await client.start_server(fake_server)
+        finished = []
+
+        async def call(name: str, arguments: dict) -> dict | None:
+            result = await client._send_request(fake_server, "tools/call", {"name": name, "arguments": arguments})
+            finished.append(name)
+            return result
+
+        try:
+            start = time.monotonic()
+            results = await asyncio.gather(
+                call("slow", {"seconds": 0.5}),
+                call("slow", {"seconds": 0.5}),
+                call("echo", {"text": "fast"}),
+            )
+            elapsed = time.monotonic() - start
+        finally:
+            await client.stop_all()
+
+        assert [r["content"][0]["text"] for r in results] == ["slow done", "slow done", "fast"]
+        assert finished[0] == "echo"  # Answered out of order, ahead of the slow calls
+        assert elapsed < 0.9  # The slow calls overlapped
+        assert fake_server._pending == {}
 
-        server = MCPServer(name="test", command="echo")
-        server.process = mock_process
+    @pytest.mark.asyncio
+    async def test_server_request_rejected(self, fake_server):
+        """Test a request from the server gets a method-not-found error while a call waits."""
+        client = MCPClient()
+        await client.start_server(fake_server)
+
+        try:
+            result = await client._send_request(fake_server, "tools/call", {"name": "ask", "arguments": {}})
+        finally:
+            await client.stop_all()
 
+        assert result["content"][0]["text"] == "asked"
+        [response] = [m for m in _received(fake_server) if m.get("id") == "roots"]
+        assert response["error"]["code"] == -32601
+
+    @pytest.mark.asyncio
+    async def test_cancelled_request(self, fake_server):
+        """Test cancelling a caller tells the server to cancel the request."""
+        client = MCPClient()
+        await client.start_server(fake_server)
+
+        try:
+            task = asyncio.create_task(
+                client._send_request(fake_server, "tools/call", {"name": "slow", "arguments": {"seconds": 5}})
+            )
+            await _wait_received(fake_server, "tools/call")
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+            notification = await _wait_received(fake_server, "notifications/cancelled")
+            call = next(m for m in _received(fake_server) if m.get("method") == "tools/call")
+            assert notification["params"]["requestId"] == call["id"]
+            assert fake_server._pending == {}
+        finally:
+            await client.stop_all()
+
+    @pytest.mark.asyncio
+    async def test_request_timeout(self, fake_server):
+        """Test a timed-out request returns None and is cancelled on the server."""
         client = MCPClient()
-        result = await client._send_request(server, "test/method", {})
+        await client.start_server(fake_server)
+
+        try:
+            params = {"name": "slow", "arguments": {"seconds": 5}}
+            result = await client._send_request(fake_server, "tools/call", params, timeout=0.1)
+            notification = await _wait_received(fake_server, "notifications/cancelled")
+        finally:
+            await client.stop_all()
+
         assert result is None
+        assert notification["params"]["reason"] == "Request timed out"
+
+    @pytest.mark.asyncio
+    async def test_server_exit_fails_pending(self, fake_server):
+        """Test requests waiting on a server that exits fail instead of hanging."""
+        client = MCPClient()
+        await client.start_server(fake_server)
+
+        try:
+            slow = asyncio.create_task(
+                client._send_request(fake_server, "tools/call", {"name": "slow", "arguments": {"seconds": 5}})
+            )
+            await _wait_received(fake_server, "tools/call")
+            crash = await asyncio.wait_for(
+                client._send_request(fake_server, "tools/call", {"name": "crash", "arguments": {}}), 2
+            )
+            assert crash is None
+            assert await asyncio.wait_for(slow, 2) is None
+            await asyncio.wait_for(fake_server.process.wait(), 2)
+            assert client.is_server_healthy(fake_server) is False
+        finally:
+            await client.stop_all()
 
     @pytest.mark.asyncio
     async def test_send_notification_no_process(self):
@@ -532,7 +648,7 @@ class TestMCPHealthCheck:
 
     def test_is_server_healthy_running(self, mock_process):
         """Test health check with running process."""
-        mock_process.poll.return_value = None  # None means still running
+        mock_process.returncode = None  # None means still running
 
         server = MCPServer(name="test", command="echo")
         server.process = mock_process
@@ -542,7 +658,7 @@ class TestMCPHealthCheck:
 
     def test_is_server_healthy_terminated(self, mock_process):
         """Test health check with terminated process."""
-        mock_process.poll.return_value = 1  # Non-None means terminated
+        mock_process.returncode = 1  # Non-None means terminated
 
         server = MCPServer(name="test", command="echo")
         server.process = mock_process
@@ -553,8 +669,6 @@ class TestMCPHealthCheck:
     @pytest.mark.asyncio
     async def test_health_check_all_healthy(self, mock_process):
         """Test health check with all healthy servers."""
-        mock_process.poll.return_value = None
-
         client = MCPClient()
         server1 = MCPServer(name="server1", command="echo")
         server1.process = mock_process
@@ -568,19 +682,19 @@ class TestMCPHealthCheck:
         assert health == {"server1": True, "server2": True}
 
     @pytest.mark.asyncio
-    async def test_health_check_mixed(self, mock_process):
+    async def test_health_check_mixed(self):
         """Test health check with mixed health status."""
         client = MCPClient()
 
         # Healthy server
         healthy_process = MagicMock()
-        healthy_process.poll.return_value = None
+        healthy_process.returncode = None
         server1 = MCPServer(name="healthy", command="echo")
         server1.process = healthy_process
 
         # Unhealthy server (crashed)
         unhealthy_process = MagicMock()
-        unhealthy_process.poll.return_value = 1
+        unhealthy_process.returncode = 1
         server2 = MCPServer(name="unhealthy", command="cat")
         server2.process = unhealthy_process
 
@@ -599,48 +713,38 @@ class TestMCPHealthCheck:
         assert result is False
 
     @pytest.mark.asyncio
-    async def test_restart_server_success(self, mock_process):
+    async def test_restart_server_success(self, fake_server):
         """Test successful server restart."""
         from gru.claude import ToolDefinition
 
-        # Set up initial response for new server start
-        init_response = json.dumps(
-            {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "result": {"protocolVersion": "2024-11-05"},
-            }
-        )
-        tools_response = json.dumps(
-            {
-                "jsonrpc": "2.0",
-                "id": 2,
-                "result": {"tools": []},
-            }
-        )
-        mock_process.stdout.readline.side_effect = [init_response, tools_response]
+        client = MCPClient()
+        client.servers["fake"] = fake_server
+        await client.start_server(fake_server)
+        old_process = fake_server.process
 
-        # Create server with existing tool
-        server = MCPServer(name="test", command="echo")
+        # Pretend the running server had offered another tool
         old_tool = ToolDefinition(
-            name="test__old_tool",
+            name="fake__old_tool",
             description="Old tool",
             input_schema={"type": "object", "properties": {}},
         )
-        server.tools = [old_tool]
-        server.process = mock_process
-
-        client = MCPClient()
-        client.servers["test"] = server
-        client._all_tools = [old_tool]
-        client._tool_to_server["test__old_tool"] = "test"
-
-        with patch("subprocess.Popen", return_value=mock_process):
-            result = await client.restart_server("test")
-
-        assert result is True
-        # Old tool should be removed from registry
-        assert "test__old_tool" not in client._tool_to_server
+        fake_server.tools.append(old_tool)
+        client._all_tools.append(old_tool)
+        client._tool_to_server["fake__old_tool"] = "fake"
+
+        try:
+            result = await client.restart_server("fake")
+
+            assert result is True
+            assert fake_server.process is not old_process
+            assert old_process.returncode is not None
+            # Old tool should be removed from registry
+            assert "fake__old_tool" not in client._tool_to_server
+            assert [t.name for t in client._all_tools] == ["fake__echo"]
+            # Starting, removing the old tools and listing the new ones each invalidate cached tool sets
+            assert client.tools_version == 3
+        finally:
+            await client.stop_all()
 
     @pytest.mark.asyncio
     async def test_recover_unhealthy_none(self):
@@ -648,7 +752,7 @@ class TestMCPHealthCheck:
         client = MCPClient()
 
         healthy_process = MagicMock()
-        healthy_process.poll.return_value = None
+        healthy_process.returncode = None
         server = MCPServer(name="test", command="echo")
         server.process = healthy_process
         client.servers["test"] = server
@@ -657,44 +761,25 @@ class TestMCPHealthCheck:
         assert recovered == 0
 
     @pytest.mark.asyncio
-    async def test_recover_unhealthy_restarts(self, mock_process):
+    async def test_recover_unhealthy_restarts(self, fake_server, mock_process):
         """Test recovery restarts unhealthy servers."""
-        init_response = json.dumps(
-            {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "result": {"protocolVersion": "2024-11-05"},
-            }
-        )
-        tools_response = json.dumps(
-            {
-                "jsonrpc": "2.0",
-                "id": 2,
-                "result": {"tools": []},
-            }
-        )
-        mock_process.stdout.readline.side_effect = [init_response, tools_response]
-
-        # Unhealthy server
-        unhealthy_process = MagicMock()
-        unhealthy_process.poll.return_value = 1  # Crashed
-
-        server = MCPServer(name="crashed", command="echo")
-        server.process = unhealthy_process
+        mock_process.returncode = 1  # Crashed
+        mock_process.terminate.side_effect = ProcessLookupError()
+        fake_server.process = mock_process
 
         client = MCPClient()
-        client.servers["crashed"] = server
+        client.servers["fake"] = fake_server
 
-        with patch("subprocess.Popen", return_value=mock_process):
+        try:
             recovered = await client.recover_unhealthy()
-
-        assert recovered == 1
+            assert recovered == 1
+            assert client.is_server_healthy(fake_server) is True
+        finally:
+            await client.stop_all()
 
     @pytest.mark.asyncio
     async def test_ensure_healthy(self, mock_process):
         """Test ensure_healthy convenience method."""
-        mock_process.poll.return_value = None  # All healthy
-
         server = MCPServer(name="test", command="echo")
         server.process = mock_process
 
@@ -3,17 +3,22 @@
 from __future__ import annotations
 
 import asyncio
+import json
+import shutil
+import subprocess
 import tempfile
+import threading
+from datetime import timedelta
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 import pytest
 
-from gru.claude import Response, ToolUse
+from gru.claude import Response, StreamInterruptedError, ToolUse
 from gru.config import Config
 from gru.crypto import CryptoManager, SecretStore
 from gru.db import Database
-from gru.orchestrator import Agent, Orchestrator
+from gru.orchestrator import Agent, Orchestrator, _agent_system_prompt
 
 
 @pytest.fixture
@@ -96,6 +101,182 @@ async def test_get_agent(orchestrator):
     assert agent["id"] == spawned["id"]
 
 
+@pytest.mark.asyncio
+async def test_spawn_agent_resource_limits(orchestrator, test_config):
+    """Test spawned agents store config defaults or explicit resource limits."""
+    default = await orchestrator.spawn_agent(task="Test task")
+    custom = await orchestrator.spawn_agent(task="Test task", memory_limit="1G", cpu_quota=200)
+
+    assert default["memory_limit"] == test_config.default_memory_limit
+    assert default["cpu_quota"] == test_config.default_cpu_quota
+    assert custom["memory_limit"] == "1G"
+    assert custom["cpu_quota"] == 200
+
+
+@pytest.mark.asyncio
+async def test_spawn_agent_tool_subset(orchestrator):
+    """Test an agent limited to some tools is only sent those tools."""
+    agent_data = await orchestrator.spawn_agent(task="Test task", tools=["bash", "github__create_issue"])
+    agent = orchestrator._agents[agent_data["id"]]
+
+    assert json.loads(agent_data["tools"]) == ["bash", "github__create_issue"]
+    assert [t.name for t in orchestrator.tools.tool_set(agent.tools)] == ["bash"]
+    with pytest.raises(ValueError, match="Unknown tools: bsh"):
+        await orchestrator.spawn_agent(task="Test task", tools=["bsh"])
+
+
+@pytest.mark.asyncio
+async def test_batched_agents_dispatched_to_batch_slots(test_config, test_db, test_secrets):
+    """Test low-priority and oneshot agents run batched, beside full interactive slots."""
+    test_config.batch_mode = True
+    test_config.max_concurrent_agents = 1
+    test_config.batch_max_agents = 2
+    orch = Orchestrator(test_config, test_db, test_secrets)
+    try:
+        with patch.object(orch, "run_agent", new=AsyncMock()):
+            busy = await orch.spawn_agent(task="Interactive task")
+            low = await orch.spawn_agent(task="Backlog task", priority="low")
+            oneshot = await orch.spawn_agent(task="Oneshot task", supervised=False, timeout_mode="auto")
+            waiting = await orch.spawn_agent(task="Another interactive task")
+            await orch._dispatch_queued()
+
+            # Both slot classes fill; only the interactive task without a slot waits
+            assert orch.scheduler.running_count == 3
+            assert len(orch.scheduler._batched) == 2
+            assert [t.agent_id for t in orch.scheduler._entries.values()] == [waiting["id"]]
+            assert orch._uses_batches(orch._agents[low["id"]])
+            assert not orch._uses_batches(orch._agents[waiting["id"]])
+            assert orch._uses_batches(orch._agents[oneshot["id"]])
+            assert not orch._uses_batches(orch._agents[busy["id"]])
+    finally:
+        await orch.stop()
+
+
+@pytest.mark.asyncio
+async def test_full_batch_slots_dont_hold_up_interactive(test_config, test_db, test_secrets):
+    """Test a starved backlog of batched tasks doesn't keep interactive tasks from free slots."""
+    test_config.batch_mode = True
+    test_config.max_concurrent_agents = 5
+    test_config.batch_max_agents = 1
+    orch = Orchestrator(test_config, test_db, test_secrets)
+    try:
+        with patch.object(orch, "run_agent", new=AsyncMock()):
+            for i in range(3):
+                await orch.spawn_agent(task=f"Backlog task {i}", priority="low")
+            high = await orch.spawn_agent(task="Urgent task", priority="high")
+            # Age every queued task past the starvation threshold so the queue is served oldest first
+            for queued in orch.scheduler._entries.values():
+                queued.queued_at -= timedelta(seconds=orch.scheduler.starvation_age + 1)
+            orch.scheduler._by_age = [(t.queued_at, t.task_id) for t in orch.scheduler._entries.values()]
+
+            await orch._dispatch_queued()
+
+            assert len(orch.scheduler._batched) == 1
+            assert orch.scheduler.running_count == 2
+            assert high["id"] not in {t.agent_id for t in orch.scheduler._entries.values()}
+            assert orch.scheduler.queue_length == 2
+    finally:
+        await orch.stop()
+
+
+@pytest.mark.asyncio
+async def test_tool_subset_enforced(orchestrator, test_config):
+    """Test a tool outside the agent's allow-list is refused, and the prompt lists only allowed tools."""
+    agent_data = await orchestrator.spawn_agent(task="Test task", tools=["read_file", "github__create_issue"])
+    agent = orchestrator._agents[agent_data["id"]]
+    agent.workdir = str(test_config.data_dir)
+    write = ToolUse(id="tu1", name="write_file", input={"path": "a.txt", "content": "A"})
+
+    result = await orchestrator._handle_tool_use(agent, write, "task123")
+
+    assert result.is_error
+    assert result.content == "Tool not available to this agent: write_file"
+    assert not (test_config.data_dir / "a.txt").exists()
+
+    prompt = _agent_system_prompt("/work", agent.tools)
+    assert "- read_file: Read file contents\n- github__create_issue\n" in prompt
+    assert "bash" not in prompt and "write_file" not in prompt
+    assert "1. Report the result" in prompt
+    full = _agent_system_prompt("/work", None)
+    assert "- bash: Execute shell commands" in full
+    assert "2. Use bash to run commands" in full
+
+
+@pytest.mark.asyncio
+async def test_get_agent_resources(orchestrator, test_config):
+    """Test get_agent reports live usage from the agent's cgroup."""
+    spawned = await orchestrator.spawn_agent(task="Test task")
+    cgroup = test_config.data_dir / "agent-cgroup"
+    cgroup.mkdir()
+    (cgroup / "memory.current").write_text("1048576\n")
+    (cgroup / "memory.max").write_text("max\n")
+    (cgroup / "cpu.stat").write_text("usage_usec 2000000\n")
+    await orchestrator.db.update_agent(spawned["id"], cgroup_path=str(cgroup))
+
+    agent = await orchestrator.get_agent(spawned["id"])
+
+    assert agent["resources"]["memory_current"] == 1048576
+    assert agent["resources"]["memory_max"] is None
+    assert agent["resources"]["cpu_usage_usec"] == 2000000
+
+
+@pytest.mark.asyncio
+async def test_setup_agent_cgroup(orchestrator, test_config):
+    """Test the agent cgroup is created with the agent's limits and recorded."""
+    test_config.cgroup_root = test_config.data_dir / "cgroup" / "gru"
+    test_config.cgroup_root.mkdir(parents=True)
+    for path in (test_config.cgroup_root.parent, test_config.cgroup_root):
+        (path / "cgroup.controllers").write_text("cpu memory\n")
+        (path / "cgroup.subtree_control").write_text("")
+    spawned = await orchestrator.spawn_agent(task="Test task", memory_limit="1G", cpu_quota=25)
+    agent = Agent(spawned["id"], "Test task", "test-model", False, "block", spawned["workdir"], orchestrator)
+
+    await orchestrator._setup_agent_cgroup(agent, spawned)
+
+    assert agent.cgroup_path == test_config.cgroup_root / f"agent-{agent.id}"
+    assert (agent.cgroup_path / "memory.max").read_text() == str(1024**3)
+    assert (agent.cgroup_path / "cpu.max").read_text() == "25000 100000"
+    stored = await orchestrator.db.get_agent(agent.id)
+    assert stored["cgroup_path"] == str(agent.cgroup_path)
+
+
+@pytest.mark.asyncio
+async def test_setup_agent_cgroup_unavailable(orchestrator, test_config):
+    """Test an agent runs without limits when cgroups can't be created."""
+    test_config.cgroup_root = test_config.data_dir / "no-cgroup" / "gru"
+    spawned = await orchestrator.spawn_agent(task="Test task")
+    agent = Agent(spawned["id"], "Test task", "test-model", False, "block", spawned["workdir"], orchestrator)
+
+    await orchestrator._setup_agent_cgroup(agent, spawned)
+
+    assert agent.cgroup_path is None
+    stored = await orchestrator.db.get_agent(agent.id)
+    assert stored["cgroup_path"] is None
+
+
+@pytest.mark.asyncio
+async def test_run_agent_removes_cgroup_off_event_loop(orchestrator, test_config):
+    """Test the agent cgroup is removed in a worker thread when the agent exits."""
+    spawned = await orchestrator.spawn_agent(task="Test task")
+    agent = orchestrator._agents[spawned["id"]]
+    agent.cgroup_path = test_config.data_dir / "agent-cgroup"
+    removed_in: list[threading.Thread] = []
+
+    def remove(cgroup):
+        removed_in.append(threading.current_thread())
+        return True
+
+    done = Response(content="Done", tool_uses=[], stop_reason="end_turn", usage={"input_tokens": 1, "output_tokens": 1})
+    with (
+        patch.object(orchestrator.claude, "stream_turn", return_value=done),
+        patch("gru.orchestrator.remove_agent_cgroup", side_effect=remove),
+    ):
+        await orchestrator.run_agent(agent, "task123")
+
+    assert len(removed_in) == 1
+    assert removed_in[0] is not threading.main_thread()
+
+
 @pytest.mark.asyncio
 async def test_get_nonexistent_agent(orchestrator):
     """Test getting nonexistent agent returns None."""
@@ -238,6 +419,19 @@ async def test_get_status(orchestrator):
     assert status["agents"]["total"] == 1
 
 
+@pytest.mark.asyncio
+async def test_get_status_counts_all_agents(orchestrator, test_db):
+    """Test status counts come from an aggregate over every agent, not the first page."""
+    for i in range(105):
+        await test_db.create_agent(agent_id=f"a{i}", task="x" * 1000, model="test-model")
+        await test_db.update_agent(f"a{i}", status="completed" if i % 3 else "failed")
+
+    with patch.object(test_db, "get_agents", side_effect=AssertionError("loaded agent rows")):
+        status = await orchestrator.get_status()
+
+    assert status["agents"] == {"total": 105, "running": 0, "paused": 0, "completed": 70, "failed": 35}
+
+
 @pytest.mark.asyncio
 async def test_run_agent_completion(orchestrator, test_config):
     """Test running an agent to completion."""
@@ -262,7 +456,7 @@ async def test_run_agent_completion(orchestrator, test_config):
         usage={"input_tokens": 10, "output_tokens": 5},
     )
 
-    with patch.object(orchestrator.claude, "send_message", return_value=mock_response):
+    with patch.object(orchestrator.claude, "stream_turn", return_value=mock_response):
         await orchestrator.run_agent(agent, "task123")
 
     updated = await orchestrator.get_agent(agent_data["id"])
@@ -314,13 +508,57 @@ async def test_run_agent_with_tool_use(orchestrator, test_config):
             return tool_response
         return final_response
 
-    with patch.object(orchestrator.claude, "send_message", side_effect=mock_send):
+    with patch.object(orchestrator.claude, "stream_turn", side_effect=mock_send):
         await orchestrator.run_agent(agent, "task123")
 
     updated = await orchestrator.get_agent(agent_data["id"])
     assert updated["status"] == "completed"
 
 
+@pytest.mark.asyncio
+async def test_run_agent_routes_follow_up_turns(orchestrator, test_config, tmp_path):
+    """Test tool follow-ups go to the fast model and a routed final answer is escalated."""
+    orchestrator.router.fast_model = "claude-3-5-haiku-20241022"
+    agent_data = await orchestrator.spawn_agent(task="Read a file", model="claude-sonnet-4-20250514")
+    agent = orchestrator._agents[agent_data["id"]]
+    test_file = tmp_path / "test.txt"
+    test_file.write_text("test content")
+
+    usage = {"input_tokens": 1000, "output_tokens": 100}
+    responses = {
+        "claude-sonnet-4-20250514": [
+            Response("Reading", [ToolUse("tu1", "read_file", {"path": str(test_file)})], "tool_use", usage),
+            Response("It says test content", [], "end_turn", usage),
+        ],
+        "claude-3-5-haiku-20241022": [
+            Response("Reading again", [ToolUse("tu2", "read_file", {"path": str(test_file)})], "tool_use", usage),
+            Response("Done", [], "end_turn", usage),
+        ],
+    }
+    models = []
+
+    async def mock_stream(*args, **kwargs):
+        models.append(kwargs["model"])
+        return responses[kwargs["model"]].pop(0)
+
+    with patch.object(orchestrator.claude, "stream_turn", side_effect=mock_stream):
+        await orchestrator.run_agent(agent, "task123")
+
+    assert models == [
+        "claude-sonnet-4-20250514",  # planning
+        "claude-3-5-haiku-20241022",  # follow-up
+        "claude-3-5-haiku-20241022",  # would finish...
+        "claude-sonnet-4-20250514",  # ...so it is escalated
+    ]
+    updated = await orchestrator.get_agent(agent_data["id"])
+    assert updated["status"] == "completed"
+    assert updated["routed_turns"] == 2
+    # One routed turn saved (0.003 + 0.0015) - (0.0008 + 0.0004); the discarded one cost 0.0012
+    assert updated["routing_savings"] == pytest.approx(0.0033 - 0.0012)
+    assert updated["cost"] == pytest.approx(2 * 0.0045 + 2 * 0.0012)
+    assert (await orchestrator.get_agent_cost_from_db(agent_data["id"]))[2] == f"{updated['cost']:.4f}"
+
+
 @pytest.mark.asyncio
 async def test_run_agent_failure(orchestrator, test_config):
     """Test agent failure handling."""
@@ -337,7 +575,7 @@ async def test_run_agent_failure(orchestrator, test_config):
     )
     orchestrator._agents[agent_data["id"]] = agent
 
-    with patch.object(orchestrator.claude, "send_message", side_effect=Exception("API Error")):
+    with patch.object(orchestrator.claude, "stream_turn", side_effect=Exception("API Error")):
         await orchestrator.run_agent(agent, "task123")
 
     updated = await orchestrator.get_agent(agent_data["id"])
@@ -345,6 +583,116 @@ async def test_run_agent_failure(orchestrator, test_config):
     assert "API Error" in updated["error"]
 
 
+@pytest.mark.asyncio
+async def test_run_agent_dispatches_tools_mid_stream(orchestrator, test_config):
+    """Test tools start while the turn is still streaming and live text reaches chat."""
+    agent_data = await orchestrator.spawn_agent(task="Write files", live_output=True)
+    agent = orchestrator._agents[agent_data["id"]]
+    agent.workdir = str(test_config.data_dir)
+    notifications: list[str] = []
+    orchestrator.set_notify_callback(lambda agent_id, msg: notifications.append(msg))
+
+    first = ToolUse(id="tu1", name="write_file", input={"path": "a.txt", "content": "A"})
+    second = ToolUse(id="tu2", name="write_file", input={"path": "b.txt", "content": "B"})
+    call_count = 0
+
+    async def mock_stream(*args, on_text=None, on_tool_use=None, **kwargs):
+        nonlocal call_count
+        call_count += 1
+        if call_count > 1:
+            return Response(
+                content="Done", tool_uses=[], stop_reason="end_turn", usage={"input_tokens": 1, "output_tokens": 1}
+            )
+        await on_text("Writing A\nthen")
+        await on_tool_use(first)
+        # First tool runs while the rest of the response is generating
+        await asyncio.sleep(0.05)
+        assert (test_config.data_dir / "a.txt").exists()
+        await on_text(" B")
+        await on_tool_use(second)
+        return Response(
+            content="Writing A\nthen B",
+            tool_uses=[first, second],
+            stop_reason="tool_use",
+            usage={"input_tokens": 1, "output_tokens": 1},
+        )
+
+    with patch.object(orchestrator.claude, "stream_turn", side_effect=mock_stream):
+        await orchestrator.run_agent(agent, "task123")
+
+    assert (test_config.data_dir / "b.txt").read_text() == "B"
+    assert notifications[:4] == ["Writing A", "then", "[write_file] a.txt", "B"]
+    results = agent.messages[2]["content"]
+    assert [r["tool_use_id"] for r in results] == ["tu1", "tu2"]
+
+
+@pytest.mark.asyncio
+async def test_run_agent_resends_after_interrupted_stream(orchestrator, test_config):
+    """Test a stream dropped after tool dispatch continues with the started tools' results."""
+    agent_data = await orchestrator.spawn_agent(task="Write", supervised=False, live_output=True)
+    agent = orchestrator._agents[agent_data["id"]]
+    agent.workdir = str(test_config.data_dir)
+    notifications: list[str] = []
+    orchestrator.set_notify_callback(lambda agent_id, msg: notifications.append(msg))
+    write = ToolUse(id="tu1", name="write_file", input={"path": "a.txt", "content": "A"})
+    append = ToolUse(id="tu2", name="bash", input={"command": "echo B >> a.txt"})
+    sent: list = []
+
+    async def mock_stream(*args, messages, on_text=None, on_tool_use=None, **kwargs):
+        sent.append(list(messages))
+        if len(sent) == 1:
+            await on_text("Writing the file")
+            await on_tool_use(write)
+            await on_tool_use(append)
+            usage = {"input_tokens": 100, "output_tokens": 20}
+            raise StreamInterruptedError([write, append], ConnectionError("dropped"), "Writing the file", usage)
+        return Response(
+            content="Done", tool_uses=[], stop_reason="end_turn", usage={"input_tokens": 1, "output_tokens": 1}
+        )
+
+    with (
+        patch.object(orchestrator.claude, "stream_turn", side_effect=mock_stream),
+        patch.object(orchestrator.claude, "send_message") as send,
+    ):
+        await orchestrator.run_agent(agent, "task123")
+
+    assert (await orchestrator.get_agent(agent.id))["status"] == "completed"
+    # Each tool ran exactly once and the model was told so rather than asked again
+    assert (test_config.data_dir / "a.txt").read_text() == "AB\n"
+    send.assert_not_called()
+    assert len(sent) == 2
+    assert sent[1][1]["content"][0] == {"type": "text", "text": "Writing the file"}
+    assert [b["id"] for b in sent[1][1]["content"][1:]] == ["tu1", "tu2"]
+    assert [r["tool_use_id"] for r in sent[1][2]["content"]] == ["tu1", "tu2"]
+    assert "Writing the file" in notifications
+    # The dropped stream's tokens are still counted
+    assert agent.total_tokens == 122
+
+
+@pytest.mark.asyncio
+async def test_run_agent_without_streaming(orchestrator, test_config):
+    """Test tools still run when streaming is disabled."""
+    test_config.stream_turns = False
+    agent_data = await orchestrator.spawn_agent(task="Read a file")
+    agent = orchestrator._agents[agent_data["id"]]
+    test_file = test_config.data_dir / "test.txt"
+    test_file.write_text("test content")
+    responses = [
+        Response(
+            content="",
+            tool_uses=[ToolUse(id="tu1", name="read_file", input={"path": str(test_file)})],
+            stop_reason="tool_use",
+            usage={"input_tokens": 1, "output_tokens": 1},
+        ),
+        Response(content="Done", tool_uses=[], stop_reason="end_turn", usage={"input_tokens": 1, "output_tokens": 1}),
+    ]
+
+    with patch.object(orchestrator.claude, "send_message", side_effect=responses):
+        await orchestrator.run_agent(agent, "task123")
+
+    assert agent.messages[2]["content"][0]["content"] == "test content"
+
+
 @pytest.mark.asyncio
 async def test_execute_bash(orchestrator, test_config):
     """Test bash execution."""
@@ -359,6 +707,19 @@ async def test_execute_bash_timeout(orchestrator, test_config):
     assert "timed out" in result.lower()
 
 
+@pytest.mark.asyncio
+async def test_execute_bash_agent_timeout(orchestrator, test_config, test_db):
+    """Test an agent's bash_timeout overrides the configured default and is stored."""
+    agent_data = await orchestrator.spawn_agent(task="Slow", bash_timeout=1)
+    agent = orchestrator._agents[agent_data["id"]]
+
+    result = await orchestrator._execute_tool(agent, "bash", {"command": "echo started; sleep 30"}, "task1")
+
+    assert "timed out after 1 seconds" in result
+    assert "started" in result
+    assert (await test_db.get_agent(agent.id))["bash_timeout"] == 1
+
+
 @pytest.mark.asyncio
 async def test_read_file(orchestrator, test_config):
     """Test file reading."""
@@ -713,6 +1074,33 @@ class TestConversationTruncation:
         assert result[0]["content"] == "msg0"  # First message preserved
         assert "truncated" in result[1]["content"].lower()
 
+    @pytest.mark.asyncio
+    async def test_truncate_keeps_prefix_stable(self, orchestrator):
+        """Test consecutive truncated turns share a prefix so the prompt cache hits."""
+        messages = [{"role": "user", "content": f"msg{i}"} for i in range(60)]
+        first = orchestrator._truncate_conversation(messages)
+        messages += [{"role": "assistant", "content": "reply"}, {"role": "user", "content": "next"}]
+        second = orchestrator._truncate_conversation(messages)
+
+        assert second[: len(first)] == first
+        assert len(second) <= orchestrator.config.max_conversation_messages
+
+    @pytest.mark.asyncio
+    async def test_truncate_by_token_budget(self, orchestrator, test_config):
+        """Test a few oversized messages are dropped even under the message limit."""
+        test_config.context_token_budget = 1000
+        window = orchestrator._new_context_window()
+        messages = [{"role": "user", "content": "task"}] + [
+            {"role": "assistant" if i % 2 else "user", "content": "x" * 2000} for i in range(6)
+        ]
+
+        result = orchestrator._truncate_conversation(messages, window)
+
+        assert len(messages) < test_config.max_conversation_messages
+        assert result[0]["content"] == "task"
+        assert "truncated" in result[1]["content"].lower()
+        assert result[2:] == messages[-1:]
+
 
 # =============================================================================
 # Cost Estimation Tests
@@ -739,6 +1127,23 @@ class TestCostEstimation:
         # Input: 1M * $3 = $3, Output: 0.5M * $15 = $7.50
         assert cost == "10.5000"
 
+    @pytest.mark.asyncio
+    async def test_estimate_cost_with_cache(self, orchestrator, test_config):
+        """Test cache reads bill at 10% and writes at 125% of the input rate."""
+        agent = Agent(
+            agent_id="test1",
+            task="Test",
+            model="claude-sonnet-4-20250514",
+            supervised=False,
+            timeout_mode="block",
+            workdir=str(test_config.data_dir),
+            orchestrator=orchestrator,
+        )
+        agent.add_tokens(0, 0, cache_read_tokens=1000000, cache_creation_tokens=1000000)
+        # Reads: 1M * $0.30 = $0.30, Writes: 1M * $3.75 = $3.75
+        assert orchestrator._estimate_cost(agent) == "4.0500"
+        assert agent.total_tokens == 2000000
+
     @pytest.mark.asyncio
     async def test_estimate_cost_unknown_model(self, orchestrator, test_config):
         """Test cost estimation uses default for unknown model."""
@@ -852,6 +1257,15 @@ class TestToolExecutionExtended:
         )
         assert "STDERR" in result or "error" in result
 
+    @pytest.mark.asyncio
+    async def test_execute_bash_in_cgroup(self, orchestrator, test_config):
+        """Test bash joins the agent's cgroup before running the command."""
+        cgroup = test_config.data_dir / "agent-cgroup"
+        cgroup.mkdir()
+        result = await orchestrator._execute_bash("echo hello", str(test_config.data_dir), cgroup=cgroup)
+        assert result.strip() == "hello"
+        assert (cgroup / "cgroup.procs").read_text() == "0\n"
+
     @pytest.mark.asyncio
     async def test_execute_bash_nonzero_exit(self, orchestrator, test_config):
         """Test bash execution with non-zero exit code."""
@@ -992,3 +1406,491 @@ class TestApprovalExtended:
         # Try to approve again
         success = await orchestrator.approve("appr1")
         assert not success
+
+
+# =============================================================================
+# Dispatch Loop Tests
+# =============================================================================
+
+
+class TestDispatchLoop:
+    """Tests for the event-driven dispatch loop."""
+
+    @pytest.mark.asyncio
+    async def test_start_dispatches_on_enqueue(self, orchestrator, test_config):
+        """Test queued agents start without waiting for a poll interval."""
+        test_config.scheduler_interval = 60  # A polling loop would never get here
+        started = asyncio.Event()
+
+        async def fake_run_agent(agent, task_id):
+            started.set()
+            orchestrator.scheduler.unregister_running(task_id)
+
+        with patch.object(orchestrator, "run_agent", side_effect=fake_run_agent):
+            loop_task = asyncio.create_task(orchestrator.start())
+            await asyncio.sleep(0)
+            await orchestrator.spawn_agent(task="Test task")
+            await asyncio.wait_for(started.wait(), timeout=1)
+
+            await orchestrator.stop()
+            await asyncio.wait_for(loop_task, timeout=1)
+
+    @pytest.mark.asyncio
+    async def test_stop_wakes_idle_dispatcher(self, orchestrator):
+        """Test stop() ends an idle dispatcher promptly."""
+        loop_task = asyncio.create_task(orchestrator.start())
+        await asyncio.sleep(0)
+
+        await orchestrator.stop()
+        await asyncio.wait_for(loop_task, timeout=1)
+
+
+# =============================================================================
+# Task Recovery Tests
+# =============================================================================
+
+
+class TestTaskRecovery:
+    """Tests for recovering unfinished tasks after a restart."""
+
+    @pytest.fixture
+    async def restarted(self, test_config, test_db, test_secrets):
+        """Create a second orchestrator sharing the same database."""
+        orch = Orchestrator(test_config, test_db, test_secrets)
+        yield orch
+        await orch.stop()
+
+    @pytest.mark.asyncio
+    async def test_recover_queued_task(self, orchestrator, restarted):
+        """Test queued tasks are re-queued with their agents."""
+        agent_data = await orchestrator.spawn_agent(task="Queued task", priority="high")
+
+        recovered = await restarted.recover_tasks()
+
+        assert recovered == 1
+        assert agent_data["id"] in restarted._agents
+        queued = await restarted.scheduler.dequeue()
+        assert queued.agent_id == agent_data["id"]
+        assert queued.priority_score == -100
+        assert not restarted._agents[agent_data["id"]].resumed
+        assert restarted._agents[agent_data["id"]].tools is None
+
+    @pytest.mark.asyncio
+    async def test_recover_tool_subset(self, orchestrator, restarted):
+        """Test a recovered agent keeps its tool allow-list."""
+        agent_data = await orchestrator.spawn_agent(task="Queued task", tools=["read_file"])
+
+        await restarted.recover_tasks()
+
+        assert restarted._agents[agent_data["id"]].tools == frozenset({"read_file"})
+
+    @pytest.mark.asyncio
+    async def test_recover_running_task_resumes_history(self, orchestrator, restarted, test_db):
+        """Test interrupted tasks resume from stored conversation history."""
+        agent_data = await orchestrator.spawn_agent(task="Long task", supervised=False)
+        agent_id = agent_data["id"]
+        task = await test_db.fetchone("SELECT id FROM tasks WHERE agent_id = ?", (agent_id,))
+        await test_db.update_task(task["id"], status="running")
+        await test_db.add_message(agent_id, "user", "Long task")
+        await test_db.add_message(
+            agent_id, "assistant", "Reading", tool_use=[{"id": "tu1", "name": "read_file", "input": {"path": "a"}}]
+        )
+        await test_db.add_message(
+            agent_id,
+            "user",
+            "[1 tool result(s)]",
+            tool_result=[{"type": "tool_result", "tool_use_id": "tu1", "content": "data", "is_error": False}],
+        )
+        # Crashed before this tool call's result was stored
+        await test_db.add_message(
+            agent_id, "assistant", "Writing", tool_use=[{"id": "tu2", "name": "bash", "input": {"command": "ls"}}]
+        )
+
+        await restarted.recover_tasks()
+
+        agent = restarted._agents[agent_id]
+        assert agent.resumed
+        assert agent.turn_count == 2
+        assert agent.messages[0] == {"role": "user", "content": "Long task"}
+        assert agent.messages[1]["content"][1]["id"] == "tu1"
+        assert agent.messages[2]["content"][0]["tool_use_id"] == "tu1"
+        assert agent.messages[3]["content"] == [{"type": "text", "text": "Writing"}]
+        assert agent.messages[-1]["role"] == "user"
+        assert (await test_db.get_task(task["id"]))["status"] == "queued"
+
+        sent: list = []
+
+        async def mock_send(*args, **kwargs):
+            sent.append(list(kwargs["messages"]))
+            return Response(
+                content="Done", tool_uses=[], stop_reason="end_turn", usage={"input_tokens": 1, "output_tokens": 1}
+            )
+
+        with patch.object(restarted.claude, "stream_turn", side_effect=mock_send):
+            await restarted.run_agent(agent, task["id"])
+
+        assert sent[0][:4] == agent.messages[:4]
+        user_rows = [m for m in await test_db.get_conversation(agent_id) if m["content"] == "Long task"]
+        assert len(user_rows) == 1
+
+    @pytest.mark.asyncio
+    async def test_stop_then_recover(self, orchestrator, restarted, test_db, test_config):
+        """Test a graceful stop leaves running and queued agents for the next start."""
+        test_config.recover_tasks = True
+        running = await orchestrator.spawn_agent(task="Long task", supervised=False)
+        waiting = await orchestrator.spawn_agent(task="Waiting task")
+        turn_started = asyncio.Event()
+
+        async def hang(*args, **kwargs):
+            turn_started.set()
+            await asyncio.Event().wait()
+
+        with (
+            patch.object(orchestrator.claude, "stream_turn", side_effect=hang),
+            patch.object(orchestrator, "_cleanup_agent_worktree") as cleanup,
+        ):
+            queued = await orchestrator.scheduler.peek(lambda t: t.agent_id == running["id"])
+            await orchestrator.scheduler.cancel(queued.task_id)
+            task = asyncio.create_task(orchestrator.run_agent(orchestrator._agents[running["id"]], queued.task_id))
+            orchestrator.scheduler.register_running(queued.task_id, task)
+            await asyncio.wait_for(turn_started.wait(), 1)
+
+            await orchestrator.stop()
+
+        assert task.cancelled()
+        cleanup.assert_not_called()
+        assert (await test_db.get_agent(running["id"]))["status"] == "running"
+        assert (await test_db.get_agent(waiting["id"]))["status"] == "idle"
+
+        recovered = await restarted.recover_tasks()
+
+        assert recovered == 2
+        assert restarted._agents[running["id"]].resumed
+        assert not restarted._agents[waiting["id"]].resumed
+        assert (await test_db.get_task(queued.task_id))["status"] == "queued"
+
+    @pytest.mark.asyncio
+    async def test_recover_cancels_tasks_of_finished_agents(self, orchestrator, restarted, test_db):
+        """Test queued tasks of terminated agents are not resurrected."""
+        agent_data = await orchestrator.spawn_agent(task="Task")
+        await orchestrator.terminate_agent(agent_data["id"])
+
+        recovered = await restarted.recover_tasks()
+
+        assert recovered == 0
+        task = await test_db.fetchone("SELECT status FROM tasks WHERE agent_id = ?", (agent_data["id"],))
+        assert task["status"] == "cancelled"
+
+    @pytest.mark.asyncio
+    async def test_recover_expires_pending_approvals(self, orchestrator, restarted, test_db):
+        """Test approvals left pending by the crashed run are timed out."""
+        agent_data = await orchestrator.spawn_agent(task="Task")
+        task = await test_db.fetchone("SELECT id FROM tasks WHERE agent_id = ?", (agent_data["id"],))
+        await test_db.update_task(task["id"], status="waiting_approval")
+        await test_db.create_approval("ap1", agent_data["id"], "bash", {"command": "ls"}, task_id=task["id"])
+
+        await restarted.recover_tasks()
+
+        assert await restarted.get_pending_approvals() == []
+        assert (await test_db.get_approval("ap1"))["status"] == "timeout"
+
+    @pytest.mark.asyncio
+    async def test_recover_restores_missing_worktree(self, orchestrator, restarted, test_db, test_config):
+        """Test a deleted worktree is recreated from its branch instead of using the base repo."""
+        repo = test_config.data_dir / "repo"
+        repo.mkdir()
+        for cmd in (
+            ["git", "init"],
+            ["git", "config", "user.email", "test@test.com"],
+            ["git", "config", "user.name", "Test User"],
+            ["git", "commit", "--allow-empty", "-m", "init"],
+        ):
+            subprocess.run(cmd, cwd=repo, capture_output=True, check=True)
+        agent_data = await orchestrator.spawn_agent(task="Task", workdir=str(repo))
+        worktree = Path(orchestrator._agents[agent_data["id"]].workdir)
+        assert worktree != repo
+        shutil.rmtree(worktree)
+
+        recovered = await restarted.recover_tasks()
+
+        assert recovered == 1
+        assert restarted._agents[agent_data["id"]].workdir == str(worktree)
+        assert worktree.exists()
+
+    @pytest.mark.asyncio
+    async def test_recover_fails_task_when_worktree_lost(self, orchestrator, restarted, test_db, test_config):
+        """Test a worktree that cannot be recreated fails the task."""
+        agent_data = await orchestrator.spawn_agent(task="Task")
+        await test_db.update_agent(
+            agent_data["id"],
+            worktree_path=str(test_config.data_dir / "gone"),
+            worktree_branch="gru-agent-gone",
+            base_repo=str(test_config.data_dir / "not-a-repo"),
+        )
+
+        recovered = await restarted.recover_tasks()
+
+        assert recovered == 0
+        assert agent_data["id"] not in restarted._agents
+        task = await test_db.fetchone("SELECT status FROM tasks WHERE agent_id = ?", (agent_data["id"],))
+        assert task["status"] == "failed"
+        assert (await test_db.get_agent(agent_data["id"]))["status"] == "failed"
+
+
+@pytest.mark.asyncio
+async def test_run_agent_persists_agent_messages(orchestrator, test_db):
+    """Test messages from other agents are stored so a resumed agent keeps them."""
+    agent_data = await orchestrator.spawn_agent(task="Task", supervised=False)
+    agent = orchestrator._agents[agent_data["id"]]
+    other = await orchestrator.spawn_agent(task="Other")
+    await orchestrator.coordinator.send_message(other["id"], agent.id, "hello there")
+    done = Response(content="Done", tool_uses=[], stop_reason="end_turn", usage={"input_tokens": 1, "output_tokens": 1})
+
+    with patch.object(orchestrator.claude, "stream_turn", return_value=done):
+        await orchestrator.run_agent(agent, "task123")
+
+    history = await test_db.get_conversation(agent.id)
+    assert any("hello there" in m["content"] for m in history)
+
+
+@pytest.mark.asyncio
+async def test_wait_for_messages_tool(orchestrator, test_db):
+    """Test the wait_for_messages tool blocks until another agent replies."""
+    agent_data = await orchestrator.spawn_agent(task="Task", supervised=False)
+    agent = orchestrator._agents[agent_data["id"]]
+    other = await orchestrator.spawn_agent(task="Other")
+    await orchestrator.coordinator.open_mailbox(agent.id)
+
+    waiter = asyncio.create_task(orchestrator._execute_tool(agent, "wait_for_messages", {"timeout_seconds": 5}, "t"))
+    await asyncio.sleep(0)
+    await orchestrator.coordinator.send_message(other["id"], agent.id, "here you go", message_type="response")
+    result = await asyncio.wait_for(waiter, timeout=1)
+
+    assert result == f"[Message from agent {other['id']} (response)]: here you go"
+    assert await orchestrator.coordinator.get_messages(agent.id, unread_only=True) == []
+
+
+@pytest.mark.asyncio
+async def test_wait_for_messages_tool_timeout(orchestrator):
+    """Test the wait_for_messages tool reports when nothing arrives."""
+    agent_data = await orchestrator.spawn_agent(task="Task", supervised=False)
+    agent = orchestrator._agents[agent_data["id"]]
+
+    result = await orchestrator._execute_tool(agent, "wait_for_messages", {"timeout_seconds": 0.01}, "t")
+
+    assert result.startswith("No messages received")
+
+
+@pytest.mark.asyncio
+async def test_shared_context_tools_compare_and_set(orchestrator, test_db):
+    """Test agents can read a key's version and update it without overwriting each other."""
+    agent_data = await orchestrator.spawn_agent(task="Task", supervised=False)
+    agent = orchestrator._agents[agent_data["id"]]
+    task = await test_db.fetchone("SELECT id FROM tasks WHERE agent_id = ?", (agent.id,))
+
+    async def tool(name: str, **tool_input):
+        return await orchestrator._execute_tool(agent, name, tool_input, task["id"])
+
+    assert json.loads(await tool("get_shared_context", key="plan")) == {"key": "plan", "value": None, "version": 0}
+    created = await tool("set_shared_context", key="plan", value="v1", expected_version=0)
+    assert created == "Context set: plan (version 1)"
+    conflict = await tool("set_shared_context", key="plan", value="v2", expected_version=0)
+    assert conflict.startswith("Not set: plan is at version 1")
+    assert await tool("set_shared_context", key="plan", value="v2") == "Context set: plan (version 2)"
+    assert json.loads(await tool("wait_for_shared_context", key="plan", after_version=1)) == {
+        "key": "plan",
+        "value": "v2",
+        "version": 2,
+    }
+
+
+class TestConcurrentTools:
+    """Tests for concurrent tool execution within a turn."""
+
+    @staticmethod
+    def _turn(tool_uses: list[ToolUse]):
+        """Build a stream_turn mock that requests tool_uses once, then finishes."""
+        call_count = 0
+
+        async def mock_stream(*args, on_tool_use=None, **kwargs):
+            nonlocal call_count
+            call_count += 1
+            if call_count > 1:
+                return Response(
+                    content="Done", tool_uses=[], stop_reason="end_turn", usage={"input_tokens": 1, "output_tokens": 1}
+                )
+            for tool_use in tool_uses:
+                await on_tool_use(tool_use)
+            return Response(
+                content="", tool_uses=tool_uses, stop_reason="tool_use", usage={"input_tokens": 1, "output_tokens": 1}
+            )
+
+        return mock_stream
+
+    @pytest.mark.asyncio
+    async def test_tool_access_conflicts(self, orchestrator, test_config):
+        """Test which tool calls are allowed to overlap."""
+        agent_data = await orchestrator.spawn_agent(task="Test")
+        agent = orchestrator._agents[agent_data["id"]]
+
+        def access(name, **tool_input):
+            return orchestrator._tool_access(agent, ToolUse(id="x", name=name, input=tool_input))
+
+        read_a = access("read_file", path="a.txt")
+        assert not read_a.conflicts_with(access("read_file", path="a.txt"))
+        assert not read_a.conflicts_with(access("search_files", pattern="*"))
+        assert not read_a.conflicts_with(access("write_file", path="b.txt"))
+        assert read_a.conflicts_with(access("write_file", path=f"{agent.workdir}/a.txt"))
+        assert access("write_file", path="a.txt").conflicts_with(access("write_file", path="./a.txt"))
+        assert access("bash", command="ls").conflicts_with(read_a)
+        assert access("bash", command="ls").conflicts_with(access("bash", command="pwd"))
+        assert not access("get_shared_context").conflicts_with(access("get_shared_context", key="k"))
+        assert access("set_shared_context", key="k").conflicts_with(access("get_shared_context"))
+        assert access("send_message_to_agent").conflicts_with(access("get_shared_context"))
+
+    @pytest.mark.asyncio
+    async def test_reads_run_concurrently_in_order(self, orchestrator):
+        """Test independent reads overlap and results keep request order."""
+        agent_data = await orchestrator.spawn_agent(task="Read", supervised=False)
+        agent = orchestrator._agents[agent_data["id"]]
+        tool_uses = [ToolUse(id=f"tu{i}", name="read_file", input={"path": f"f{i}.txt"}) for i in range(5)]
+        running = 0
+        peak = 0
+
+        async def slow_read(path, workdir):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+            return path
+
+        with (
+            patch.object(orchestrator.claude, "stream_turn", side_effect=self._turn(tool_uses)),
+            patch.object(orchestrator, "_read_file", side_effect=slow_read),
+        ):
+            await orchestrator.run_agent(agent, "task123")
+
+        assert peak == 5
+        results = agent.messages[2]["content"]
+        assert [r["content"] for r in results] == [f"f{i}.txt" for i in range(5)]
+
+    @pytest.mark.asyncio
+    async def test_writes_to_same_path_serialized(self, orchestrator):
+        """Test writes to one path run one at a time, in request order."""
+        agent_data = await orchestrator.spawn_agent(task="Write", supervised=False)
+        agent = orchestrator._agents[agent_data["id"]]
+        tool_uses = [
+            ToolUse(id="tu1", name="write_file", input={"path": "a.txt", "content": "1"}),
+            ToolUse(id="tu2", name="write_file", input={"path": "a.txt", "content": "2"}),
+        ]
+        order: list[str] = []
+
+        async def slow_write(path, content, workdir):
+            order.append(f"start {content}")
+            await asyncio.sleep(0.02 if content == "1" else 0)
+            order.append(f"end {content}")
+            return "ok"
+
+        with (
+            patch.object(orchestrator.claude, "stream_turn", side_effect=self._turn(tool_uses)),
+            patch.object(orchestrator, "_write_file", side_effect=slow_write),
+        ):
+            await orchestrator.run_agent(agent, "task123")
+
+        assert order == ["start 1", "end 1", "start 2", "end 2"]
+
+    @pytest.mark.asyncio
+    async def test_approvals_sent_as_one_batch(self, orchestrator, test_config, test_db):
+        """Test supervised actions in a non-streamed turn share a single approval."""
+        test_config.stream_turns = False
+        agent_data = await orchestrator.spawn_agent(task="Write", supervised=True)
+        agent = orchestrator._agents[agent_data["id"]]
+        agent.workdir = str(test_config.data_dir)
+        task = await test_db.fetchone("SELECT id FROM tasks WHERE agent_id = ?", (agent.id,))
+        tool_uses = [
+            ToolUse(id="tu1", name="write_file", input={"path": "a.txt", "content": "A"}),
+            ToolUse(id="tu2", name="read_file", input={"path": "a.txt"}),
+            ToolUse(id="tu3", name="bash", input={"command": "echo hi"}),
+        ]
+        responses = [
+            Response(
+                content="", tool_uses=tool_uses, stop_reason="tool_use", usage={"input_tokens": 1, "output_tokens": 1}
+            ),
+            Response(
+                content="Done", tool_uses=[], stop_reason="end_turn", usage={"input_tokens": 1, "output_tokens": 1}
+            ),
+        ]
+        requests: list[dict] = []
+
+        def approval_callback(approval_id, details):
+            requests.append(details)
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(True)
+            return future
+
+        orchestrator.set_approval_callback(approval_callback)
+        with patch.object(orchestrator.claude, "send_message", side_effect=responses):
+            await orchestrator.run_agent(agent, task["id"])
+
+        assert len(requests) == 1
+        assert requests[0]["action"] == "batch"
+        assert [a["action"] for a in requests[0]["details"]["actions"]] == ["write_file", "bash"]
+        results = agent.messages[2]["content"]
+        assert results[1]["content"] == "A"
+        assert "hi" in results[2]["content"]
+
+    @pytest.mark.asyncio
+    async def test_streamed_approvals_requested_mid_stream(self, orchestrator, test_config, test_db):
+        """Test supervised actions are approved and run before the stream ends."""
+        agent_data = await orchestrator.spawn_agent(task="Write", supervised=True)
+        agent = orchestrator._agents[agent_data["id"]]
+        agent.workdir = str(test_config.data_dir)
+        task = await test_db.fetchone("SELECT id FROM tasks WHERE agent_id = ?", (agent.id,))
+        write = ToolUse(id="tu1", name="write_file", input={"path": "a.txt", "content": "A"})
+        requests: list[dict] = []
+        written_mid_stream = False
+        call_count = 0
+
+        def approval_callback(approval_id, details):
+            requests.append(details)
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(True)
+            return future
+
+        async def mock_stream(*args, on_tool_use=None, **kwargs):
+            nonlocal call_count, written_mid_stream
+            call_count += 1
+            if call_count > 1:
+                return Response(
+                    content="Done", tool_uses=[], stop_reason="end_turn", usage={"input_tokens": 1, "output_tokens": 1}
+                )
+            await on_tool_use(write)
+            await asyncio.sleep(0.05)
+            written_mid_stream = (test_config.data_dir / "a.txt").exists()
+            return Response(
+                content="", tool_uses=[write], stop_reason="tool_use", usage={"input_tokens": 1, "output_tokens": 1}
+            )
+
+        orchestrator.set_approval_callback(approval_callback)
+        with patch.object(orchestrator.claude, "stream_turn", side_effect=mock_stream):
+            await orchestrator.run_agent(agent, task["id"])
+
+        assert written_mid_stream
+        assert [r["action"] for r in requests] == ["write_file"]
+
+    @pytest.mark.asyncio
+    async def test_malformed_path_becomes_tool_error(self, orchestrator, test_config):
+        """Test a bad path input is reported by the tool, not raised from dispatch."""
+        agent_data = await orchestrator.spawn_agent(task="Read", supervised=False)
+        agent = orchestrator._agents[agent_data["id"]]
+        tool_uses = [ToolUse(id="tu1", name="read_file", input={"path": 123})]
+
+        access = orchestrator._tool_access(agent, tool_uses[0])
+        assert access.writes == frozenset({("*",)})
+
+        with patch.object(orchestrator.claude, "stream_turn", side_effect=self._turn(tool_uses)):
+            await orchestrator.run_agent(agent, "task123")
+
+        assert (await orchestrator.get_agent(agent.id))["status"] == "completed"
+        assert agent.messages[2]["content"][0]["tool_use_id"] == "tu1"
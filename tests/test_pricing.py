@@ -0,0 +1,15 @@
+"""Tests for model pricing."""
+
+from __future__ import annotations
+
+import pytest
+
+from gru.pricing import usage_cost
+
+
+def test_usage_cost():
+    """Test input, output, cache and batch pricing."""
+    assert usage_cost("claude-sonnet-4-20250514", 1_000_000, 500_000) == pytest.approx(10.5)
+    assert usage_cost("claude-3-5-haiku-20241022", 1_000_000, 0, cache_read_tokens=1_000_000) == pytest.approx(0.88)
+    assert usage_cost("claude-sonnet-4-20250514", 1_000_000, 500_000, batched=True) == pytest.approx(5.25)
+    assert usage_cost("unknown-model", 1_000_000, 0) == pytest.approx(3.0)
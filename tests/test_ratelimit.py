@@ -0,0 +1,131 @@
+"""Tests for the shared Claude rate governor."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+
+import pytest
+
+from gru.ratelimit import RateGovernor, TokenBucket, retry_after
+
+
+class TestTokenBucket:
+    """Tests for per-minute buckets."""
+
+    def test_unlimited(self):
+        """Test a bucket without a known limit never waits."""
+        bucket = TokenBucket(0)
+        bucket.take(10**9, 0.0)
+        assert bucket.delay(10**9, 0.0) == 0.0
+
+    def test_delay_until_refilled(self):
+        """Test the wait is the time needed to refill the shortfall."""
+        bucket = TokenBucket(600)  # 10 per second
+        now = time.monotonic()
+        bucket.take(600, now)
+
+        assert bucket.delay(5, now) == pytest.approx(0.5, abs=0.01)
+        assert bucket.delay(5, now + 1) == 0.0
+
+    def test_oversized_request_waits_for_full_bucket(self):
+        """Test a request larger than the limit can still run once the bucket is full."""
+        bucket = TokenBucket(100)
+        assert bucket.delay(1000, time.monotonic()) == 0.0
+
+    def test_learn(self):
+        """Test headers lower the limit and cap what is left."""
+        now = time.monotonic()
+        unknown = TokenBucket(0)
+        unknown.learn(50, 10, now)
+        configured = TokenBucket(100)
+        configured.learn(1000, None, now)
+
+        assert (unknown.capacity, unknown.level) == (50, 10)
+        assert configured.capacity == 100
+
+
+class TestRateGovernor:
+    """Tests for pacing requests."""
+
+    @pytest.mark.asyncio
+    async def test_no_limits_no_wait(self):
+        """Test requests go straight through without limits."""
+        governor = RateGovernor()
+        reservation = await asyncio.wait_for(governor.acquire(10**6, 10**6), timeout=1)
+        assert reservation.amounts["requests"] == 1
+
+    @pytest.mark.asyncio
+    async def test_waits_for_capacity(self):
+        """Test a request waits for its tokens instead of failing."""
+        governor = RateGovernor(input_tokens_per_minute=60000)  # 1000 per second
+        await governor.acquire(60000, 0)
+
+        start = time.monotonic()
+        await governor.acquire(100, 0)
+
+        assert time.monotonic() - start >= 0.09
+
+    @pytest.mark.asyncio
+    async def test_priority_order(self):
+        """Test waiting high-priority requests go before earlier low-priority ones."""
+        governor = RateGovernor(requests_per_minute=1200)  # one per 50ms
+        governor.buckets["requests"].level = 0
+        order = []
+
+        async def request(name: str, priority: str) -> None:
+            await governor.acquire(0, 0, priority)
+            order.append(name)
+
+        low = asyncio.create_task(request("low", "low"))
+        await asyncio.sleep(0)
+        high = asyncio.create_task(request("high", "high"))
+        await asyncio.gather(low, high)
+
+        assert order == ["high", "low"]
+
+    @pytest.mark.asyncio
+    async def test_settle_refunds_estimate(self):
+        """Test unused estimated tokens are returned after the request."""
+        governor = RateGovernor(input_tokens_per_minute=6000, output_tokens_per_minute=6000)
+        reservation = await governor.acquire(5000, 4000)
+
+        await governor.settle(reservation, {"input_tokens": 100, "cache_read_input_tokens": 3000, "output_tokens": 200})
+
+        assert governor.buckets["input_tokens"].level == pytest.approx(5900, abs=5)
+        assert governor.buckets["output_tokens"].level == pytest.approx(5800, abs=5)
+
+    @pytest.mark.asyncio
+    async def test_pause(self):
+        """Test a pause holds every request until it ends."""
+        governor = RateGovernor()
+        await governor.pause(0.1)
+
+        start = time.monotonic()
+        await governor.acquire(0, 0)
+
+        assert time.monotonic() - start >= 0.09
+
+    @pytest.mark.asyncio
+    async def test_observe_headers(self):
+        """Test limits are learned from rate-limit headers."""
+        governor = RateGovernor()
+        governor.observe(
+            {
+                "anthropic-ratelimit-requests-limit": "50",
+                "anthropic-ratelimit-requests-remaining": "0",
+                "anthropic-ratelimit-output-tokens-limit": "8000",
+            }
+        )
+
+        assert governor.buckets["requests"].capacity == 50
+        assert governor.buckets["requests"].delay(1, time.monotonic()) > 1
+        assert governor.buckets["output_tokens"].capacity == 8000
+        assert governor.buckets["input_tokens"].capacity == 0
+
+
+def test_retry_after():
+    """Test retry-after parsing."""
+    assert retry_after({"retry-after": "2.5"}) == 2.5
+    assert retry_after({"retry-after": "soon"}) is None
+    assert retry_after({}) is None
@@ -0,0 +1,171 @@
+"""Tests for retention and conversation archives."""
+
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from gru.db import Database
+from gru.retention import ConversationArchive, RetentionWorker
+
+OLD = "2020-01-01T00:00:00"
+
+
+@pytest.fixture
+async def db():
+    """Create a temporary database."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database = Database(Path(tmpdir) / "test.db")
+        await database.connect()
+        yield database
+        await database.close()
+
+
+async def _finished_agent(db: Database, agent_id: str, messages: int, completed_at: str = OLD) -> None:
+    await db.create_agent(agent_id=agent_id, task="Task", model="m")
+    for i in range(messages):
+        await db.add_message(agent_id, "assistant", f"message {i}", tool_use={"name": "bash"} if i == 0 else None)
+    await db.update_agent(agent_id, status="completed", completed_at=completed_at)
+
+
+class TestConversationArchive:
+    """Tests for archive files."""
+
+    def test_append_and_read(self):
+        """Test appended batches read back as one stream, skipping repeated rows."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            archive = ConversationArchive(Path(tmpdir) / "archive")
+            archive.append("a1", [{"id": 1}, {"id": 2}])
+            # A crash between archiving and deleting repeats rows on the next run
+            archive.append("a1", [{"id": 2}, {"id": 3}])
+
+            assert [row["id"] for row in archive.read("a1")] == [1, 2, 3]
+            assert archive.read("missing") == []
+
+            archive.delete("a1")
+            assert not archive.exists("a1")
+
+
+class TestRetentionWorker:
+    """Tests for retention passes."""
+
+    @pytest.mark.asyncio
+    async def test_archives_old_finished_agents(self, db: Database):
+        """Test only long-finished agents have their conversation moved out."""
+        await _finished_agent(db, "old", 3)
+        await _finished_agent(db, "recent", 2, completed_at="2999-01-01T00:00:00")
+        await db.create_agent(agent_id="running", task="Task", model="m")
+        await db.add_message("running", "user", "hi")
+
+        stats = await RetentionWorker(db, retention_days=30).run_once()
+
+        assert stats["archived_agents"] == 1
+        rows = await db.fetchall("SELECT agent_id, COUNT(*) AS count FROM conversations GROUP BY agent_id")
+        assert {row["agent_id"]: row["count"] for row in rows} == {"recent": 2, "running": 1}
+        assert db.archive.exists("old")
+
+    @pytest.mark.asyncio
+    async def test_archived_conversation_readable(self, db: Database):
+        """Test get_conversation serves archived messages with the same shape and paging."""
+        await _finished_agent(db, "old", 5)
+        before = await db.get_conversation("old")
+        await RetentionWorker(db, retention_days=30).run_once()
+        # A message added after archiving (e.g. the agent was nudged) follows the archived ones
+        await db.add_message("old", "user", "later")
+
+        full = await db.get_conversation("old")
+        tail = await db.get_conversation("old", limit=3)
+        page = await db.get_conversation("old", after_id=full[1]["id"], limit=2)
+        streamed = [row async for row in db.iter_conversation("old", batch_size=2)]
+
+        assert full[:5] == before
+        assert full[0]["tool_use"] == {"name": "bash"}
+        assert [m["content"] for m in tail] == ["message 3", "message 4", "later"]
+        assert [m["content"] for m in page] == ["message 2", "message 3"]
+        assert streamed == full
+        assert [row async for row in db.iter_conversation("old", after_id=full[3]["id"])] == full[4:]
+
+    @pytest.mark.asyncio
+    async def test_iter_conversation_reads_archive_once(self, db: Database):
+        """Test streaming an archived conversation decompresses the archive once, not per page."""
+        await _finished_agent(db, "old", 6)
+        await RetentionWorker(db, retention_days=30).run_once()
+        for i in range(3):
+            await db.add_message("old", "user", f"later {i}")
+
+        with patch.object(db.archive, "read", wraps=db.archive.read) as read:
+            streamed = [row["content"] async for row in db.iter_conversation("old", batch_size=2)]
+
+        assert streamed == [f"message {i}" for i in range(6)] + [f"later {i}" for i in range(3)]
+        assert read.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_prunes_coordination_rows(self, db: Database):
+        """Test read messages and resolved approvals past retention are deleted."""
+        await db.create_agent(agent_id="a1", task="Task", model="m")
+        await db.send_agent_message("m-old", "a1", "a1", None, "info", "old")
+        await db.send_agent_message("m-unread", "a1", "a1", None, "info", "unread")
+        await db.send_agent_message("m-new", "a1", "a1", None, "info", "new")
+        await db.mark_messages_read(["m-old", "m-new"])
+        await db.execute("UPDATE agent_messages SET created_at = '2020-01-01 00:00:00' WHERE id != 'm-new'")
+        await db.create_approval("ap-old", "a1", "bash", {"command": "ls"})
+        await db.create_approval("ap-pending", "a1", "bash", {"command": "ls"})
+        await db.resolve_approval("ap-old", "approved", "user")
+        await db.execute("UPDATE approvals SET created_at = '2020-01-01 00:00:00', resolved_at = '2020-01-01 00:00:00'")
+        await db.commit()
+
+        stats = await RetentionWorker(db, retention_days=30).run_once()
+
+        assert stats == {"archived_agents": 0, "agent_messages": 1, "approvals": 1}
+        messages = await db.fetchall("SELECT id FROM agent_messages ORDER BY id")
+        assert [row["id"] for row in messages] == ["m-new", "m-unread"]
+        assert (await db.get_approval("ap-pending"))["status"] == "pending"
+
+    @pytest.mark.asyncio
+    async def test_start_stop(self, db: Database):
+        """Test the background loop runs a pass and stops cleanly."""
+        await _finished_agent(db, "old", 1)
+        worker = RetentionWorker(db, retention_days=30, interval=60)
+
+        await worker.start()
+        for _ in range(100):
+            if db.archive.exists("old"):
+                break
+            await asyncio.sleep(0.01)
+        await worker.stop()
+
+        assert db.archive.exists("old")
+
+
+@pytest.mark.asyncio
+async def test_reclaim_space_enables_incremental_vacuum():
+    """Test an older database without auto-vacuum is converted and shrinks."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = Path(tmpdir) / "test.db"
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE filler (data BLOB)")
+        conn.executemany("INSERT INTO filler VALUES (randomblob(4000))", [()] * 500)
+        conn.commit()
+        conn.close()
+
+        database = Database(db_path)
+        await database.connect()
+        try:
+            await database.execute("DELETE FROM filler")
+            await database.commit()
+            pages_before = (await database.fetchone("PRAGMA page_count"))["page_count"]
+
+            await database.reclaim_space(10000)
+
+            mode = (await database.fetchone("PRAGMA auto_vacuum"))["auto_vacuum"]
+            pages_after = (await database.fetchone("PRAGMA page_count"))["page_count"]
+        finally:
+            await database.close()
+
+    assert mode == 2
+    assert pages_after < pages_before
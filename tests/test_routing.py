@@ -0,0 +1,60 @@
+"""Tests for per-turn model routing."""
+
+from __future__ import annotations
+
+import pytest
+
+from gru.claude import Response, ToolUse
+from gru.routing import ModelRouter, RouteDecision
+
+MODEL = "claude-sonnet-4-20250514"
+FAST = "claude-3-5-haiku-20241022"
+
+
+def _results(*errors: bool) -> list[dict]:
+    """A conversation ending in tool results, failed where errors is True."""
+    return [
+        {"role": "user", "content": "task"},
+        {"role": "assistant", "content": [{"type": "tool_use", "id": "t1", "name": "bash", "input": {}}]},
+        {
+            "role": "user",
+            "content": [
+                {"type": "tool_result", "tool_use_id": f"t{i}", "content": "out", "is_error": error}
+                for i, error in enumerate(errors)
+            ],
+        },
+    ]
+
+
+@pytest.mark.parametrize(
+    ("messages", "expected"),
+    [
+        ([{"role": "user", "content": "task"}], RouteDecision(MODEL, "new instructions")),
+        (_results(False, False), RouteDecision(FAST, "tool follow-up")),
+        (_results(False, True), RouteDecision(MODEL, "tool error")),
+        (
+            [*_results(False), {"role": "user", "content": "Also update the docs"}],
+            RouteDecision(MODEL, "new instructions"),
+        ),
+    ],
+)
+def test_route(messages, expected):
+    """Test only successful tool follow-ups go to the fast model."""
+    assert ModelRouter(FAST).route(MODEL, messages) == expected
+
+
+def test_route_without_fast_model():
+    """Test every turn keeps the agent's model when no fast model is set."""
+    assert ModelRouter().route(MODEL, _results(False)) == RouteDecision(MODEL, "default")
+    assert ModelRouter(MODEL).route(MODEL, _results(False)).reason == "default"
+
+
+def test_should_escalate():
+    """Test a routed turn that calls no tools is rerun on the agent's model."""
+    router = ModelRouter(FAST)
+    done = Response(content="Done", tool_uses=[], stop_reason="end_turn", usage={})
+    working = Response(content="", tool_uses=[ToolUse("t2", "bash", {})], stop_reason="tool_use", usage={})
+
+    assert router.should_escalate(RouteDecision(FAST, "tool follow-up"), MODEL, done)
+    assert not router.should_escalate(RouteDecision(FAST, "tool follow-up"), MODEL, working)
+    assert not router.should_escalate(RouteDecision(MODEL, "new instructions"), MODEL, done)
@@ -10,7 +10,7 @@ from unittest.mock import MagicMock
 import pytest
 
 from gru.db import Database
-from gru.scheduler import QueuedTask, Scheduler
+from gru.scheduler import QueuedTask, Scheduler, parse_db_timestamp
 
 
 @pytest.fixture
@@ -90,6 +90,35 @@ async def test_fifo_within_priority(scheduler):
     assert task3.task_id == "task3"
 
 
+@pytest.mark.asyncio
+async def test_enqueue_restored_task_keeps_position(scheduler):
+    """Test restored tasks keep their stored score and queue time."""
+    from datetime import datetime
+
+    await scheduler.enqueue("new_task", "agent1", "normal")
+    await scheduler.enqueue(
+        "old_task",
+        "agent2",
+        "normal",
+        priority_score=50,
+        queued_at=datetime(2024, 1, 1, 12, 0, 0),
+    )
+
+    task = await scheduler.dequeue()
+    assert task.task_id == "old_task"
+
+
+def test_parse_db_timestamp():
+    """Test SQLite UTC timestamps convert to naive local time."""
+    from datetime import datetime, timezone
+
+    parsed = parse_db_timestamp("2024-01-01 12:00:00")
+
+    assert parsed.tzinfo is None
+    expected = datetime(2024, 1, 1, 12, 0, 0, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    assert parsed == expected
+
+
 @pytest.mark.asyncio
 async def test_cancel(scheduler):
     """Test cancelling a queued task."""
@@ -113,33 +142,115 @@ async def test_cancel_nonexistent(scheduler):
 
 
 @pytest.mark.asyncio
-async def test_prevent_starvation(scheduler):
-    """Test starvation prevention boosts low priority tasks."""
-    await scheduler.enqueue("low_task", "agent1", "low")
+async def test_starved_task_promoted(scheduler):
+    """Test a task waiting past the threshold jumps ahead of higher priorities."""
+    from datetime import datetime, timedelta
 
-    # Simulate waiting
-    for _ in range(10):
-        await scheduler.prevent_starvation()
+    await scheduler.enqueue("high_task", "agent1", "high")
+    old = datetime.now() - timedelta(seconds=scheduler.starvation_age + 1)
+    await scheduler.enqueue("low_task", "agent2", "low", queued_at=old)
 
-    # Low task should have boosted priority now
-    task = scheduler._queue[0]
-    assert task.wait_cycles >= 10
-    # Priority score should be more negative (higher priority)
-    assert task.priority_score < -100
+    task = await scheduler.dequeue()
+    assert task.task_id == "low_task"
 
 
 @pytest.mark.asyncio
-async def test_starvation_max_boost(scheduler):
-    """Test starvation boost is capped."""
+async def test_starved_tasks_served_oldest_first(scheduler):
+    """Test starved tasks are dequeued in enqueue order regardless of priority."""
+    from datetime import datetime, timedelta
+
+    now = datetime.now()
+    await scheduler.enqueue("newer", "agent1", "high", queued_at=now - timedelta(seconds=5))
+    await scheduler.enqueue("older", "agent2", "low", queued_at=now - timedelta(seconds=10))
+
+    assert (await scheduler.dequeue()).task_id == "older"
+    assert (await scheduler.dequeue()).task_id == "newer"
+
+
+@pytest.mark.asyncio
+async def test_not_starved_before_threshold(scheduler):
+    """Test recent tasks keep strict priority ordering."""
     await scheduler.enqueue("low_task", "agent1", "low")
+    await scheduler.enqueue("high_task", "agent2", "high")
+
+    task = await scheduler.dequeue()
+    assert task.task_id == "high_task"
+
+
+@pytest.mark.asyncio
+async def test_peek(scheduler):
+    """Test peek returns the next task without removing it."""
+    await scheduler.enqueue("low_task", "agent1", "low")
+    await scheduler.enqueue("high_task", "agent2", "high")
+
+    peeked = await scheduler.peek()
+
+    assert peeked.task_id == "high_task"
+    assert scheduler.queue_length == 2
+    assert (await scheduler.dequeue()).task_id == "high_task"
+
+
+@pytest.mark.asyncio
+async def test_peek_skips_cancelled(scheduler):
+    """Test cancelled tasks are never returned."""
+    await scheduler.enqueue("high_task", "agent1", "high")
+    await scheduler.enqueue("normal_task", "agent2", "normal")
+    await scheduler.cancel("high_task")
+
+    assert (await scheduler.peek()).task_id == "normal_task"
+    assert (await scheduler.dequeue()).task_id == "normal_task"
+    assert await scheduler.dequeue() is None
+
+
+@pytest.mark.asyncio
+async def test_peek_accept(scheduler):
+    """Test peek with accept skips rejected tasks but keeps dispatch order."""
+    from datetime import datetime, timedelta
 
-    # Many cycles
-    for _ in range(100):
-        await scheduler.prevent_starvation()
+    old = datetime.now() - timedelta(seconds=scheduler.starvation_age + 1)
+    await scheduler.enqueue("starved_low", "agent1", "low", queued_at=old)
+    await scheduler.enqueue("normal_task", "agent2", "normal")
+    await scheduler.enqueue("high_task", "agent3", "high")
 
-    task = scheduler._queue[0]
-    # Should not exceed max boost
-    assert task.priority_score >= -(scheduler.MAX_BOOST + 100 + 10)
+    assert (await scheduler.peek()).task_id == "starved_low"
+    assert (await scheduler.peek(lambda t: t.task_id != "starved_low")).task_id == "high_task"
+    assert (await scheduler.peek(lambda t: t.task_id == "normal_task")).task_id == "normal_task"
+    assert await scheduler.peek(lambda t: False) is None
+    assert scheduler.queue_length == 3
+
+
+@pytest.mark.asyncio
+async def test_reprioritize(scheduler):
+    """Test raising a task's priority moves it ahead."""
+    await scheduler.enqueue("task1", "agent1", "normal")
+    await scheduler.enqueue("task2", "agent2", "low")
+
+    assert await scheduler.reprioritize("task2", "high")
+
+    assert scheduler.queue_length == 2
+    assert (await scheduler.dequeue()).task_id == "task2"
+    assert (await scheduler.dequeue()).task_id == "task1"
+    assert await scheduler.dequeue() is None
+
+
+@pytest.mark.asyncio
+async def test_reprioritize_nonexistent(scheduler):
+    """Test reprioritizing an unknown task fails."""
+    assert not await scheduler.reprioritize("nonexistent", "high")
+
+
+@pytest.mark.asyncio
+async def test_cancel_many_compacts_heaps(scheduler):
+    """Test tombstones are compacted so heaps don't grow without bound."""
+    for i in range(200):
+        await scheduler.enqueue(f"task{i}", f"agent{i}", "low")
+    for i in range(199):
+        await scheduler.cancel(f"task{i}")
+
+    assert scheduler.queue_length == 1
+    assert len(scheduler._queue) < 50
+    assert len(scheduler._by_age) < 50
+    assert (await scheduler.dequeue()).task_id == "task199"
 
 
 @pytest.mark.asyncio
@@ -179,6 +290,52 @@ async def test_can_run_more(scheduler):
     assert scheduler.can_run_more()
 
 
+@pytest.mark.asyncio
+async def test_batched_slots_separate(db):
+    """Test batched tasks use their own slots, not the interactive ones."""
+    scheduler = Scheduler(db, max_concurrent=1, max_batched=2)
+    scheduler.register_running("batched0", MagicMock(), batched=True)
+    scheduler.register_running("batched1", MagicMock(), batched=True)
+
+    assert scheduler.can_run_more()
+    assert not scheduler.can_run_more(batched=True)
+
+    scheduler.register_running("interactive", MagicMock())
+    scheduler.unregister_running("batched0")
+    assert not scheduler.can_run_more()
+    assert scheduler.can_run_more(batched=True)
+
+
+@pytest.mark.asyncio
+async def test_wait_for_work_woken_by_enqueue(scheduler):
+    """Test enqueue wakes a waiting dispatcher."""
+    waiter = asyncio.create_task(scheduler.wait_for_work())
+    await asyncio.sleep(0)
+    assert not waiter.done()
+
+    await scheduler.enqueue("task1", "agent1", "normal")
+
+    assert await asyncio.wait_for(waiter, timeout=1) is True
+
+
+@pytest.mark.asyncio
+async def test_wait_for_work_woken_by_freed_slot(scheduler):
+    """Test unregistering a running task wakes a waiting dispatcher."""
+    scheduler.register_running("task1", MagicMock())
+    waiter = asyncio.create_task(scheduler.wait_for_work())
+    await asyncio.sleep(0)
+
+    scheduler.unregister_running("task1")
+
+    assert await asyncio.wait_for(waiter, timeout=1) is True
+
+
+@pytest.mark.asyncio
+async def test_wait_for_work_timeout(scheduler):
+    """Test wait_for_work returns False when nothing happens."""
+    assert await scheduler.wait_for_work(timeout=0.01) is False
+
+
 @pytest.mark.asyncio
 async def test_get_status(scheduler):
     """Test getting scheduler status."""
@@ -0,0 +1,99 @@
+"""Tests for the async shell runner."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from gru.shell import OutputBuffer, run_shell
+
+
+def _is_running(pid: int) -> bool:
+    """Check whether a process exists and is not a zombie awaiting reaping."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split(")")[-1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+@pytest.fixture
+def workdir():
+    """Create a temporary working directory."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        yield tmpdir
+
+
+class TestOutputBuffer:
+    """Tests for the bounded output buffer."""
+
+    def test_keeps_everything_under_limit(self):
+        """Test output under the limit is returned unchanged."""
+        buffer = OutputBuffer(100)
+        buffer.write(b"hello ")
+        buffer.write(b"world")
+        assert buffer.getvalue() == "hello world"
+        assert buffer.dropped == 0
+
+    def test_keeps_most_recent_bytes(self):
+        """Test output over the limit keeps the tail and notes what was dropped."""
+        buffer = OutputBuffer(10)
+        for i in range(100):
+            buffer.write(f"{i:03d}\n".encode())
+        value = buffer.getvalue()
+        assert value.endswith("098\n099\n")
+        assert buffer.dropped == 390
+        assert "390 earlier bytes dropped" in value
+        assert len(buffer._data) == 10
+
+
+@pytest.mark.asyncio
+async def test_run_shell_captures_output(workdir):
+    """Test stdout, stderr and exit code are captured."""
+    result = await run_shell("echo out; echo err >&2; exit 3", workdir, timeout=5, max_output=1000)
+    assert result.stdout == "out\n"
+    assert result.stderr == "err\n"
+    assert result.returncode == 3
+    assert not result.timed_out
+
+
+@pytest.mark.asyncio
+async def test_run_shell_bounds_output(workdir):
+    """Test a chatty command only keeps max_output bytes."""
+    result = await run_shell("yes line | head -c 1000000", workdir, timeout=10, max_output=100)
+    assert "bytes dropped" in result.stdout
+    assert result.stdout.endswith("line\n")
+    assert len(result.stdout) < 200
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not os.path.exists("/proc"), reason="needs /proc to inspect processes")
+async def test_run_shell_timeout_kills_process_group(workdir):
+    """Test a timeout kills the shell and the processes it started."""
+    start = time.monotonic()
+    result = await run_shell("sleep 30 & echo $! > child.pid; wait", workdir, timeout=0.5, max_output=1000)
+    assert result.timed_out
+    assert time.monotonic() - start < 10
+
+    child = int(Path(workdir, "child.pid").read_text())
+    await asyncio.sleep(0.1)
+    assert not _is_running(child)
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not os.path.exists("/proc"), reason="needs /proc to inspect processes")
+async def test_run_shell_cancel_kills_process(workdir):
+    """Test cancelling the caller stops the command."""
+    task = asyncio.create_task(run_shell("echo $$ > shell.pid; sleep 30", workdir, timeout=60, max_output=1000))
+    await asyncio.sleep(0.3)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    shell = int(Path(workdir, "shell.pid").read_text())
+    assert not _is_running(shell)
@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import shutil
 import subprocess
 import tempfile
 from pathlib import Path
@@ -17,6 +18,7 @@ from gru.worktree import (
     is_git_repo,
     list_worktrees,
     remove_worktree,
+    restore_worktree,
 )
 
 
@@ -177,6 +179,34 @@ class TestCreateWorktree:
         delete_branch(git_repo, branch_name, force=True)
 
 
+class TestRestoreWorktree:
+    """Tests for restore_worktree function."""
+
+    def test_restores_deleted_worktree(self, git_repo):
+        """Test recreating a worktree whose directory was deleted."""
+        worktree_path = git_repo.parent / "test_worktree"
+        branch_name = "test-branch"
+        create_worktree(git_repo, worktree_path, branch_name)
+        (worktree_path / "work.txt").write_text("work")
+        subprocess.run(["git", "add", "."], cwd=worktree_path, capture_output=True, check=True)
+        subprocess.run(["git", "commit", "-m", "Work"], cwd=worktree_path, capture_output=True, check=True)
+        shutil.rmtree(worktree_path)
+
+        info = restore_worktree(git_repo, worktree_path, branch_name)
+
+        assert info.branch == branch_name
+        assert (worktree_path / "work.txt").read_text() == "work"
+
+        # Cleanup
+        remove_worktree(git_repo, worktree_path, force=True)
+        delete_branch(git_repo, branch_name, force=True)
+
+    def test_raises_on_missing_branch(self, git_repo):
+        """Test restoring from a branch that does not exist fails."""
+        with pytest.raises(RuntimeError):
+            restore_worktree(git_repo, git_repo.parent / "test_worktree", "no-such-branch")
+
+
 class TestRemoveWorktree:
     """Tests for remove_worktree function."""
 